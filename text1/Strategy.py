@@ -1,50 +1,44 @@
 import pandas as pd
+import strategies
 
 class Strategy:
-    def __init__(self, config):
+    def __init__(self, config, rule=None):
+        """
+        rule: 开单规则 (strategies.py 的策略对象或名字)，默认 MA31/MA128 排列，与回测用的是同一份定义
+        """
         self.cfg = config
+        self.rule = strategies.create(rule or getattr(config, 'STRATEGY', 'ma_stack'))
+        # 增量均线：每次只处理新K线，不再整段 rolling
+        self.feed = self.rule.new_feed()
 
     def analyze(self, df):
         """
-        输入: K线数据 (DataFrame)
+        输入: K线数据 (DataFrame，最后一行是正在形成的K线)
         输出: 信号 ('buy', 'sell', 或 None)
         """
-        # 长度检查：因为要计算 MA128，数据长度至少要大于 128
-        if df is None or len(df) < 130:
+        # 长度检查：数据长度至少要够算最长的那条均线
+        if df is None or len(df) < self.rule.warmup + 2:
             return None
 
         # 1. 数据准备
-        close = pd.to_numeric(df['close'])
-        
-        # === 关键修改：计算指定的均线 (MA31 和 MA128) ===
-        # 这里直接使用 31 和 128，确保符合你的策略描述
-        # 如果你想用 config 里的变量，可以改成 self.cfg.MA_FAST 等
-        ma31_series = close.rolling(31).mean()
-        ma128_series = close.rolling(128).mean()
-        
-        # === 获取数值 (强制转 float 防止报错) ===
-        # 这里的逻辑与你 AlertSystem 保持一致：
-        # 价格：看“上一根”收盘价 (iloc[-2]) -> 信号确定的价格
-        # 均线：看“当前”均线值 (iloc[-1]) -> 最新的趋势
-        prev_close = float(close.iloc[-2])
-        
-        ma31_curr = float(ma31_series.iloc[-1])
-        ma128_curr = float(ma128_series.iloc[-1])
+        # 与回测一致：只用已经收盘的K线 (去掉最后一根正在形成的)，
+        # 价格看“上一根”收盘价，均线也看“上一根”收盘时的值
+        closed = df.iloc[:-1]
+        time_col = 'time' if 'time' in df.columns else 'timestamp'
+        close = pd.to_numeric(closed['close'])
+
+        # 2. 生成信号 (规则定义在 strategies.py，回测引擎用的是同一个)
+        # 开空默认关闭 (Config.ENABLE_SHORT)
+        signal = self.rule.latest(self.feed, closed[time_col], close,
+                                  enable_long=getattr(self.cfg, 'ENABLE_LONG', True),
+                                  enable_short=getattr(self.cfg, 'ENABLE_SHORT', False))
 
         # 打印分析日志
-        print(f"📊 策略分析: 上根收盘:{prev_close:.2f} | MA31:{ma31_curr:.2f} | MA128:{ma128_curr:.2f}")
+        lines = ' | '.join(f"{name.upper()}:{float(self.feed[name].value):.2f}" for name in self.feed.indicators)
+        print(f"📊 策略分析: 上根收盘:{float(close.iloc[-1]):.2f} | {lines}")
 
-        # 2. 生成信号
-        # === 开多条件 ===
-        # 条件1: 上一根收盘价 > MA31
-        # 条件2: MA31 > MA128 (多头排列)
-        if (prev_close > ma31_curr) and (ma31_curr > ma128_curr):
+        if signal == strategies.LONG:
             return 'buy'
-        
-        # === 开空条件 ===
-        # 你这次没提开空条件，为了防止旧代码干扰，我先注释掉
-        # 如果需要，可以在这里加 elif 逻辑，比如:
-        # elif (prev_close < ma373_curr):
-        #     return 'sell'
-
+        if signal == strategies.SHORT:
+            return 'sell'
         return None # 无信号
\ No newline at end of file
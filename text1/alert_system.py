@@ -1,16 +1,21 @@
-import ccxt
-import pandas as pd
+import asyncio
+import ccxt.async_support as ccxt_async
 import time
-import requests
-import pyttsx3
 import datetime
+import strategies
+from data_download import WeightBudget
+from data_manager import DataManager
+from notifier import Notifier
 
 # =================================================================
 # 👇👇👇 【配置区域】 👇👇👇
 # =================================================================
 CONFIG = {
     # --- 交易对设置 ---
-    'SYMBOLS': ['BTC/USDT', 'ETH/USDT'],  # 同时监控BTC和ETH
+    'SYMBOLS': ['BTC/USDT', 'ETH/USDT'],  # 监控列表 (可以放几百个永续合约)
+    'MAX_IN_FLIGHT': 16,   # 同时在途的K线请求数
+    'WEIGHT_PER_MINUTE': 1200,  # 所有请求共用的每分钟权重上限 (币安合约上限 2400，留一半余量)
+    'PRINT_LIMIT': 10,     # 面板最多逐个打印多少个交易对 (多了只打印汇总)
     
     # --- ⚠️ 时间周期设置 ---
     'TIMEFRAME': '15m',    # 15分钟K线
@@ -18,6 +23,7 @@ CONFIG = {
     # --- 策略开关 ---
     'ENABLE_BTC': True,    # 是否启用BTC检测
     'ENABLE_ETH': True,    # 是否启用ETH检测
+    # (其他交易对只要在 SYMBOLS 里就会检测)
 
     # --- 网络与通知 ---
     'USE_PROXY': False,            # ⚠️ 国内请设为 True
@@ -27,27 +33,66 @@ CONFIG = {
     'ENABLE_BARK': True,        
     'BARK_URLS': ['https://api.day.app/MtNFHgi5zjRjdDQPoRJX9j/',
                    'https://api.day.app/HV36M6pFqEbJCAh8eWbbCT/'],
+    'BARK_RETRIES': 3,     # 推送失败重试次数 (间隔 1s, 2s, 4s...)
 }
 # =================================================================
 
+def watchlist():
+    """实际要监控的交易对 (BTC/ETH 受各自开关控制)"""
+    symbols = []
+    for s in CONFIG['SYMBOLS']:
+        if s == 'BTC/USDT' and not CONFIG['ENABLE_BTC']:
+            continue
+        if s == 'ETH/USDT' and not CONFIG['ENABLE_ETH']:
+            continue
+        symbols.append(s)
+    return symbols
+
+
+# 报警规则: MA128 与 MA373 金叉/死叉
+CROSS_RULE = strategies.MACross(128, 373)
+
+
+class SymbolState:
+    """单个交易对的检测状态"""
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.last_ts = None          # 已处理过的K线时间戳
+        self.price = 0               # 数据快照 (用于打印)
+        self.ma128 = 0
+        self.ma373 = 0
+        self.last_signal = None
+        # 增量均线 (只喂已收盘K线，每根新K线 O(1) 更新)
+        self.feed = CROSS_RULE.new_feed()
+
+
 class AutoAlertBot:
-    def __init__(self):
+    def __init__(self, exchange=None):
+        """
+        exchange: 不传则连接币安 (ccxt.async_support)；
+                  传入 sim_exchange.AsyncSimExchange 可以离线压测扫描循环
+        """
         print("🤖 正在初始化15分钟K线检测机器人 (永续合约版)...")
         
-        # --- 状态记录 (每个交易对独立记录) ---
-        self.last_ts = {
-            'BTC/USDT': None,
-            'ETH/USDT': None
-        }
+        # --- 状态记录 (每个交易对独立一份) ---
+        self.symbols = watchlist()
+        self.states = {s: SymbolState(s) for s in self.symbols}
         
-        # --- 数据快照 (用于打印) ---
-        self.data_snapshot = {
-            'BTC/USDT': {'price': 0, 'ma128': 0, 'ma373': 0, 'last_signal': None},
-            'ETH/USDT': {'price': 0, 'ma128': 0, 'ma373': 0, 'last_signal': None}
-        }
+        # --- 扫描耗时统计 ---
+        self.cycle_times = []
         
-        self.engine = None
-        if CONFIG['ENABLE_TTS']: self._init_voice()
+        # --- 通知分发 (后台线程发送，检测循环不等待网络/语音) ---
+        # 获取 URL 列表 (兼容性处理：如果用户还在用老配置 'BARK_URL'，也兼容一下)
+        urls = list(CONFIG.get('BARK_URLS', []))
+        if 'BARK_URL' in CONFIG:
+            urls.append(CONFIG['BARK_URL'])
+        self.notifier = Notifier(
+            urls,
+            enable_bark=CONFIG['ENABLE_BARK'],
+            enable_tts=CONFIG['ENABLE_TTS'],
+            proxies={'http': CONFIG['PROXY_URL'], 'https': CONFIG['PROXY_URL']} if CONFIG['USE_PROXY'] else None,
+            retries=CONFIG['BARK_RETRIES'],
+        )
 
         # 初始化交易所连接
         exchange_args = {
@@ -62,49 +107,26 @@ class AutoAlertBot:
         else:
             print("🔗 直连模式")
             
-        self.exchange = ccxt.binance(exchange_args)
-        symbols_str = ', '.join([s for s in CONFIG['SYMBOLS'] if (s == 'BTC/USDT' and CONFIG['ENABLE_BTC']) or (s == 'ETH/USDT' and CONFIG['ENABLE_ETH'])])
+        # 异步交易所 + 一个事件循环: 所有交易对在一个线程里并发请求，
+        # 共用一个信号量 (同时在途数) 和一个权重令牌桶 (每分钟权重)，不会几百个请求一起冲向币安
+        self.exchange = exchange or ccxt_async.binance(exchange_args)
+        self.loop = asyncio.new_event_loop()
+        self.budget = WeightBudget(CONFIG['WEIGHT_PER_MINUTE'])
+        # 数据层：每个交易对一个K线缓冲区，第一次之后只增量请求
+        self.data = DataManager(self.exchange)
+        symbols_str = ', '.join(self.symbols[:5]) + (f" 等 {len(self.symbols)} 个" if len(self.symbols) > 5 else '')
         print(f"✅ 连接成功 | 目标: {symbols_str} (永续合约) | 周期: {CONFIG['TIMEFRAME']}")
 
-    def _init_voice(self):
-        try:
-            self.engine = pyttsx3.init()
-            self.engine.setProperty('rate', 150)
-        except: pass
-
-
     def send_bark(self, title, content):
-        if not CONFIG['ENABLE_BARK']: return
-        
-        # 获取 URL 列表 (兼容性处理：防止你万一没改配置报错)
-        urls = CONFIG.get('BARK_URLS', [])
-        # 如果用户还在用老配置 'BARK_URL'，也兼容一下
-        if 'BARK_URL' in CONFIG:
-            urls.append(CONFIG['BARK_URL'])
+        """放进推送队列，立即返回 (真正发送在 notifier 后台线程)"""
+        self.notifier.bark(title, content)
 
-        for base_url in urls:
-            try:
-                # 拼接完整的请求地址
-                url = f"{base_url.rstrip('/')}/{title}/{content}"
-                
-                # 发送请求
-                requests.get(url, timeout=2) # 设置2秒超时，防止卡住
-                
-            except Exception as e:
-                # 如果某一个人发送失败（比如网络不好），打印错误但【不中断】程序
-                print(f"⚠️ Bark推送失败: {e}")
-
-    def fetch_data(self, symbol, timeframe):
-        """获取指定交易对的K线数据"""
-        try:
-            # 这里的 fetch_ohlcv 会自动使用 init 里设置的 future 选项
-            bars = self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=400)
-            df = pd.DataFrame(bars, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            return df
-        except Exception as e:
-            print(f"❌ 数据获取失败 [{symbol} {timeframe}]: {e}")
-            return None
+    async def fetch_data(self, symbol, timeframe, sem):
+        """获取指定交易对的K线数据 (列: time, open, high, low, close, vol)"""
+        # 这里的 fetch_ohlcv 会自动使用 init 里设置的 future 选项
+        # 失败时 DataManager 会打印错误并返回 None
+        async with sem:
+            return await self.data.fetch_kline_async(symbol, timeframe, limit=400, budget=self.budget)
 
     # =================================================================
     # 新策略: 15分钟K线检测 - MA128 与 MA373 交叉报警
@@ -121,40 +143,38 @@ class AutoAlertBot:
         if len(df) < 374:  # 需要足够的数据计算 MA373
             return
         
-        # 计算 MA128、MA373
-        close = pd.to_numeric(df['close'])
-        df['ma128'] = close.rolling(128).mean()
-        df['ma373'] = close.rolling(373).mean()
+        # 更新 MA128、MA373 (只同步已收盘的K线，没有新K线时几乎不花时间)
+        # 交叉规则定义在 strategies.MACross，回测 (STRATEGY = 'ma_cross') 用的是同一份
+        state = self.states[symbol]
+        closed = df.iloc[:-1]
+        feed = state.feed
+        signal = CROSS_RULE.latest(feed, closed['time'], closed['close'])
         
-        # 获取K线：当前根、已收盘第一根、上一根
+        # 获取K线：当前根、已收盘第一根
         # 交叉发生在「已经收盘的第一根」与「上一根」之间（即刚收盘这根形成过程中）
         curr = df.iloc[-1]
         first_closed = df.iloc[-2]   # 已经收盘的第一根K线（刚收盘这根）
-        prev_closed = df.iloc[-3]    # 上一根K线
         
         # 更新数据快照
-        self.data_snapshot[symbol] = {
-            'price': curr['close'],
-            'ma128': first_closed['ma128'],
-            'ma373': first_closed['ma373'],
-            'last_signal': self.data_snapshot[symbol].get('last_signal', None)
-        }
+        state.price = curr['close']
+        state.ma128 = feed['ma128'].value
+        state.ma373 = feed['ma373'].value
         
         # 检查是否已经处理过这根K线（用刚收盘这根的时间戳）
-        ts = first_closed['timestamp']
-        if self.last_ts[symbol] == ts:
+        ts = first_closed['time']
+        if state.last_ts == ts:
             return
         
         # 上一根 vs 刚收盘这根，判断交叉
-        ma128_prev = float(prev_closed['ma128'])
-        ma373_prev = float(prev_closed['ma373'])
-        ma128_curr = float(first_closed['ma128'])
-        ma373_curr = float(first_closed['ma373'])
+        ma128_prev = float(feed['ma128'].prev_value)
+        ma373_prev = float(feed['ma373'].prev_value)
+        ma128_curr = float(feed['ma128'].value)
+        ma373_curr = float(feed['ma373'].value)
         
         # 金叉：MA128 上穿 MA373
-        golden_cross = (ma128_prev < ma373_prev) and (ma128_curr > ma373_curr)
+        golden_cross = signal == strategies.LONG
         # 死叉：MA128 下穿 MA373
-        death_cross = (ma128_prev > ma373_prev) and (ma128_curr < ma373_curr)
+        death_cross = signal == strategies.SHORT
         
         signal_msg = None
         if golden_cross:
@@ -167,9 +187,12 @@ class AutoAlertBot:
             if symbol == 'BTC/USDT':
                 title = "祝老板发财"
                 content = f"'大饼' {signal_msg}"
-            else:
+            elif symbol == 'ETH/USDT':
                 title = "祝老板发财"
                 content = f"'小饼' {signal_msg}"
+            else:
+                title = "祝老板发财"
+                content = f"'{symbol.split('/')[0]}' {signal_msg}"
             
             cross_type = "金叉" if golden_cross else "死叉"
             print(f"\n⚡⚡ [{symbol}] {signal_msg} ⚡⚡")
@@ -177,62 +200,90 @@ class AutoAlertBot:
             print(f"   上一根 MA128: {ma128_prev:.2f} MA373: {ma373_prev:.2f}")
             
             self.send_bark(title, content)
+            self.notifier.speak(f"{symbol.replace('/USDT', '')} {signal_msg}")
             
-            if CONFIG['ENABLE_TTS'] and self.engine:
-                try:
-                    tts_text = f"{symbol.replace('/USDT', '')} {signal_msg}"
-                    self.engine.say(tts_text)
-                    self.engine.runAndWait()
-                except:
-                    pass
-            
-            self.last_ts[symbol] = ts
-            self.data_snapshot[symbol]['last_signal'] = signal_msg
+            state.last_ts = ts
+            state.last_signal = signal_msg
+
+    # =================================================================
+    # 并发扫描
+    # =================================================================
+    async def _scan(self):
+        """并发拉取所有交易对的数据，再按监控列表顺序逐个检测 (都在事件循环这一个线程里，状态不用加锁)"""
+        sem = asyncio.Semaphore(CONFIG['MAX_IN_FLIGHT'])
+        frames = await asyncio.gather(*(self.fetch_data(s, CONFIG['TIMEFRAME'], sem) for s in self.symbols))
+        failed = 0
+        for symbol, df in zip(self.symbols, frames):
+            if df is None:
+                failed += 1
+                continue
+            self.check_15m_strategy(symbol, df)
+        return failed
+
+    def scan_once(self):
+        """
+        并发拉取所有交易对的数据，然后逐个检测
+        返回 (本轮耗时秒数, 失败的交易对数量)
+        """
+        t0 = time.perf_counter()
+        failed = self.loop.run_until_complete(self._scan())
+        cycle = time.perf_counter() - t0
+        self.cycle_times = (self.cycle_times + [cycle])[-100:]
+        return cycle, failed
+
+    def close(self):
+        """关闭交易所连接和通知线程"""
+        self.notifier.close(timeout=5)
+        closing = self.exchange.close()
+        if asyncio.iscoroutine(closing):
+            self.loop.run_until_complete(closing)
+        self.loop.close()
+
+    def print_panel(self, cycle, failed):
+        t_str = datetime.datetime.now().strftime("%H:%M:%S")
+        avg = sum(self.cycle_times) / len(self.cycle_times)
+
+        print("\n" + "-"*60)
+        print(f"⏰ 时间: {t_str} | 交易所: Binance Future (U本位) | 周期: {CONFIG['TIMEFRAME']}")
+        print(f"⏱️ 扫描 {len(self.symbols)} 个交易对用时 {cycle:.2f} 秒 (近{len(self.cycle_times)}轮平均 {avg:.2f} 秒) | 失败: {failed}")
+        n = self.notifier.stats()
+        if n['sent'] or n['failed'] or n['bark_queue'] or n['in_flight'] or n['tts_queue']:
+            print(f"📨 通知: 已送达 {n['sent']} | 失败 {n['failed']} | 重试 {n['retried']} | "
+                  f"排队 Bark {n['bark_queue']} (发送中 {n['in_flight']}) / 语音 {n['tts_queue']} | "
+                  f"送达延迟 平均 {n['avg_latency']:.2f}s 最大 {n['max_latency']:.2f}s")
+
+        for symbol in self.symbols[:CONFIG['PRINT_LIMIT']]:
+            d = self.states[symbol]
+            print(f"【{symbol}】 现价: {d.price:.2f} | MA128: {d.ma128:.2f} | MA373: {d.ma373:.2f}")
+            if d.last_signal:
+                print(f"    └─ 上次信号: {d.last_signal}")
+
+        # 列表太长时其余只打印有信号的
+        for symbol in self.symbols[CONFIG['PRINT_LIMIT']:]:
+            d = self.states[symbol]
+            if d.last_signal:
+                print(f"【{symbol}】 上次信号: {d.last_signal}")
+
+        print("-" * 60)
 
     # =================================================================
     # 主循环
     # =================================================================
     def run(self):
-        print(f"🚀 监控启动 | 周期: {CONFIG['TIMEFRAME']} | 策略: MA128 与 MA373 交叉报警")
+        print(f"🚀 监控启动 | 周期: {CONFIG['TIMEFRAME']} | 策略: MA128 与 MA373 交叉报警 | 交易对: {len(self.symbols)} 个")
         print("=" * 60)
         
         while True:
             try:
-                # 检测BTC
-                if CONFIG['ENABLE_BTC']:
-                    df_btc = self.fetch_data('BTC/USDT', CONFIG['TIMEFRAME'])
-                    if df_btc is not None:
-                        self.check_15m_strategy('BTC/USDT', df_btc)
-                
-                # 检测ETH
-                if CONFIG['ENABLE_ETH']:
-                    df_eth = self.fetch_data('ETH/USDT', CONFIG['TIMEFRAME'])
-                    if df_eth is not None:
-                        self.check_15m_strategy('ETH/USDT', df_eth)
+                cycle, failed = self.scan_once()
                 
                 # 打印面板
-                t_str = datetime.datetime.now().strftime("%H:%M:%S")
-                
-                print("\n" + "-"*60)
-                print(f"⏰ 时间: {t_str} | 交易所: Binance Future (U本位) | 周期: {CONFIG['TIMEFRAME']}")
-                
-                if CONFIG['ENABLE_BTC']:
-                    d_btc = self.data_snapshot['BTC/USDT']
-                    print(f"【BTC/USDT】 现价: {d_btc['price']:.2f} | MA128: {d_btc['ma128']:.2f} | MA373: {d_btc['ma373']:.2f}")
-                    if d_btc['last_signal']:
-                        print(f"    └─ 上次信号: {d_btc['last_signal']}")
-                
-                if CONFIG['ENABLE_ETH']:
-                    d_eth = self.data_snapshot['ETH/USDT']
-                    print(f"【ETH/USDT】 现价: {d_eth['price']:.2f} | MA128: {d_eth['ma128']:.2f} | MA373: {d_eth['ma373']:.2f}")
-                    if d_eth['last_signal']:
-                        print(f"    └─ 上次信号: {d_eth['last_signal']}")
-                
-                print("-" * 60)
+                self.print_panel(cycle, failed)
                 time.sleep(10)  # 15分钟周期，每10秒检查一次即可
 
             except KeyboardInterrupt:
                 print("\n🛑 程序已停止")
+                self.close()
                 break
             except Exception as e:
                 print(f"\n❌ 主循环报错: {e}")
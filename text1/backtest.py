@@ -4,6 +4,14 @@ import matplotlib.pyplot as plt
 import os   
 import time 
 from datetime import datetime
+from kline_store import KlineStore, is_store, load_csv_cached
+from intrabar import SubBars
+from profiler import PhaseProfiler
+import downsample
+import metrics
+from metrics import TradeLog
+import indicators
+import strategies
 
 # =========================================
 # === 策略全局配置 ===
@@ -49,18 +57,111 @@ ENABLE_CONSECUTIVE_FILTER = False  # 总开关：True开启，False关闭
 MAX_CONS_LONG  = 5   # 连续做多最大次数 (比如允许连续追4次多)
 MAX_CONS_SHORT = 5   # 连续做空最大次数 (比如只允许连续追2次空)
 
+#===回测引擎===
+# 'loop'  = 原版逐根 df.iloc 引擎 (慢，作为对照基准)
+# 'array' = NumPy 数组引擎 (快，结果与 loop 完全一致)
+ENGINE = 'array'
 
+#===开单规则===
+# strategies.py 里的策略名 ('ma_stack' = 收盘价/MA31/MA128 排列，'ma_cross' = MA128/MA373 金叉死叉)
+# 也可以给 run_backtest 传 strategy=策略对象 (自定义周期或新策略)
+STRATEGY = 'ma_stack'
 
-def load_from_csv(file_path):
+#===高精度模式===
+# 1分钟K线数据 (CSV 或 .store 目录)。设置后，同一根K线里止损和止盈都碰到时，
+# 查这根K线对应的 1m K线判断哪个先发生 (默认一律按先止损算，结果偏保守)
+# None = 关闭
+INTRABAR_PATH = None
+
+#===数据缓存===
+# True = 第一次读取时把CSV转成二进制列式缓存 (xxx.csv.cache)，之后按时间范围直接映射读取
+# CSV 文件大小或修改时间变化后会自动重建缓存
+USE_CACHE = True
+
+#===性能分析===
+# True = 统计回测每个阶段 (挂单撮合/持仓管理/信号生成/统计资金) 的耗时，回测结束后打印表格
+# PROFILE_FOLDED 填文件路径时，同时导出火焰图用的折叠栈数据 (例 'backtest.folded')
+PROFILE = False
+PROFILE_FOLDED = None
+
+#===回测报告===
+# 资金曲线降采样: 每个缩放级别最多画这么多点 (形状不变，回撤尖峰保留)，0 = 不降采样全部画出
+REPORT_MAX_POINTS = 4000
+# 放大后最精细一级最多嵌入的点数 (数据不超过这个数时，放大到底就是原始数据)
+REPORT_DETAIL_POINTS = 100000
+# plotly.js 的引用方式: 'directory' = 报告目录里只放一份 plotly.min.js；'cdn' = 联网加载；True = 每个文件内嵌 (约 4MB)
+REPORT_PLOTLYJS = 'directory'
+
+# 策略参数名单：run_backtest 只从参数字典读取这些值，不再直接读全局变量
+# (全局变量只作为默认值，参数扫描/优化时各进程传入自己的参数字典)
+PARAM_NAMES = [
+    'INITIAL_BALANCE', 'INITIAL_RESERVE', 'MAX_ORDERS',
+    'ENABLE_LONG', 'ENABLE_SHORT',
+    'LEVERAGE', 'TP_PERCENT_LONG', 'SL_PERCENT_LONG', 'TP_PERCENT_SHORT', 'SL_PERCENT_SHORT', 'FEE_RATE',
+    'MIX_UP', 'FIXED_MARGIN_RATE', 'MAX_OPEN', 'MAX_OPEN_LIMIT',
+    'SIDE_DISTANCE_SWITCH', 'SAME_SIDE_DISTANCE_LONG', 'SAME_SIDE_DISTANCE_SHORT',
+    'ENABLE_CONSECUTIVE_FILTER', 'MAX_CONS_LONG', 'MAX_CONS_SHORT',
+]
+
+def get_params(**overrides):
+    """
+    生成一份回测参数字典：默认取上面的全局配置，可用关键字覆盖
+    例: get_params(TP_PERCENT_LONG=0.007, LEVERAGE=20)
+    """
+    params = {name: globals()[name] for name in PARAM_NAMES}
+    for name, value in overrides.items():
+        if name not in params:
+            raise KeyError(f"未知的回测参数: {name}")
+        params[name] = value
+    return params
+
+def _quiet(*args, **kwargs):
+    pass
+
+def _bar_ms(df):
+    """K线周期 (毫秒)，取相邻两根的最小间隔"""
+    t = df['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    return int(np.diff(t).min()) if len(t) > 1 else 0
+
+def _log_intrabar(log, sub_bars, lookups, misses):
+    if sub_bars is not None:
+        log(f"🔍 高精度模式: {sub_bars.lookups - lookups} 根K线同时碰到止损和止盈，已按 1m 判定先后"
+            f" (缺少 1m 数据按先止损处理: {sub_bars.misses - misses} 根)")
+
+
+
+def load_from_csv(file_path, start_time=None, end_time=None):
     """
     【新版】从本地CSV读取数据
+    start_time / end_time 不传则使用全局 START_TIME / END_TIME
     """
+    start_time = start_time or START_TIME
+    end_time = end_time or END_TIME
     print(f"📂 正在读取本地文件: {file_path}")
     
     if not os.path.exists(file_path):
         print(f"❌ 错误: 找不到文件 {file_path}")
         return pd.DataFrame()
 
+    # 优先走二进制缓存 (按时间二分查找，只读需要的那一段)
+    # 也可以直接传入 data_download.py 生成的 .store 目录
+    if USE_CACHE or is_store(file_path):
+        try:
+            if is_store(file_path):
+                df = KlineStore(file_path).load(start_time, end_time)
+            else:
+                df = load_csv_cached(file_path, start_time, end_time)
+        except Exception as e:
+            print(f"⚠️ 缓存读取失败，改为直接读取CSV: {e}")
+            df = None
+        if df is not None:
+            print(f"⏰ 筛选时间: {start_time} ---> {end_time}")
+            if df.empty:
+                print("❌ 警告: 该时间段内没有数据！请检查CSV文件覆盖的日期。")
+                return pd.DataFrame()
+            print(f"✅ 数据加载成功 (缓存)，共 {len(df)} 根K线")
+            return df
+
     # 读取 CSV
     try:
         df = pd.read_csv(file_path)
@@ -85,9 +186,9 @@ def load_from_csv(file_path):
         df['timestamp'] = pd.to_datetime(df.iloc[:, 0]) # 假设第一列是时间
 
     # 3. 按配置的时间范围过滤数据
-    print(f"⏰ 筛选时间: {START_TIME} ---> {END_TIME}")
-    mask = (df['timestamp'] >= pd.to_datetime(START_TIME)) & \
-           (df['timestamp'] <= pd.to_datetime(END_TIME))
+    print(f"⏰ 筛选时间: {start_time} ---> {end_time}")
+    mask = (df['timestamp'] >= pd.to_datetime(start_time)) & \
+           (df['timestamp'] <= pd.to_datetime(end_time))
     
     df = df.loc[mask].copy()
     
@@ -103,52 +204,93 @@ def load_from_csv(file_path):
     return df
 
 def calculate_rsi(df, period=14):
-    """辅助函数：计算RSI指标"""
-    delta = df['close'].diff()
-    gain = (delta.where(delta > 0, 0)).fillna(0)
-    loss = (-delta.where(delta < 0, 0)).fillna(0)
-
-    # 使用 Wilder's Smoothing (标准的RSI算法)
-    avg_gain = gain.ewm(com=period-1, min_periods=period).mean()
-    avg_loss = loss.ewm(com=period-1, min_periods=period).mean()
+    """辅助函数：计算RSI指标 (Wilder's Smoothing，算法见 indicators.rsi)"""
+    return pd.Series(indicators.rsi(df['close'], period), index=df.index)
 
-    rs = avg_gain / avg_loss
-    return 100 - (100 / (1 + rs))
-
-def run_backtest(df):
+def run_backtest(df, params=None, engine=None, verbose=True, sub_bars=None, profiler=None, strategy=None):
     """
     修正后的回测引擎：
     1. 解决了无限刷单Bug (T+1机制)
     2. 解决了手续费漏扣问题 (双向万2)
     3. 解决了挂单永不过期的问题
+
+    params:  参数字典 (见 get_params)，只需给出要覆盖的项，不传则全部用全局配置
+    engine:  'loop' 或 'array'，不传则使用全局 ENGINE
+    verbose: False 时不打印进度 (参数扫描时使用)
+    sub_bars: 高精度模式用的 1m 数据 (SubBars 对象或路径)，不传则使用全局 INTRABAR_PATH
+    profiler: PhaseProfiler 对象，统计各阶段耗时 (结果留在对象里由调用方读取)；
+              不传且全局 PROFILE = True 时自动创建并在结束时打印
+    strategy: 开单规则 (strategies.py 的策略对象或名字)，不传则使用全局 STRATEGY
+
+    返回 (closed_trades, equity_curve, 剩余备用金)
+    closed_trades 是结构化数组 (字段见 metrics.TRADE_FIELDS)，equity_curve 是 float64 数组 (从第 375 根K线开始)
     """
+    log = print if verbose else _quiet
     
     # 判空
     if df.empty:
-        print("❌ 数据为空，无法回测")
-        return [], [], 0
-    
-    if df.empty:
-        print("❌ 数据为空，无法回测")
-        return [], [], 0
+        log("❌ 数据为空，无法回测")
+        return np.empty(0, dtype=metrics.TRADE_DTYPE), np.empty(0), 0
+
+    params = get_params(**(params or {}))
 
     # =========================================
     # 🚨【补全步骤】必须先计算指标，否则后面会报错 KeyError
     # =========================================
-    # 确保按照 Close 列计算均线
-    df['ma31'] = df['close'].rolling(31).mean()
-    df['ma128'] = df['close'].rolling(128).mean()
-    df['ma373'] = df['close'].rolling(373).mean()
+    # 确保按照 Close 列计算均线 (已算过的列直接复用，参数扫描时同一份数据会跑很多次)
+    indicators.add_ma_columns(df, (31, 128, 373))
+
+    log("✅ 指标计算完成 (MA31, MA128, MA373)")
+
+    # === 高精度模式 ===
+    sub_bars = sub_bars if sub_bars is not None else INTRABAR_PATH
+    if isinstance(sub_bars, str):
+        sub_bars = SubBars(sub_bars)
+    bar_ms = _bar_ms(df) if sub_bars is not None else 0
+
+    # === 选择引擎 ===
+    engine = engine or ENGINE
+    if engine not in ('loop', 'array'):
+        raise ValueError(f"未知的回测引擎: {engine} (可选 'loop' / 'array')")
+
+    # === 性能分析 ===
+    prof = profiler if profiler is not None else (PhaseProfiler() if PROFILE else None)
+    if prof is not None:
+        prof.begin(engine)
+    # === 开单规则 (整段向量化算好，引擎逐根读取) ===
+    strategy = strategies.create(strategy or STRATEGY)
+
+    run = _run_backtest_array if engine == 'array' else _run_backtest_loop
+    result = run(df, params, log, sub_bars, bar_ms, prof, strategy)
+    if prof is None:
+        return result
 
-    print("✅ 指标计算完成 (MA31, MA128, MA373)")
+    prof.end()
+    if profiler is None:
+        prof.print_summary(log)
+        if PROFILE_FOLDED:
+            log(f"🔥 火焰图数据已导出: {prof.dump_folded(PROFILE_FOLDED)}")
+    return result
+
+def _run_backtest_loop(df, params, log=print, sub_bars=None, bar_ms=0, prof=None, strategy=None):
+    """原版逐根 df.iloc 引擎 (慢，作为对照基准)"""
+    # 参数解包成局部变量 (热循环里局部变量比查字典/全局变量更快)
+    (INITIAL_BALANCE, INITIAL_RESERVE, MAX_ORDERS, ENABLE_LONG, ENABLE_SHORT,
+     LEVERAGE, TP_PERCENT_LONG, SL_PERCENT_LONG, TP_PERCENT_SHORT, SL_PERCENT_SHORT, FEE_RATE,
+     MIX_UP, FIXED_MARGIN_RATE, MAX_OPEN, MAX_OPEN_LIMIT,
+     SIDE_DISTANCE_SWITCH, SAME_SIDE_DISTANCE_LONG, SAME_SIDE_DISTANCE_SHORT,
+     ENABLE_CONSECUTIVE_FILTER, MAX_CONS_LONG, MAX_CONS_SHORT) = [params[name] for name in PARAM_NAMES]
 
     # === 1. 账户初始化 ===
     balance = INITIAL_BALANCE
     reserve_fund = INITIAL_RESERVE
     
+    # 预留计算MA的长度
+    start_index = 375 
+
     active_orders = []   # 持仓单
-    closed_trades = []   # 已平仓记录
-    equity_curve = []    # 资金曲线
+    closed_trades = TradeLog()   # 已平仓记录 (结构化数组)
+    equity_curve = np.empty(max(len(df) - start_index, 0))    # 资金曲线
     
     # 挂单变量 (Pending Order)
     pending_order = None 
@@ -156,15 +298,18 @@ def run_backtest(df):
     # 状态记忆
     last_trade_type = None
     consecutive_counts = 0
+
+    # 策略的原始信号 (基于上一根K线，1 = 多 / -1 = 空) 和偏离值参照线
+    raw_signal = strategy.signals(df, ENABLE_LONG, ENABLE_SHORT)
+    ref_line = strategy.reference_line(df)
     
-    # 预留计算MA的长度
-    start_index = 375 
-    
-    print(f"🔄 开始回测 | 费率: {FEE_RATE*10000:.0f}‱ (万{FEE_RATE*10000:.0f}) | 杠杆: {LEVERAGE}x")
-    print(f"⏳ 正在逐根K线模拟 ({len(df) - start_index} 根)...")
+    log(f"🔄 开始回测 | 费率: {FEE_RATE*10000:.0f}‱ (万{FEE_RATE*10000:.0f}) | 杠杆: {LEVERAGE}x")
+    log(f"⏳ 正在逐根K线模拟 ({len(df) - start_index} 根)...")
+    lookups, misses = (sub_bars.lookups, sub_bars.misses) if sub_bars is not None else (0, 0)
 
     # === 2. 主循环 ===
     for i in range(start_index, len(df)):
+        if prof is not None: prof.mark()
         
         # --- 获取数据 ---
         # 当前K线 (用于撮合交易)
@@ -178,9 +323,8 @@ def run_backtest(df):
         # 上一根K线 (用于生成信号 - 杜绝未来函数)
         prev_row = df.iloc[i-1]
         last_close = float(prev_row['close'])
-        last_ma31  = float(prev_row['ma31'])
-        last_ma128 = float(prev_row['ma128'])
-        last_ma373 = float(prev_row['ma373'])
+        last_ref   = float(ref_line[i-1])   # 偏离值参照线 (默认策略是 MA31)
+        if prof is not None: prof.lap('data')
 
         # 临时变量：记录本根K线刚刚成交的单子
         # (刚成交的单子不参与当根K线的平仓检查，防止日内高频刷单)
@@ -189,6 +333,7 @@ def run_backtest(df):
         # ============================================================
         # 🟢【阶段一：挂单撮合 (Entry Logic)】
         # ============================================================
+        n_pending = 1 if pending_order is not None else 0   # 本根K线扫描的挂单数
         if pending_order is not None:
             is_filled = False
             fill_price = 0
@@ -239,19 +384,32 @@ def run_backtest(df):
             
             # 无论是否成交，挂单在当前K线结束时都清空 (Expire)
             pending_order = None
+        if prof is not None: prof.lap('entry', n_pending)
 
         # ============================================================
         # 🔵【阶段二：持仓管理 (Exit Logic)】
         # ============================================================
         orders_to_keep = []
+        n_scanned = len(active_orders)
         
         for order in active_orders:
             is_closed = False
             exit_price = 0
             close_reason = ""
             
+            # --- 同一根K线止损止盈都碰到：高精度模式下用 1m 判断先后 ---
+            resolved = None
+            if sub_bars is not None and current_low <= min(order['sl_price'], order['tp_price']) \
+                    and current_high >= max(order['sl_price'], order['tp_price']):
+                t_ms = current_time.value // 10**6
+                resolved = sub_bars.resolve_exit(1 if order['type'] == 'long' else -1,
+                                                 order['sl_price'], order['tp_price'], t_ms, t_ms + bar_ms)
+            if resolved is not None:
+                is_closed = True
+                close_reason, exit_price = resolved
+
             # --- 多单止盈止损 ---
-            if order['type'] == 'long':
+            elif order['type'] == 'long':
                 # 1. 止损 (SL)
                 if current_low <= order['sl_price']:
                     is_closed = True
@@ -306,15 +464,16 @@ def run_backtest(df):
                     else:
                         balance = 0 # 破产
                 
-                # 记录
-                closed_trades.append({
-                    'time': current_time,
-                    'type': order['type'],
-                    'profit': net_pnl, # 这是扣除平仓费后的净利
-                    'entry_fee': order['entry_fee'], # 记录一下当时的开仓费
-                    'exit_fee': exit_fee,
-                    'reason': close_reason
-                })
+                # 记录 (字段见 metrics.TRADE_FIELDS)
+                closed_trades.append((
+                    current_time.to_datetime64(),
+                    order['type'],
+                    net_pnl, # 这是扣除平仓费后的净利
+                    order['entry_fee'], # 记录一下当时的开仓费
+                    exit_fee,
+                    order['margin'], # 占用保证金 (风险分析按它换算单笔收益率)
+                    close_reason
+                ))
             else:
                 orders_to_keep.append(order)
         
@@ -324,6 +483,7 @@ def run_backtest(df):
         # 将本轮刚成交的单子加入，准备下一轮监控 (T+1)
         if newly_filled_order:
             active_orders.append(newly_filled_order)
+        if prof is not None: prof.lap('exit', n_scanned)
 
         # ============================================================
         # 🟡【阶段三：信号生成 (Signal Logic)】
@@ -332,20 +492,20 @@ def run_backtest(df):
         if pending_order is None and len(active_orders) < MAX_ORDERS:
             signal = None
             
-            # 1. 均线排列判断
-            if ENABLE_LONG and (last_close > last_ma31 > last_ma128):
+            # 1. 策略信号 (strategies.py，已按 ENABLE_LONG / ENABLE_SHORT 过滤)
+            if raw_signal[i] == strategies.LONG:
                 signal = 'long'
-            elif ENABLE_SHORT and (last_close < last_ma31 and last_ma31 < last_ma128):
+            elif raw_signal[i] == strategies.SHORT:
                 signal = 'short'
             
             # 2. 偏离值过滤
             if SIDE_DISTANCE_SWITCH and signal:
                 if last_trade_type == signal: # 只有同向才检查
                     if signal == 'long':
-                        thresh = last_ma31 * (1 + SAME_SIDE_DISTANCE_LONG)
+                        thresh = last_ref * (1 + SAME_SIDE_DISTANCE_LONG)
                         if last_close <= thresh: signal = None
                     elif signal == 'short':
-                        thresh = last_ma31 * (1 - SAME_SIDE_DISTANCE_SHORT)
+                        thresh = last_ref * (1 - SAME_SIDE_DISTANCE_SHORT)
                         if last_close >= thresh: signal = None
 
             # 3. 连续开单过滤
@@ -394,6 +554,7 @@ def run_backtest(df):
                         'tp_price': tp,
                         'sl_price': sl
                     }
+        if prof is not None: prof.lap('signal')
 
         # ============================================================
         # 🟣【阶段四：统计资金 (Equity Calculation)】
@@ -412,10 +573,435 @@ def run_backtest(df):
             else:
                 equity += (order['entry_price'] - current_close) * order['amount']
         
-        equity_curve.append(equity)
+        equity_curve[i - start_index] = equity
+        if prof is not None: prof.lap('equity', len(active_orders))
+
+    _log_intrabar(log, sub_bars, lookups, misses)
+    # 数据不足 start_index 根时资金曲线是空的，一根都没有回测
+    final_equity = equity_curve[-1] if len(equity_curve) else balance
+    log(f"✅ 回测完成! 总交易数: {len(closed_trades)} | 最终权益: {final_equity:.2f}")
+    return closed_trades.to_array(), equity_curve, reserve_fund
+
+def _run_backtest_array(df, params, log=print, sub_bars=None, bar_ms=0, prof=None, strategy=None):
+    """
+    NumPy 数组版回测引擎 (与 run_backtest 的 loop 引擎逐笔一致)
+
+    - OHLC / 策略信号一次性取成连续的数组，不再逐行 df.iloc
+    - 挂单用几个标量表示，持仓用预分配的小数组 (容量 MAX_ORDERS + 1)
+    - 空仓且无原始信号的K线直接跳过，权益 = 余额，整段批量写入
+    """
+    (INITIAL_BALANCE, INITIAL_RESERVE, MAX_ORDERS, ENABLE_LONG, ENABLE_SHORT,
+     LEVERAGE, TP_PERCENT_LONG, SL_PERCENT_LONG, TP_PERCENT_SHORT, SL_PERCENT_SHORT, FEE_RATE,
+     MIX_UP, FIXED_MARGIN_RATE, MAX_OPEN, MAX_OPEN_LIMIT,
+     SIDE_DISTANCE_SWITCH, SAME_SIDE_DISTANCE_LONG, SAME_SIDE_DISTANCE_SHORT,
+     ENABLE_CONSECUTIVE_FILTER, MAX_CONS_LONG, MAX_CONS_SHORT) = [params[name] for name in PARAM_NAMES]
+
+    n = len(df)
+    start_index = 375
+
+    o = np.ascontiguousarray(df['open'].to_numpy(dtype=np.float64))
+    h = np.ascontiguousarray(df['high'].to_numpy(dtype=np.float64))
+    l = np.ascontiguousarray(df['low'].to_numpy(dtype=np.float64))
+    c = np.ascontiguousarray(df['close'].to_numpy(dtype=np.float64))
+    times = df['timestamp'].to_numpy().astype('datetime64[ns]')
+    if sub_bars is not None:
+        t_ms = times.astype('datetime64[ms]').astype(np.int64)
+    lookups, misses = (sub_bars.lookups, sub_bars.misses) if sub_bars is not None else (0, 0)
+
+    # 策略的原始信号 (strategies.py 向量化，基于上一根K线)：1 = 多, -1 = 空, 0 = 无
+    # 偏离值/连续开单过滤依赖状态，留到逐根处理
+    raw_signal = strategy.signals(df, ENABLE_LONG, ENABLE_SHORT)
+    ref_line = np.ascontiguousarray(strategy.reference_line(df), dtype=np.float64)
+    signal_index = np.flatnonzero(raw_signal)
+
+    # === 1. 账户初始化 ===
+    balance = INITIAL_BALANCE
+    reserve_fund = INITIAL_RESERVE
+
+    # 持仓单 (预分配，按开仓顺序排列，前 n_active 个有效)
+    cap = MAX_ORDERS + 1
+    a_type = np.zeros(cap, dtype=np.int8)
+    a_entry = np.zeros(cap)
+    a_amount = np.zeros(cap)
+    a_margin = np.zeros(cap)
+    a_tp = np.zeros(cap)
+    a_sl = np.zeros(cap)
+    a_fee = np.zeros(cap)
+    n_active = 0
+
+    # 挂单 (p_type == 0 表示没有挂单)
+    p_type = 0
+    p_price = p_amount = p_margin = p_tp = p_sl = 0.0
+
+    closed_trades = TradeLog()
+    equity_curve = np.empty(max(n - start_index, 0), dtype=np.float64)
+
+    last_trade_type = 0
+    consecutive_counts = 0
+
+    log(f"🔄 开始回测 [array] | 费率: {FEE_RATE*10000:.0f}‱ (万{FEE_RATE*10000:.0f}) | 杠杆: {LEVERAGE}x")
+    log(f"⏳ 正在逐根K线模拟 ({n - start_index} 根)...")
+
+    i = start_index
+    while i < n:
+        # --- 空仓快进：无挂单无持仓时，只有原始信号K线才可能发生变化 ---
+        if p_type == 0 and n_active == 0:
+            k = np.searchsorted(signal_index, i)
+            nxt = int(signal_index[k]) if k < len(signal_index) else n
+            if nxt > i:
+                equity_curve[i - start_index:nxt - start_index] = balance
+                if prof is not None: prof.skipped += min(nxt, n) - i
+                i = nxt
+                if i >= n:
+                    break
+
+        if prof is not None: prof.mark()
+        current_open = float(o[i])
+        current_high = float(h[i])
+        current_low = float(l[i])
+        current_close = float(c[i])
+
+        # ============================================================
+        # 🟢【阶段一：挂单撮合】
+        # ============================================================
+        filled = False
+        n_pending = 1 if p_type != 0 else 0   # 本根K线扫描的挂单数
+        if p_type != 0:
+            fill_price = 0.0
+            if p_type == 1:
+                if current_open <= p_price:
+                    filled = True
+                    fill_price = current_open
+                elif current_low <= p_price:
+                    filled = True
+                    fill_price = p_price
+            else:
+                if current_open >= p_price:
+                    filled = True
+                    fill_price = current_open
+                elif current_high >= p_price:
+                    filled = True
+                    fill_price = p_price
+
+            if filled:
+                entry_fee = p_amount * fill_price * FEE_RATE
+                balance -= entry_fee
+                f_type, f_entry, f_amount, f_margin = p_type, fill_price, p_amount, p_margin
+                f_tp, f_sl, f_fee = p_tp, p_sl, entry_fee
+            else:
+                balance += p_margin
+            p_type = 0
+        if prof is not None: prof.lap('entry', n_pending)
+
+        # ============================================================
+        # 🔵【阶段二：持仓管理】
+        # ============================================================
+        kept = 0
+        n_scanned = n_active
+        for j in range(n_active):
+            otype = a_type[j]
+            sl_price = float(a_sl[j])
+            tp_price = float(a_tp[j])
+            is_closed = False
+
+            # 同一根K线止损止盈都碰到：高精度模式下用 1m 判断先后
+            resolved = None
+            if sub_bars is not None and current_low <= min(sl_price, tp_price) \
+                    and current_high >= max(sl_price, tp_price):
+                t0 = int(t_ms[i])
+                resolved = sub_bars.resolve_exit(int(otype), sl_price, tp_price, t0, t0 + bar_ms)
+
+            if resolved is not None:
+                is_closed = True
+                close_reason, exit_price = resolved
+            elif otype == 1:
+                if current_low <= sl_price:
+                    is_closed = True
+                    close_reason = "止损"
+                    exit_price = current_open if current_open < sl_price else sl_price
+                elif current_high >= tp_price:
+                    is_closed = True
+                    close_reason = "止盈"
+                    exit_price = current_open if current_open > tp_price else tp_price
+            else:
+                if current_high >= sl_price:
+                    is_closed = True
+                    close_reason = "止损"
+                    exit_price = current_open if current_open > sl_price else sl_price
+                elif current_low <= tp_price:
+                    is_closed = True
+                    close_reason = "止盈"
+                    exit_price = current_open if current_open < tp_price else tp_price
+
+            if is_closed:
+                amount = float(a_amount[j])
+                if otype == 1:
+                    pnl = (exit_price - float(a_entry[j])) * amount
+                else:
+                    pnl = (float(a_entry[j]) - exit_price) * amount
+                exit_fee = exit_price * amount * FEE_RATE
+                net_pnl = pnl - exit_fee
+                balance += float(a_margin[j]) + net_pnl
+
+                if balance < 0:
+                    if reserve_fund > abs(balance):
+                        reserve_fund += balance
+                        balance = 0
+                    else:
+                        balance = 0
+
+                closed_trades.append((times[i], 'long' if otype == 1 else 'short', net_pnl,
+                                      float(a_fee[j]), exit_fee, float(a_margin[j]), close_reason))
+            else:
+                if kept != j:
+                    a_type[kept] = otype
+                    a_entry[kept] = a_entry[j]
+                    a_amount[kept] = a_amount[j]
+                    a_margin[kept] = a_margin[j]
+                    a_tp[kept] = tp_price
+                    a_sl[kept] = sl_price
+                    a_fee[kept] = a_fee[j]
+                kept += 1
+        n_active = kept
+
+        # 刚成交的单子排在最后 (T+1)
+        if filled:
+            a_type[n_active] = f_type
+            a_entry[n_active] = f_entry
+            a_amount[n_active] = f_amount
+            a_margin[n_active] = f_margin
+            a_tp[n_active] = f_tp
+            a_sl[n_active] = f_sl
+            a_fee[n_active] = f_fee
+            n_active += 1
+        if prof is not None: prof.lap('exit', n_scanned)
+
+        # ============================================================
+        # 🟡【阶段三：信号生成】
+        # ============================================================
+        signal = int(raw_signal[i])
+        if signal != 0 and n_active < MAX_ORDERS:
+            last_close = float(c[i - 1])
+            last_ref = float(ref_line[i - 1])
+
+            if SIDE_DISTANCE_SWITCH and last_trade_type == signal:
+                if signal == 1:
+                    if last_close <= last_ref * (1 + SAME_SIDE_DISTANCE_LONG): signal = 0
+                else:
+                    if last_close >= last_ref * (1 - SAME_SIDE_DISTANCE_SHORT): signal = 0
+
+            if ENABLE_CONSECUTIVE_FILTER and signal != 0 and last_trade_type == signal:
+                if signal == 1 and consecutive_counts >= MAX_CONS_LONG: signal = 0
+                elif signal == -1 and consecutive_counts >= MAX_CONS_SHORT: signal = 0
+
+            if signal != 0:
+                if last_trade_type == signal:
+                    consecutive_counts += 1
+                else:
+                    consecutive_counts = 1
+                    last_trade_type = signal
+
+                margin_to_use = balance * FIXED_MARGIN_RATE if MIX_UP else INITIAL_BALANCE
+                if MAX_OPEN and MAX_OPEN_LIMIT > 0:
+                    margin_to_use = min(margin_to_use, MAX_OPEN_LIMIT)
+
+                if margin_to_use > 5 and balance > margin_to_use:
+                    limit_price = last_close
+                    amount = (margin_to_use * LEVERAGE) / limit_price
+                    if signal == 1:
+                        p_tp = limit_price * (1 + TP_PERCENT_LONG)
+                        p_sl = limit_price * (1 - SL_PERCENT_LONG)
+                    else:
+                        p_tp = limit_price * (1 - TP_PERCENT_SHORT)
+                        p_sl = limit_price * (1 + SL_PERCENT_SHORT)
+
+                    balance -= margin_to_use
+                    p_type = signal
+                    p_price = limit_price
+                    p_amount = amount
+                    p_margin = margin_to_use
+        if prof is not None: prof.lap('signal')
+
+        # ============================================================
+        # 🟣【阶段四：统计资金】
+        # ============================================================
+        equity = balance
+        if p_type != 0:
+            equity += p_margin
+        for j in range(n_active):
+            equity += float(a_margin[j])
+            if a_type[j] == 1:
+                equity += (current_close - float(a_entry[j])) * float(a_amount[j])
+            else:
+                equity += (float(a_entry[j]) - current_close) * float(a_amount[j])
+        equity_curve[i - start_index] = equity
+        if prof is not None: prof.lap('equity', n_active)
+
+        i += 1
+
+    _log_intrabar(log, sub_bars, lookups, misses)
+    # 数据不足 start_index 根时资金曲线是空的，一根都没有回测
+    final_equity = equity_curve[-1] if len(equity_curve) else balance
+    log(f"✅ 回测完成! 总交易数: {len(closed_trades)} | 最终权益: {final_equity:.2f}")
+    return closed_trades.to_array(), equity_curve, reserve_fund
+
+def summarize(trades, equity, final_reserve, params=None, times=None):
+    """
+    回测结果统计 (控制台报告和参数扫描共用)
+    返回字典: 总收益率 / 峰值收益率 / 胜率 / 交易数 / 最大回撤 / 盈亏比 等
+    times: 每根K线的时间 (按末尾与 equity 对齐)，传入时额外计算年化夏普，否则 sharpe 为 None
+    """
+    params = get_params(**(params or {}))
+    total_initial_assets = params['INITIAL_BALANCE'] + params['INITIAL_RESERVE']
+    equity = np.asarray(equity, dtype=np.float64)
+    trades = metrics.as_trades(trades)
+
+    final_trading_balance = float(equity[-1]) if len(equity) > 0 else params['INITIAL_BALANCE']
+    total_final_assets = final_trading_balance + final_reserve
+    total_profit = total_final_assets - total_initial_assets
+    profit_rate = (total_profit / total_initial_assets) * 100
+
+    # 峰值总资产近似为 = 最高账户余额 + 剩余备用金 (略有误差但够用)
+    max_equity_value = float(equity.max()) if len(equity) > 0 else final_trading_balance
+    peak_total_assets = max_equity_value + final_reserve
+    peak_profit_rate = ((peak_total_assets - total_initial_assets) / total_initial_assets) * 100
+
+    total_trades = len(trades)
+    win_trades = int((trades['profit'] > 0).sum()) if total_trades > 0 else 0
+    win_rate = (win_trades / total_trades) * 100 if total_trades > 0 else 0
+
+    sharpe = None
+    if times is not None and len(equity) > 0:
+        sharpe = metrics.sharpe(equity, times[-len(equity):])
+
+    return {
+        'total_initial_assets': total_initial_assets,
+        'final_trading_balance': final_trading_balance,
+        'total_final_assets': total_final_assets,
+        'total_profit': total_profit,
+        'profit_rate': profit_rate,
+        'peak_profit_rate': peak_profit_rate,
+        'total_trades': total_trades,
+        'win_trades': win_trades,
+        'loss_trades': total_trades - win_trades,
+        'win_rate': win_rate,
+        'max_drawdown': metrics.max_drawdown(equity) * 100,
+        'profit_factor': metrics.profit_factor(trades),
+        'sharpe': sharpe,
+    }
+
+def build_report(equity, final_time_index, stats, params=None, start_time=None, end_time=None, max_points=None):
+    """
+    生成交互式回测报告 (Plotly 图表对象)：资金曲线 + 每日盈亏
+    equity: run_backtest 返回的资金曲线；final_time_index: 每根K线的时间
+    stats: summarize 的结果
+    max_points: 资金曲线降采样点数，不传则使用全局 REPORT_MAX_POINTS (0 = 不降采样)
+                降采样后放大用的多级数据放在 layout.meta 里，用 write_report 保存才能随缩放变清晰
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    params = get_params(**(params or {}))
+
+    # --- 绘图数据对齐 ---
+    len_df = len(final_time_index)
+    len_equity = len(equity)
+    
+    if len_equity < len_df:
+        aligned_time_index = final_time_index[-len_equity:]
+        aligned_equity = equity
+    elif len_equity > len_df:
+        aligned_time_index = final_time_index
+        aligned_equity = equity[-len_df:]
+    else:
+        aligned_time_index = final_time_index
+        aligned_equity = equity
+
+    equity_series = pd.Series(aligned_equity, index=aligned_time_index)
+    daily_pnl = metrics.daily_pnl(aligned_equity, aligned_time_index)
+
+    # --- 资金曲线降采样 (每日盈亏已经按天汇总，不受影响) ---
+    max_points = REPORT_MAX_POINTS if max_points is None else max_points
+    meta = None
+    if max_points and len(equity_series) > max_points:
+        x_ms = equity_series.index.to_numpy().astype('datetime64[ms]').astype(np.int64)
+        overview, levels = downsample.build_levels(x_ms, equity_series.to_numpy(dtype=np.float64),
+                                                   max_points, REPORT_DETAIL_POINTS)
+        meta = {'equity_levels': levels, 'equity_target': max_points}
+        equity_series = equity_series.iloc[overview]
+
+    # --- Plotly 绘图 ---
+    fig = make_subplots(
+        rows=2, cols=1, 
+        shared_xaxes=True, 
+        vertical_spacing=0.05,
+        row_heights=[0.7, 0.3],
+        subplot_titles=("账户资金权益曲线 (Account Equity)", "每日盈亏 (Daily PnL)")
+    )
+
+    # 曲线
+    fig.add_trace(
+        go.Scatter(
+            x=equity_series.index, 
+            y=equity_series.values,
+            mode='lines',
+            name='总资产 (USDT)',
+            line=dict(color='#00da3c', width=2),
+            hovertemplate='时间: %{x}<br>资产: %{y:.2f} U<extra></extra>'
+        ),
+        row=1, col=1
+    )
+
+    # 柱状图
+    if not daily_pnl.empty:
+        colors = ['#26a69a' if v >= 0 else '#ef5350' for v in daily_pnl.values]
+        fig.add_trace(
+            go.Bar(
+                x=daily_pnl.index, 
+                y=daily_pnl.values,
+                name='每日盈亏',
+                marker_color=colors,
+                hovertemplate='日期: %{x|%Y-%m-%d}<br>盈亏: %{y:.2f} U<extra></extra>'
+            ),
+            row=2, col=1
+        )
+
+    # === 🆕 标题设置 (BTC/USDT + 杠杆 + 峰值收益) ===
+    title_text = (
+        f"<b>BTC/USDT 量化回测报告</b><br>"
+        f"<sup>"
+        f"杠杆: {params['LEVERAGE']}x | "
+        f"总收益: {stats['profit_rate']:.2f}% | "
+        f"峰值收益: {stats['peak_profit_rate']:.2f}% | "
+        f"周期: {start_time or START_TIME} ~ {end_time or END_TIME}"
+        f"</sup>"
+    )
+
+    fig.update_layout(
+        title=title_text,
+        template='plotly_dark',
+        hovermode='x unified',
+        dragmode='zoom',
+        height=800,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    if meta is not None:
+        fig.update_layout(meta=meta)
+
+    return fig
+
+def write_report(fig, path, include_plotlyjs=None):
+    """
+    保存 build_report 生成的图表
+    - plotly.js 按 REPORT_PLOTLYJS 引用 (默认同目录共用一份，不再每个文件内嵌)
+    - 带有降采样数据时附加缩放脚本: 放大后按可见范围换成更精细的一级数据
+    """
+    include_plotlyjs = REPORT_PLOTLYJS if include_plotlyjs is None else include_plotlyjs
+    meta = fig.layout.meta
+    post_script = downsample.ZOOM_SCRIPT if isinstance(meta, dict) and 'equity_levels' in meta else None
+    fig.write_html(path, include_plotlyjs=include_plotlyjs, post_script=post_script)
+    return path
 
-    print(f"✅ 回测完成! 总交易数: {len(closed_trades)} | 最终权益: {equity_curve[-1]:.2f}")
-    return closed_trades, equity_curve, reserve_fund
 
 # =========================================
 # === 主执行入口 ===
@@ -432,8 +1018,6 @@ if __name__ == "__main__":
     # === 🛑 统一时间处理逻辑 ===
     # =========================================================
     import pandas as pd
-    import plotly.graph_objects as go
-    from plotly.subplots import make_subplots
     import webbrowser
     import os
     import time
@@ -474,28 +1058,20 @@ if __name__ == "__main__":
     
     if len(equity) > 0:
         
-        # --- 3. 核心统计计算 (新增峰值计算) ---
-        final_trading_balance = equity[-1]
-        total_initial_assets = INITIAL_BALANCE + INITIAL_RESERVE
-        total_final_assets = final_trading_balance + final_reserve
-        
-        # 总体盈亏
-        total_profit = total_final_assets - total_initial_assets
-        profit_rate = (total_profit / total_initial_assets) * 100
-        
-        # === 🆕 新增：计算历史最高资产与峰值收益率 ===
-        max_equity_value = max(equity) # 历史最高账户余额
-        # 注意：这里假设备用金不动，只计算交易账户的峰值带动整体资产的峰值
-        # 峰值总资产近似为 = 最高账户余额 + 剩余备用金 (略有误差但够用)
-        peak_total_assets = max_equity_value + final_reserve 
-        peak_profit_rate = ((peak_total_assets - total_initial_assets) / total_initial_assets) * 100
+        # --- 3. 核心统计计算 (含峰值收益) ---
+        stats = summarize(trades, equity, final_reserve, times=final_time_index)
+        final_trading_balance = stats['final_trading_balance']
+        total_initial_assets = stats['total_initial_assets']
+        total_final_assets = stats['total_final_assets']
+        total_profit = stats['total_profit']
+        profit_rate = stats['profit_rate']
+        peak_profit_rate = stats['peak_profit_rate']
 
         # === 文字版控制台打印 ===
-        # 胜率统计
-        total_trades = len(trades)
-        win_trades = len([t for t in trades if t['profit'] > 0])
-        loss_trades = total_trades - win_trades
-        win_rate = (win_trades / total_trades) * 100 if total_trades > 0 else 0
+        total_trades = stats['total_trades']
+        win_trades = stats['win_trades']
+        loss_trades = stats['loss_trades']
+        win_rate = stats['win_rate']
 
         print("\n" + "="*40)
         print(f"📊 回测结果 ({START_TIME} 至 {END_TIME})")
@@ -511,81 +1087,14 @@ if __name__ == "__main__":
         print(f"📈 交易详情:")
         print(f"   总交易数:   {total_trades}")
         print(f"   胜率:       {win_rate:.2f}% (✅{win_trades} / ❌{loss_trades})")
+        print(f"   盈亏比:     {stats['profit_factor']:.2f}")
+        print(f"   最大回撤:   {stats['max_drawdown']:.2f}%")
+        print(f"   夏普比率:   {stats['sharpe']:.2f}")
         print("="*40)
 
-        # --- 4. 绘图数据对齐 ---
-        len_df = len(final_time_index)
-        len_equity = len(equity)
-        
-        if len_equity < len_df:
-            aligned_time_index = final_time_index[-len_equity:]
-            aligned_equity = equity
-        elif len_equity > len_df:
-            aligned_time_index = final_time_index
-            aligned_equity = equity[-len_df:]
-        else:
-            aligned_time_index = final_time_index
-            aligned_equity = equity
-
-        equity_series = pd.Series(aligned_equity, index=aligned_time_index)
-        daily_pnl = equity_series.resample('D').last().diff().fillna(0) 
-
-        # --- 5. Plotly 绘图 ---
-        fig = make_subplots(
-            rows=2, cols=1, 
-            shared_xaxes=True, 
-            vertical_spacing=0.05,
-            row_heights=[0.7, 0.3],
-            subplot_titles=("账户资金权益曲线 (Account Equity)", "每日盈亏 (Daily PnL)")
-        )
-
-        # 曲线
-        fig.add_trace(
-            go.Scatter(
-                x=equity_series.index, 
-                y=equity_series.values,
-                mode='lines',
-                name='总资产 (USDT)',
-                line=dict(color='#00da3c', width=2),
-                hovertemplate='时间: %{x}<br>资产: %{y:.2f} U<extra></extra>'
-            ),
-            row=1, col=1
-        )
-
-        # 柱状图
-        if not daily_pnl.empty:
-            colors = ['#26a69a' if v >= 0 else '#ef5350' for v in daily_pnl.values]
-            fig.add_trace(
-                go.Bar(
-                    x=daily_pnl.index, 
-                    y=daily_pnl.values,
-                    name='每日盈亏',
-                    marker_color=colors,
-                    hovertemplate='日期: %{x|%Y-%m-%d}<br>盈亏: %{y:.2f} U<extra></extra>'
-                ),
-                row=2, col=1
-            )
-
-        # === 🆕 标题设置 (BTC/USDT + 杠杆 + 峰值收益) ===
-        title_text = (
-            f"<b>BTC/USDT 量化回测报告</b><br>"
-            f"<sup>"
-            f"杠杆: {LEVERAGE}x | "
-            f"总收益: {profit_rate:.2f}% | "
-            f"峰值收益: {peak_profit_rate:.2f}% | "
-            f"周期: {START_TIME} ~ {END_TIME}"
-            f"</sup>"
-        )
+        # --- 4. 绘图 ---
+        fig = build_report(equity, final_time_index, stats)
 
-        fig.update_layout(
-            title=title_text,
-            template='plotly_dark',
-            hovermode='x unified',
-            dragmode='zoom',
-            height=800,
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-        )
-        
         # 保存
         save_dir = r"F:\BIANRobot\text1\Backtest_Results"
         if not os.path.exists(save_dir):
@@ -595,7 +1104,7 @@ if __name__ == "__main__":
         filename_html = f"backtest_BTC_USDT_{LEVERAGE}x_{current_time_str}.html"
         full_path_html = os.path.join(save_dir, filename_html)
         
-        fig.write_html(full_path_html)
+        write_report(fig, full_path_html)
         print(f"✅ 交互式回测报告已保存: {full_path_html}")
         webbrowser.open(full_path_html)
         
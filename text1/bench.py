@@ -0,0 +1,282 @@
+# 文件名: bench.py
+# 回测 / 数据热点路径的性能基准
+#
+# 改完 load_from_csv、均线计算或回测主循环之后，跑一遍就知道是快了还是慢了:
+#   python bench.py                      跑默认规模 (1万 / 10万 / 100万根K线)，和基准比较
+#   python bench.py --sizes 10000,100000 只跑指定规模
+#   python bench.py --real FUTURES_BTCUSDT_5m_2020.csv   额外用真实行情“形状”的数据
+#   python bench.py --save-baseline      把这次结果存为新基准
+#
+# 每个阶段记录: 用时 (多次取最快)、每秒处理K线数、峰值内存 (tracemalloc，单独跑一次)
+# 结果写成 JSON；和基准相比用时或内存超出 THRESHOLD 的阶段标记为退步，退出码为 1。
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import indicators
+from sim_exchange import make_candles
+
+SIZES = [10_000, 100_000, 1_000_000]
+PHASES = ['load_csv', 'build_cache', 'load_cached', 'indicators', 'backtest', 'report']
+THRESHOLD = 0.15           # 比基准慢 / 多占内存 15% 以上算退步
+MIN_SECONDS = 0.05         # 用时都低于这个数的项只做参考 (计时误差比差异还大)
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+# 回测读数据时的时间范围 (覆盖全部生成的数据)
+_ALL_TIME = ('1970-01-01 00:00:00', '2200-01-01 00:00:00')
+
+
+# =================================================================
+# 测试数据
+# =================================================================
+def synthetic_candles(n, seed=0):
+    """随机游走K线 (fetch_ohlcv 格式的数组)"""
+    return make_candles(n, start='2020-01-01 00:00:00', seed=seed)
+
+
+def real_shaped_candles(csv_path, n, seed=0, block=288):
+    """
+    用真实数据的“形状”生成 n 根K线: 按天 (288 根 5m) 整块有放回抽取真实的
+    涨跌幅、上下影线比例和成交量，再拼成一条连续的价格序列
+    (保留波动聚集、影线分布等特征，长度可以比原数据长)
+    """
+    df = pd.read_csv(csv_path)
+    df.columns = [x.lower() for x in df.columns]
+    o, h, l, c, v = [df[k].to_numpy(dtype=np.float64) for k in ('open', 'high', 'low', 'close', 'volume')]
+    ret = np.log(c[1:] / c[:-1])
+    up = h[1:] / np.maximum(o[1:], c[1:])
+    down = l[1:] / np.minimum(o[1:], c[1:])
+    gap = o[1:] / c[:-1]
+    vol = v[1:]
+
+    rng = np.random.default_rng(seed)
+    block = min(block, len(ret))
+    starts = rng.integers(0, len(ret) - block + 1, size=-(-n // block))
+    idx = (starts[:, None] + np.arange(block)).ravel()[:n]
+
+    close = c[0] * np.exp(np.cumsum(ret[idx]))
+    open_ = np.concatenate([[c[0]], close[:-1]]) * gap[idx]
+    high = np.maximum(open_, close) * up[idx]
+    low = np.minimum(open_, close) * down[idx]
+    ts = make_candles(1, start='2020-01-01 00:00:00')[0, 0] + np.arange(n, dtype=np.int64) * 300_000
+    return np.column_stack([ts, open_, high, low, close, vol[idx]])
+
+
+def write_csv(candles, path):
+    """写成 data_download.py 导出的 CSV 格式"""
+    df = pd.DataFrame(candles, columns=['Timestamp', 'Open', 'High', 'Low', 'Close', 'Volume'])
+    df['Timestamp'] = df['Timestamp'].astype(np.int64)
+    df.insert(0, 'datetime', pd.to_datetime(df['Timestamp'], unit='ms'))
+    df.to_csv(path, index=False)
+
+
+# =================================================================
+# 计时
+# =================================================================
+def measure(fn, repeat=1, memory=True):
+    """
+    返回 (最快用时秒数, 峰值内存 MB, 最后一次的返回值)
+    峰值内存单独再跑一次 (tracemalloc 会拖慢 Python 代码，不能和计时混在一起)
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        best = min(best, time.perf_counter() - t0)
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                fn()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return best, peak_mb, result
+
+
+def bench_dataset(csv_path, n, repeat=3, phases=PHASES):
+    """对一份数据跑各个阶段，返回 {阶段: {'seconds', 'bars_per_sec', 'peak_mb'}}"""
+    out = {}
+    use_cache = backtest.USE_CACHE
+    cache_dir = csv_path + '.cache'
+
+    def record(name, seconds, peak_mb):
+        out[name] = {'seconds': seconds, 'bars_per_sec': n / seconds if seconds > 0 else None, 'peak_mb': peak_mb}
+
+    try:
+        if 'load_csv' in phases:
+            backtest.USE_CACHE = False
+            s, m, _ = measure(lambda: backtest.load_from_csv(csv_path, *_ALL_TIME), repeat)
+            record('load_csv', s, m)
+
+        backtest.USE_CACHE = True
+        if 'build_cache' in phases:
+            def build():
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                return backtest.load_from_csv(csv_path, *_ALL_TIME)
+            s, m, _ = measure(build, 1)
+            record('build_cache', s, m)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = backtest.load_from_csv(csv_path, *_ALL_TIME)
+        if 'load_cached' in phases:
+            s, m, df = measure(lambda: backtest.load_from_csv(csv_path, *_ALL_TIME), repeat)
+            record('load_cached', s, m)
+
+        base = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
+        if 'indicators' in phases:
+            s, m, _ = measure(lambda: indicators.add_ma_columns(base.copy(), (31, 128, 373)), repeat)
+            record('indicators', s, m)
+
+        indicators.add_ma_columns(df, (31, 128, 373))
+        result = None
+        if 'backtest' in phases or 'report' in phases:
+            s, m, result = measure(lambda: backtest.run_backtest(df, verbose=False), repeat if 'backtest' in phases else 1,
+                                   memory='backtest' in phases)
+            if 'backtest' in phases:
+                record('backtest', s, m)
+
+        if 'report' in phases:
+            trades, equity, final_reserve = result
+            times = pd.DatetimeIndex(df['timestamp'])
+            tmp_html = csv_path + '.html'
+
+            def report():
+                stats = backtest.summarize(trades, equity, final_reserve)
+                fig = backtest.build_report(equity, times, stats)
+                backtest.write_report(fig, tmp_html)
+            s, m, _ = measure(report, 1)
+            record('report', s, m)
+            out['report']['html_mb'] = os.path.getsize(tmp_html) / 2 ** 20
+            os.remove(tmp_html)
+    finally:
+        backtest.USE_CACHE = use_cache
+    return out
+
+
+def run_suite(sizes=SIZES, real_csv=None, repeat=3, phases=PHASES):
+    """
+    跑完整套基准，返回可直接存成 JSON 的字典
+    results 的键是 "数据类型/K线数/阶段"，例如 "synthetic/100000/backtest"
+    """
+    tmp = tempfile.mkdtemp(prefix='bench_')
+    results = {}
+    try:
+        kinds = [('synthetic', None)] + ([('real', real_csv)] if real_csv else [])
+        for kind, source in kinds:
+            for n in sizes:
+                candles = synthetic_candles(n) if source is None else real_shaped_candles(source, n)
+                csv_path = os.path.join(tmp, f"{kind}_{n}.csv")
+                write_csv(candles, csv_path)
+                del candles
+                print(f"⏱️ {kind} {n} 根K线 ...")
+                for phase, row in bench_dataset(csv_path, n, repeat, phases).items():
+                    results[f"{kind}/{n}/{phase}"] = row
+                    print(f"   {phase:<12} {row['seconds']:>8.3f} 秒 | {row['bars_per_sec'] or 0:>12,.0f} 根/秒 | "
+                          f"峰值内存 {row['peak_mb'] or 0:>8.1f} MB")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.platform(),
+            'engine': backtest.ENGINE,
+        },
+        'results': results,
+    }
+
+
+# =================================================================
+# 与基准比较
+# =================================================================
+def compare(current, baseline, threshold=THRESHOLD):
+    """
+    逐项对比用时和峰值内存，返回 DataFrame (ratio > 1 表示比基准慢/占内存多)
+    regression 列标出超出阈值的项 (用时太短的项不算)
+    """
+    rows = []
+    for key, cur in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            if not cur.get(metric) or not base.get(metric):
+                continue
+            ratio = cur[metric] / base[metric]
+            noisy = metric == 'seconds' and max(cur[metric], base[metric]) < MIN_SECONDS
+            rows.append({'case': key, 'metric': metric, 'baseline': base[metric], 'current': cur[metric],
+                         'ratio': ratio, 'regression': ratio > 1 + threshold and not noisy})
+    return pd.DataFrame(rows)
+
+
+def print_comparison(diff, threshold=THRESHOLD):
+    if diff.empty:
+        print("ℹ️ 基准里没有可比较的项目")
+        return
+    print("\n" + "=" * 80)
+    print(f"📊 与基准对比 (超出 {threshold * 100:.0f}% 记为退步)")
+    print("=" * 80)
+    for _, r in diff.iterrows():
+        flag = '❌ 退步' if r['regression'] else ('🚀 提升' if r['ratio'] < 1 - threshold else '')
+        print(f"   {r['case']:<32} {r['metric']:<8} {r['baseline']:>10.3f} -> {r['current']:>10.3f} "
+              f"({r['ratio']:.2f}x) {flag}")
+    print("=" * 80)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='回测 / 数据热点路径性能基准')
+    parser.add_argument('--sizes', default=','.join(str(n) for n in SIZES), help='K线数量，逗号分隔')
+    parser.add_argument('--real', help='真实行情 CSV (用来生成同样“形状”的数据)')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快一次')
+    parser.add_argument('--phases', default=','.join(PHASES), help='只跑这些阶段，逗号分隔')
+    parser.add_argument('--out', default=f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json", help='结果 JSON 路径')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='基准 JSON 路径')
+    parser.add_argument('--save-baseline', action='store_true', help='把这次结果保存为基准')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    sizes = [int(x) for x in args.sizes.split(',') if x]
+    phases = [x for x in args.phases.split(',') if x]
+    current = run_suite(sizes, args.real, args.repeat, phases)
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"💾 结果已保存: {args.out}")
+
+    if args.save_baseline:
+        shutil.copyfile(args.out, args.baseline)
+        print(f"📌 已设为基准: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("ℹ️ 还没有基准，用 --save-baseline 保存一份")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    diff = compare(current, baseline, args.threshold)
+    print_comparison(diff, args.threshold)
+    return 1 if not diff.empty and diff['regression'].any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
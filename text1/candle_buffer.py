@@ -0,0 +1,90 @@
+# 文件名: candle_buffer.py
+# 固定容量的K线缓冲区 (实盘数据层共用)
+#
+# 内部用 2 倍容量的连续数组：写满后把最后 capacity 根整体挪回开头 (均摊 O(1))，
+# 这样任何时候最近 capacity 根都是一段连续内存，取数据时直接给切片视图，不需要拷贝。
+import numpy as np
+import pandas as pd
+
+# 与 DataManager.fetch_kline 返回的列名保持一致
+COLUMNS = ['time', 'open', 'high', 'low', 'close', 'vol']
+
+
+class CandleBuffer:
+    def __init__(self, capacity=500):
+        self.capacity = capacity
+        self._time = np.zeros(2 * capacity, dtype=np.int64)        # 毫秒时间戳
+        self._ohlcv = np.zeros((5, 2 * capacity), dtype=np.float64)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def last_time(self):
+        """最后一根K线的毫秒时间戳，空缓冲区返回 None"""
+        return int(self._time[self._end - 1]) if self._end > self._start else None
+
+    def clear(self):
+        self._start = self._end = 0
+
+    def _append(self, ts, o, h, l, c, v):
+        if self._end == len(self._time):
+            # 写到头了：把最近 capacity-1 根挪回开头，腾出位置
+            keep = self.capacity - 1
+            self._time[:keep] = self._time[self._end - keep:self._end]
+            self._ohlcv[:, :keep] = self._ohlcv[:, self._end - keep:self._end]
+            self._start, self._end = 0, keep
+        self._time[self._end] = ts
+        self._ohlcv[:, self._end] = (o, h, l, c, v)
+        self._end += 1
+        if self._end - self._start > self.capacity:
+            self._start += 1
+
+    def update(self, ts, o, h, l, c, v):
+        """
+        写入一根K线:
+        - 时间比最后一根新: 追加
+        - 时间等于最后一根: 覆盖 (还没收盘的K线在不断变化)
+        - 更早的时间: 如果还在缓冲区里就覆盖，否则忽略
+        返回 True 表示新增了一根K线
+        """
+        ts = int(ts)
+        last = self.last_time
+        if last is None or ts > last:
+            self._append(ts, o, h, l, c, v)
+            return True
+        if ts == last:
+            idx = self._end - 1
+        else:
+            times = self._time[self._start:self._end]
+            pos = int(np.searchsorted(times, ts))
+            if pos >= len(times) or times[pos] != ts:
+                return False
+            idx = self._start + pos
+        self._ohlcv[:, idx] = (o, h, l, c, v)
+        return False
+
+    def extend(self, candles):
+        """批量写入 fetch_ohlcv 格式的K线 [[ts, o, h, l, c, v], ...]，返回新增根数"""
+        added = 0
+        for candle in candles:
+            added += self.update(*candle[:6])
+        return added
+
+    def view(self):
+        """(时间数组, ohlcv 二维数组) 的切片视图，不拷贝；后续写入会改变它的内容"""
+        return self._time[self._start:self._end], self._ohlcv[:, self._start:self._end]
+
+    def to_frame(self, copy=False):
+        """
+        转成 DataFrame (列名同 DataManager.fetch_kline)
+        copy=False 时各列直接引用缓冲区内存，适合同一线程里马上用完的场景
+        """
+        times, ohlcv = self.view()
+        data = {'time': times.view('datetime64[ms]')}
+        for i, name in enumerate(COLUMNS[1:]):
+            data[name] = ohlcv[i]
+        df = pd.DataFrame(data, copy=False)
+        return df.copy() if copy else df
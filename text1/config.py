@@ -10,6 +10,7 @@ class Config:
     # ================= 交易目标 =================
     SYMBOL = 'BTC/USDT'  # 交易对
     LEVERAGE = 5         # 杠杆倍数
+    MARGIN_MODE = None   # 保证金模式: 'cross' 全仓 / 'isolated' 逐仓 / None 不修改 (启动时设置一次)
     QUANTITY_USDT = 100  # 每次交易金额 (USDT)
     SANDBOX_MODE = True  # 是否使用测试网
 
@@ -30,6 +31,23 @@ class Config:
     MA_FAST = 5          # 快线周期
     MA_SLOW = 20         # 慢线周期
 
+    # 开单规则 (strategies.py: 'ma_stack' = 收盘价 > MA31 > MA128，'ma_cross' = MA128/MA373 金叉死叉)
+    STRATEGY = 'ma_stack'
+    ENABLE_LONG = True   # 允许开多
+    ENABLE_SHORT = False # 允许开空 (实盘默认只做多)
+
+    # === 行情数据来源 ===
+    # 'rest'   = 每 10 秒用 REST 轮询所有周期 (原方式)
+    # 'stream' = WebSocket 推送，主周期K线收盘时立即触发策略
+    # 'replay' = 用本地历史K线加速回放 (不联网、不下真单，见 replay.py)
+    DATA_SOURCE = 'rest'
+    STREAM_URL = 'wss://fstream.binance.com/stream'  # 币安U本位合约推送地址
+
+    # === 历史回放 (DATA_SOURCE = 'replay') ===
+    REPLAY_CSV = r"F:\BIANRobot\text1\FUTURES_BTCUSDT_5m_2020.csv"
+    REPLAY_START = '2026-01-01 00:00:00'
+    REPLAY_END = '2026-01-10 00:00:00'
+
     # === 报警设置 ===
     # Bark 推送链接 (格式通常是: https://api.day.app/你的私钥/)
     # 请确保最后面带有一个斜杠 /
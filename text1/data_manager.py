@@ -1,6 +1,8 @@
 # 文件名: data_manager.py
-import pandas as pd
 import time
+from candle_buffer import CandleBuffer
+from data_download import kline_weight
+from resampler import can_derive, resample_into, timeframe_ms
 
 class DataManager:  # <--- 请确保这里是 DataManager
     def __init__(self, exchange):
@@ -9,33 +11,141 @@ class DataManager:  # <--- 请确保这里是 DataManager
         这样可以复用 Driver 的连接，不用建立两次
         """
         self.exchange = exchange
+        
+        # 每个 (交易对, 周期) 一个K线缓冲区
+        # 第一次请求完整的 limit 根，之后只请求上次最后一根之后的K线 (增量)
+        self.buffers = {}
+
+    # 增量请求的根数：正常每次只变 1~2 根，给够余量；
+    # 如果一次就取满了说明断开太久，直接重新完整拉取
+    DELTA_LIMIT = 20
 
     def fetch_kline(self, symbol, timeframe, limit=500):
-        """读取单个周期的 K 线"""
+        """
+        读取单个周期的 K 线
+        返回的 DataFrame 直接引用缓冲区内存 (不拷贝)，下次调用 fetch_kline 时内容会被更新，
+        需要长期保存请自己 .copy()
+        """
         try:
+            since = self._delta_since(symbol, timeframe)
+            if since is not None:
+                # 增量：从缓冲区最后一根 (正在形成的那根) 开始取，覆盖它并追加新K线
+                bars = self.exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=self.DELTA_LIMIT)
+                df = self._apply_delta(symbol, timeframe, bars)
+                if df is not None:
+                    return df
+
+            # 第一次 (或缺得太多)：完整拉取 limit 根
             bars = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-            df = pd.DataFrame(bars, columns=['time', 'open', 'high', 'low', 'close', 'vol'])
-            df['time'] = pd.to_datetime(df['time'], unit='ms')
-            return df
+            return self._apply_full(symbol, timeframe, bars, limit)
         except Exception as e:
             print(f"❌ [数据层] 获取 {timeframe} 失败: {e}")
             return None
 
+    async def fetch_kline_async(self, symbol, timeframe, limit=500, budget=None):
+        """
+        fetch_kline 的异步版 (exchange 是 ccxt.async_support 的交易所)，多个交易对可以并发
+        budget: 可选的 data_download.WeightBudget，每次请求前按K线接口的权重取令牌，
+                所有并发请求共用一个，整体不超过币安的每分钟权重
+        """
+        try:
+            since = self._delta_since(symbol, timeframe)
+            if since is not None:
+                if budget is not None:
+                    await budget.acquire(kline_weight(self.DELTA_LIMIT))
+                bars = await self.exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=self.DELTA_LIMIT)
+                df = self._apply_delta(symbol, timeframe, bars)
+                if df is not None:
+                    return df
+
+            if budget is not None:
+                await budget.acquire(kline_weight(limit))
+            bars = await self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            return self._apply_full(symbol, timeframe, bars, limit)
+        except Exception as e:
+            print(f"❌ [数据层] 获取 {symbol} {timeframe} 失败: {e}")
+            return None
+
+    def _delta_since(self, symbol, timeframe):
+        """已经有缓冲区时增量请求的起点 (缓冲区最后一根的时间)，没有返回 None"""
+        buf = self.buffers.get((symbol, timeframe))
+        if buf is not None and len(buf) > 0:
+            return buf.last_time
+        return None
+
+    def _apply_delta(self, symbol, timeframe, bars):
+        """增量请求的结果合并进缓冲区；取满了 (断开太久) 返回 None，调用方改为完整拉取"""
+        if len(bars) < self.DELTA_LIMIT:
+            buf = self.buffers[(symbol, timeframe)]
+            buf.extend(bars)
+            return buf.to_frame()
+        print(f"⚠️ [数据层] {timeframe} 缺失K线过多，重新完整拉取")
+        return None
+
+    def _apply_full(self, symbol, timeframe, bars, limit):
+        """完整拉取的结果建一个新的缓冲区"""
+        buf = CandleBuffer(limit)
+        buf.extend(bars)
+        self.buffers[(symbol, timeframe)] = buf
+        return buf.to_frame()
+
+    def derive_kline(self, symbol, base_buf, timeframe, since, limit=500):
+        """
+        用基础周期的缓冲区在本地合成 timeframe 的K线 (见 resampler.py)
+        第一次 (或基础数据已经接不上) 先向交易所完整拉取一次历史，之后只在本地增量合成
+        since: 本轮请求前基础周期最后一根的时间，从它所在的桶开始重算
+        """
+        key = (symbol, timeframe)
+        buf = self.buffers.get(key)
+        times, _ = base_buf.view()
+        if buf is None or len(buf) == 0 or since is None or int(times[0]) > buf.last_time:
+            try:
+                print(f"📡 正在获取 {timeframe} 历史数据 (之后由 {len(times)} 根基础K线本地合成)...")
+                bars = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            except Exception as e:
+                print(f"❌ [数据层] 获取 {timeframe} 失败: {e}")
+                return None
+            buf = CandleBuffer(limit)
+            buf.extend(bars)
+            self.buffers[key] = buf
+            since = buf.last_time
+        resample_into(base_buf, buf, timeframe, since)
+        return buf.to_frame()
+
     def get_all_timeframes(self, symbol, timeframes_list):
         """
         一次性读取所有需要的周期
         返回一个字典，格式如: {'5m': df1, '1h': df2}
+
+        只向交易所请求最小的周期，能由它合成的大周期 (15m / 30m / 1h ...) 在本地合成，
+        每轮请求从“每个周期一次”降到一次，所有周期都来自同一份基础K线，彼此一致。
+        不能合成的周期 (月线、超过缓冲区一半长度的周期) 仍然单独请求。
         """
         data_map = {}
-        
+        base = min(timeframes_list, key=timeframe_ms)
+        base_buf = self.buffers.get((symbol, base))
+        since = base_buf.last_time if base_buf is not None else None
+
+        print(f"📡 正在获取 {base} 数据...")
+        base_df = self.fetch_kline(symbol, base)
+        if base_df is not None:
+            data_map[base] = base_df
+        base_buf = self.buffers.get((symbol, base))
+
         for tf in timeframes_list:
+            if tf == base:
+                continue
+            if base_df is not None and can_derive(base, tf, base_buf.capacity):
+                df = self.derive_kline(symbol, base_buf, tf, since)
+                if df is not None:
+                    data_map[tf] = df
+                continue
+
+            # 为了防止币安报错 (429 Too Many Requests)，稍微停顿
+            time.sleep(0.5)
             print(f"📡 正在获取 {tf} 数据...")
             df = self.fetch_kline(symbol, tf)
-            
             if df is not None:
                 data_map[tf] = df
-            
-            # 为了防止币安报错 (429 Too Many Requests)，稍微停顿
-            time.sleep(0.5) 
-            
+
         return data_map
\ No newline at end of file
@@ -1,124 +1,315 @@
-import ccxt
+import asyncio
+import numpy as np
 import pandas as pd
-import time
 from datetime import datetime
 
-def fetch_binance_futures_data_with_oi(symbol, timeframe, start_str, end_str):
-    
-    # 1. 初始化交易所 (保持你的代理配置)
-    exchange = ccxt.binance({
-        'enableRateLimit': True,
-        'options': {
-            'defaultType': 'future', 
-        },
-        'proxies': {
-            'http': 'http://127.0.0.1:7890',  # 记得检查你的端口
-            'https': 'http://127.0.0.1:7890',
-        },
-        'timeout': 30000,
-    })
-
-    # 2. 转换时间
-    since = exchange.parse8601(start_str)
-    end_timestamp = exchange.parse8601(end_str)
-    
-    all_data = []
-    
-    # !!! 关键修改：Binance OI 接口单次限制通常为 500，为了对齐，我们将 limit 设为 500 !!!
-    LIMIT = 500 
-    
-    print(f"--- 开始下载 [U本位合约] {symbol} [{timeframe}] (含OI数据) ---")
-    
-    while since < end_timestamp:
+from data_download import (create_async_exchange, fetch_ohlcv_concurrent, split_range, store_path_for,
+                           WeightBudget, _new_gaps)
+from kline_store import KlineStore, TIME_COLUMN, OHLCV_COLUMNS
+
+# !!! Binance OI 接口单次上限 500 !!!
+OI_LIMIT = 500
+# OI 统计接口按 IP 单独限流 (每 5 分钟 1000 次)，这里每次按 1 个权重从共用令牌桶里扣
+OI_WEIGHT = 1
+OI_COLUMNS = ['open_interest', 'open_interest_value']
+
+
+def oi_store_path_for(symbol, timeframe):
+    """OI 的本地存储目录，例如 FUTURES_OI_BTCUSDT_5m.store (与K线分开存，各自续传)"""
+    return f"FUTURES_OI_{symbol.replace('/', '')}_{timeframe}.store"
+
+
+def _oi_to_columns(items):
+    """fetch_open_interest_history 的结果 -> {列名: 数组}"""
+    data = {
+        TIME_COLUMN: np.array([it['timestamp'] for it in items], dtype=np.int64),
+        'open_interest': np.array([it.get('openInterestAmount') for it in items], dtype=np.float64),
+        'open_interest_value': np.array([it.get('openInterestValue') for it in items], dtype=np.float64),
+    }
+    order = np.argsort(data[TIME_COLUMN], kind='stable')
+    return {name: values[order] for name, values in data.items()}
+
+
+# =================================================================
+# 持仓量 (Open Interest) 并发下载
+# =================================================================
+async def _fetch_oi_chunk(exchange, symbol, timeframe, chunk, tf_ms, sem, budget, retries=3):
+    """
+    下载一段 OI (最多 OI_LIMIT 条，一次请求)
+    Binance 只保留最近一段时间的 OI 历史，更早的时间段返回空，合并时这些K线的 OI 就是空值
+    重试用完仍然报错时抛出异常 (由调用方记下这一段，之后补)
+    """
+    a, b = chunk
+    limit = int((b - a) // tf_ms + 1)
+    for attempt in range(retries):
         try:
-            # === A. 获取 K线数据 (OHLCV) ===
-            # 返回格式: [[Timestamp, Open, High, Low, Close, Volume], ...]
-            ohlcvs = exchange.fetch_ohlcv(symbol, timeframe, since, limit=LIMIT)
-            
-            if not ohlcvs:
-                print("未获取到K线数据，可能已到头或网络问题，尝试跳出")
-                break
-
-            # === B. 获取 持仓量数据 (Open Interest) ===
-            # 返回格式: [{'symbol': 'BTC/USDT', 'timestamp': 1600..., 'openInterest': 123...}, ...]
-            # 注意：某些旧版本ccxt或冷门币种可能报错，加个try-except保护
-            oi_list = []
-            try:
-                oi_list = exchange.fetch_open_interest_history(symbol, timeframe, since, limit=LIMIT)
-            except Exception as e:
-                print(f"警告: 获取OI数据失败 (Timestamp: {since}) - {e}")
-                # 如果获取失败，oi_list为空，后面逻辑会自动填 None
-            
-            # === C. 数据对齐与合并 ===
-            # 1. 把 OI 数据转成字典，方便按时间戳查找: { timestamp: openInterest_value }
-            oi_map = {item['timestamp']: item['openInterest'] for item in oi_list}
-            
-            batch_data = []
-            last_time = ohlcvs[-1][0]
-            
-            for candle in ohlcvs:
-                ts = candle[0]
-                
-                # 如果当前K线时间超出了结束时间，停止处理
-                if ts > end_timestamp:
-                    break
-                
-                # 从 map 中找到对应时间的 OI，找不到则为 None
-                oi_value = oi_map.get(ts, None)
-                
-                # 拼接: [Timestamp, Open, High, Low, Close, Volume, OpenInterest]
-                new_row = candle + [oi_value]
-                batch_data.append(new_row)
-
-            # 将本批次数据加入总列表
-            all_data.extend(batch_data)
-            
-            # === D. 更新进度与时间 ===
-            since = last_time + 1
-            
-            current_date = datetime.fromtimestamp(last_time / 1000).strftime('%Y-%m-%d %H:%M')
-            # 这里的 batch_data[-1][-1] 是最新一条的 OI 值
-            last_oi_display = batch_data[-1][-1] if batch_data else 0
-            
-            print(f"已下载至: {current_date} | 累计: {len(all_data)} 行 | 最新OI: {last_oi_display}")
-            
-            if last_time >= end_timestamp:
-                break
-            
-            # 因为发了两次请求（K线+OI），建议稍微增加延时，防止触发权重限制
-            time.sleep(0.5) 
-            
+            await budget.acquire(OI_WEIGHT)
+            async with sem:
+                items = await exchange.fetch_open_interest_history(symbol, timeframe, a, limit=limit)
+            return [it for it in items if a <= it['timestamp'] <= b]
         except Exception as e:
-            print(f"Error in main loop: {e}")
-            time.sleep(5)
+            if attempt == retries - 1:
+                print(f"警告: 获取OI数据失败 (Timestamp: {a}) - {e}")
+                raise
+            await asyncio.sleep(2 ** attempt)
+
+
+async def fetch_oi_concurrent(exchange, symbol, timeframe, start_ms, end_ms, max_in_flight=8, budget=None,
+                              failed=None):
+    """
+    并发下载一段时间的 OI，返回 {列名: 数组} (按时间去重排序)，没有数据返回 None
+    failed: 传入列表时，重试用完仍失败的分段 (a, b) 追加进去，其余分段照常返回；不传则直接抛出异常
+    """
+    tf_ms = exchange.parse_timeframe(timeframe) * 1000
+    sem = asyncio.Semaphore(max_in_flight)
+    budget = budget or WeightBudget()
+    chunks = split_range(start_ms, end_ms, tf_ms, OI_LIMIT)
+
+    results = await asyncio.gather(*[
+        _fetch_oi_chunk(exchange, symbol, timeframe, chunk, tf_ms, sem, budget) for chunk in chunks
+    ], return_exceptions=failed is not None)
+    items = []
+    for chunk, part in zip(chunks, results):
+        if isinstance(part, BaseException):
+            failed.append(chunk)
+            continue
+        items.extend(part)
+    if not items:
+        return None
+    data = _oi_to_columns(items)
+    _, first = np.unique(data[TIME_COLUMN], return_index=True)
+    return {name: values[first] for name, values in data.items()}
+
+
+def _failed_gaps(failed, gaps, tf_ms):
+    """
+    下载失败的分段 -> 缺口记录 (格式同 meta.json 的 gaps: start/end 是缺口前后两根的时间)
+    已经被现有缺口盖住的分段不重复记录
+    """
+    out = []
+    for a, b in failed:
+        start, end = a - tf_ms, b + tf_ms
+        if any(g['start'] <= start and end <= g['end'] for g in gaps + out):
             continue
+        out.append({'start': int(start), 'end': int(end), 'missing': int((b - a) // tf_ms + 1)})
+    return out
+
+
+async def _fill_oi_gaps(exchange, symbol, timeframe, store, max_in_flight=8, budget=None):
+    """
+    补 OI 存储里记录的缺口 (与 data_download.fill_gaps 对 K线 的做法相同):
+    重新下载缺口那一段，仍然报错的缺口留到下次；交易所本身没有数据的部分标记为 confirmed
+    """
+    tf_ms = store.meta.get('timeframe_ms') or exchange.parse_timeframe(timeframe) * 1000
+    remaining = []
+    for gap in store.gaps:
+        if gap.get('confirmed'):
+            remaining.append(gap)
+            continue
+
+        print(f"🩹 [OI] 补缺口: {pd.to_datetime(gap['start'], unit='ms')} ~ {pd.to_datetime(gap['end'], unit='ms')}")
+        failed = []
+        data = await fetch_oi_concurrent(exchange, symbol, timeframe, gap['start'] + tf_ms, gap['end'] - tf_ms,
+                                         max_in_flight=max_in_flight, budget=budget, failed=failed)
+        if data is not None:
+            store.merge(data)
+        if failed:
+            print(f"⚠️ [OI] 补缺口失败 {len(failed)} 段，下次再试")
+            remaining.extend(_failed_gaps(failed, [], tf_ms))
+        # 补完后重新扫描这一段，交易所也没有的部分标记为 confirmed
+        for rest in store.find_gaps(tf_ms, gap['start'], gap['end']):
+            if not any(f['start'] < rest['end'] and rest['start'] < f['end'] for f in remaining if not f.get('confirmed')):
+                rest['confirmed'] = True
+                remaining.append(rest)
+
+    store.set_gaps(remaining)
+    left = [g for g in remaining if not g.get('confirmed')]
+    if left:
+        print(f"⚠️ [OI] 仍有 {len(left)} 个缺口未补上，下次再试")
+    return store
+
+
+def fill_oi_gaps(symbol, timeframe, oi_store_path=None, exchange=None, max_in_flight=8, weight_per_minute=1200):
+    """只补 OI 存储 meta.json 里记录的缺口 (下载时请求失败的分段)"""
+    store = KlineStore(oi_store_path or oi_store_path_for(symbol, timeframe))
+    if store.meta is None:
+        print("❌ 本地 OI 存储不存在，请先运行 fetch_binance_futures_data_with_oi")
+        return store
+
+    async def runner():
+        ex = exchange or create_async_exchange()
+        try:
+            return await _fill_oi_gaps(ex, symbol, timeframe, store, max_in_flight, WeightBudget(weight_per_minute))
+        finally:
+            if exchange is None:
+                await ex.close()
+
+    return asyncio.run(runner())
+
+
+# =================================================================
+# 对齐: 向量化 as-of 合并
+# =================================================================
+def asof_merge(ts, oi_ts, oi_values, tolerance_ms=0):
+    """
+    给每根K线找「时间 <= K线时间」的最近一条 OI (二分查找，一次算完整个数组)
+    时间差超过 tolerance_ms 的视为缺失 (NaN)
+    tolerance_ms=0 表示只接受时间戳完全一致的 OI
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    out = np.full(len(ts), np.nan)
+    if len(oi_ts) == 0:
+        return out
+    idx = np.searchsorted(oi_ts, ts, side='right') - 1
+    safe = np.maximum(idx, 0)
+    hit = (idx >= 0) & (ts - oi_ts[safe] <= tolerance_ms)
+    out[hit] = np.asarray(oi_values)[safe[hit]]
+    return out
+
+
+def load_with_oi(symbol, timeframe, start_str=None, end_str=None, tolerance_ms=0,
+                 store_path=None, oi_store_path=None):
+    """
+    从本地两个存储读出K线和 OI，对齐后返回 DataFrame
+    列: Timestamp, Open, High, Low, Close, Volume, OpenInterest (datetime 为索引，与老版 CSV 一致)
+    """
+    klines = KlineStore(store_path or store_path_for(symbol, timeframe))
+    oi = KlineStore(oi_store_path or oi_store_path_for(symbol, timeframe))
 
-    # === E. 保存数据 ===
-    if len(all_data) > 0:
-        # 定义列名，新增 'OpenInterest'
-        columns = ['Timestamp', 'Open', 'High', 'Low', 'Close', 'Volume', 'OpenInterest']
-        df = pd.DataFrame(all_data, columns=columns)
-        
-        df['datetime'] = pd.to_datetime(df['Timestamp'], unit='ms')
-        df.set_index('datetime', inplace=True)
-        
-        # 处理可能缺失的 OI 数据 (可选：向前填充 ffill)
-        # df['OpenInterest'] = df['OpenInterest'].fillna(method='ffill') 
-        
+    bars = klines.load(start_str, end_str)
+    ts = bars[TIME_COLUMN].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    oi_data = oi.load()
+    oi_ts = oi_data[TIME_COLUMN].to_numpy().astype('datetime64[ms]').astype(np.int64)
+
+    df = pd.DataFrame({'Timestamp': ts})
+    for name in OHLCV_COLUMNS:
+        df[name.capitalize()] = bars[name].to_numpy()
+    df['OpenInterest'] = asof_merge(ts, oi_ts, oi_data['open_interest'].to_numpy(), tolerance_ms)
+
+    df['datetime'] = pd.to_datetime(df['Timestamp'], unit='ms')
+    df.set_index('datetime', inplace=True)
+    return df
+
+
+# =================================================================
+# 下载: K线和 OI 两条线同时跑，各自写进自己的存储
+# =================================================================
+async def _sync_series(name, store, fetch, since, end_timestamp, tf_ms, window_ms):
+    """按窗口推进，把 [since, end_timestamp] 的数据追加进 store (中断后从末尾续传)"""
+    tail = store.tail_timestamp()
+    if tail is not None:
+        since = max(since, tail + tf_ms)
+    gaps = list(store.gaps)
+    while since <= end_timestamp:
+        window_end = min(since + window_ms - tf_ms, end_timestamp)
+        data = await fetch(since, window_end)
+        if data is not None:
+            gaps.extend(_new_gaps(tail, data[TIME_COLUMN], tf_ms))
+            store.append(data)
+            if gaps != store.gaps:
+                store.set_gaps(gaps)
+            tail = int(data[TIME_COLUMN][-1])
+
+        current_date = datetime.fromtimestamp(window_end / 1000).strftime('%Y-%m-%d %H:%M')
+        print(f"[{name}] 已下载至: {current_date} | 本地累计: {store.rows} 行")
+        since = window_end + tf_ms
+
+
+async def _download_with_oi(symbol, timeframe, start_str, end_str, exchange, store_path, oi_store_path,
+                            max_in_flight, weight_per_minute, window_chunks):
+    tf_ms = exchange.parse_timeframe(timeframe) * 1000
+    info = dict(symbol=symbol, timeframe=timeframe, timeframe_ms=tf_ms)
+    kline_store = KlineStore(store_path).create(**info)
+    oi_store = KlineStore(oi_store_path).create(columns=OI_COLUMNS, **info)
+
+    # 只下载已收盘的K线
+    last_closed = exchange.milliseconds() - tf_ms
+    end_timestamp = min(exchange.parse8601(end_str), last_closed) if end_str else last_closed
+    since = exchange.parse8601(start_str)
+
+    # 两条线共用一个权重令牌桶，避免合起来超限
+    budget = WeightBudget(weight_per_minute)
+
+    async def fetch_klines(a, b):
+        return await fetch_ohlcv_concurrent(exchange, symbol, timeframe, a, b,
+                                            max_in_flight=max_in_flight, budget=budget)
+
+    # 重试用完仍失败的 OI 分段先记下来，不影响后面的窗口继续下载
+    oi_failed = []
+
+    async def fetch_oi(a, b):
+        return await fetch_oi_concurrent(exchange, symbol, timeframe, a, b,
+                                         max_in_flight=max_in_flight, budget=budget, failed=oi_failed)
+
+    await asyncio.gather(
+        _sync_series('K线', kline_store, fetch_klines, since, end_timestamp, tf_ms, window_chunks * 1000 * tf_ms),
+        _sync_series('OI', oi_store, fetch_oi, since, end_timestamp, tf_ms, window_chunks * OI_LIMIT * tf_ms),
+    )
+
+    # 失败的分段记进 OI 存储的缺口 (中间的洞 _sync_series 已经记过)，然后补一遍
+    # 这次还补不上的留在 meta.json 里，下次运行或 fill_oi_gaps() 再补
+    if oi_failed:
+        oi_store.set_gaps(oi_store.gaps + _failed_gaps(oi_failed, oi_store.gaps, tf_ms))
+    if any(not g.get('confirmed') for g in oi_store.gaps):
+        await _fill_oi_gaps(exchange, symbol, timeframe, oi_store, max_in_flight, budget)
+    return end_timestamp
+
+
+def fetch_binance_futures_data_with_oi(symbol, timeframe, start_str, end_str, tolerance_ms=0,
+                                       exchange=None, max_in_flight=8, weight_per_minute=1200,
+                                       window_chunks=16, save=True):
+    """
+    下载 K线 + 持仓量，对齐后保存为 CSV
+    - K线和 OI 同时并发下载，分别存进两个本地存储 (可续传，再次运行只下新的部分)
+    - 对齐用向量化 as-of 合并: 每根K线取「不晚于它」的最近一条 OI，
+      时间差超过 tolerance_ms 的留空 (默认 0 = 时间戳必须完全一致)
+    exchange 需要是异步接口 (ccxt.async_support 或 sim_exchange.AsyncSimExchange)
+    """
+    store_path = store_path_for(symbol, timeframe)
+    oi_store_path = oi_store_path_for(symbol, timeframe)
+
+    print(f"--- 开始下载 [U本位合约] {symbol} [{timeframe}] (含OI数据) | 并发: {max_in_flight} ---")
+
+    async def runner():
+        ex = exchange or create_async_exchange()
+        try:
+            return await _download_with_oi(symbol, timeframe, start_str, end_str, ex, store_path, oi_store_path,
+                                           max_in_flight, weight_per_minute, window_chunks)
+        finally:
+            if exchange is None:
+                await ex.close()
+
+    end_timestamp = asyncio.run(runner())
+
+    # === 对齐与合并 ===
+    df = load_with_oi(symbol, timeframe, start_str, pd.to_datetime(end_timestamp, unit='ms'), tolerance_ms,
+                      store_path, oi_store_path)
+    if len(df) == 0:
+        print("无数据下载")
+        return df
+
+    missing = int(df['OpenInterest'].isna().sum())
+    print(f"对齐完成: {len(df)} 行 | 缺少OI: {missing} 行 | 最新OI: {df['OpenInterest'].iloc[-1]}")
+
+    # 处理可能缺失的 OI 数据 (可选：向前填充 ffill，或者调大 tolerance_ms)
+    # df['OpenInterest'] = df['OpenInterest'].ffill()
+
+    if save:
         filename = f"FUTURES_OI_{symbol.replace('/', '')}_{timeframe}_{start_str[:4]}.csv"
         df.to_csv(filename)
         print(f"\n下载完成！保存为: {filename}")
         print(f"数据预览:\n{df.tail(3)}")
-    else:
-        print("无数据下载")
+    return df
 
 if __name__ == "__main__":
     SYMBOL = 'BTC/USDT'
     TIMEFRAME = '5m'
-    
+
     # 注意：Binance 的 OI 历史数据可能不如 K线数据久远
     # 2021年之前的数据可能会有缺失，属于正常现象
     START = '2026-01-01 00:00:00'
     END =   '2026-01-05 00:00:00' # 测试小范围，跑通了再改大
 
-    fetch_binance_futures_data_with_oi(SYMBOL, TIMEFRAME, START, END)
\ No newline at end of file
+    # tolerance_ms: OI 时间戳和K线对不上时，允许向前借用多久以内的 OI (毫秒)
+    # 例如 5 * 60 * 1000 表示最多用上一根K线时刻的 OI
+    fetch_binance_futures_data_with_oi(SYMBOL, TIMEFRAME, START, END, tolerance_ms=0)
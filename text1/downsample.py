@@ -0,0 +1,153 @@
+# 文件名: downsample.py
+# 资金曲线降采样 (回测报告用)
+#
+# 6 年的 5m 资金曲线有 60 多万个点，全部塞进 Plotly 报告会让 HTML 几十 MB、浏览器卡顿。
+# 这里按“形状不变”的方式抽点:
+# - lttb:    Largest-Triangle-Three-Buckets，每个桶保留与前后点围成三角形面积最大的点，
+#            用很少的点就能还原曲线的视觉形状 (总览图用)
+# - minmax:  每个桶保留最高点和最低点，回撤尖峰一个都不会丢，纯数组运算 (放大级别用)
+#
+# build_levels 生成由粗到细的几级数据 (每级点数约为上一级的 4 倍)，以 base64 嵌入报告；
+# ZOOM_SCRIPT 在浏览器里监听缩放，按可见范围挑一级点数够用的数据替换曲线。
+import base64
+
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标 (升序)
+    首尾两点一定保留，中间 n_out - 2 个桶各取一个点
+    """
+    n = len(y)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+    a = 0
+    for k in range(n_out - 2):
+        lo, hi = edges[k], edges[k + 1]
+        # 下一个桶的平均点 (最后一个桶的“下一个”就是终点)
+        nlo, nhi = hi, edges[k + 2] if k + 2 < len(edges) else n
+        cx = x[nlo:nhi].mean()
+        cy = y[nlo:nhi].mean()
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(np.argmax(area))
+        out[k + 1] = a
+    return out
+
+
+def minmax(y, n_out):
+    """
+    分桶取最高/最低点降采样，返回保留点的下标 (升序)，约 n_out 个点
+    桶大小相同，整块 reshape 后一次 argmin/argmax
+    """
+    n = len(y)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    size = -(-n // max(n_out // 2, 1))
+    full = n // size
+    body = y[:full * size].reshape(full, size)
+    offsets = np.arange(full) * size
+    parts = [[0, n - 1], offsets + body.argmin(axis=1), offsets + body.argmax(axis=1)]
+    if full * size < n:
+        tail = y[full * size:]
+        parts.append([full * size + int(tail.argmin()), full * size + int(tail.argmax())])
+    return np.unique(np.concatenate([np.asarray(p, dtype=np.int64) for p in parts]))
+
+
+def _b64(values, dtype):
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode('ascii')
+
+
+def build_levels(x_ms, y, target=4000, detail_points=100000):
+    """
+    由粗到细的多级降采样数据 (嵌入报告的 layout.meta，供 ZOOM_SCRIPT 使用)
+    x_ms: 毫秒时间戳；target: 每一级在可见范围内希望显示的点数
+    第 0 级是整条曲线的 LTTB 总览，之后每级点数 ×4 (min/max 分桶)，
+    点数不超过 detail_points 时最后一级直接用原始数据
+    返回 (总览下标, [{'x': base64 float64, 'y': base64 float32, 'n': 点数}, ...])
+    """
+    n = len(y)
+    overview = lttb(x_ms, y, target)
+    levels = [overview]
+    points = target * 4
+    while points < n and points <= detail_points:
+        levels.append(minmax(y, points))
+        points *= 4
+    if n <= detail_points and len(levels[-1]) < n:
+        levels.append(np.arange(n))
+
+    x_ms = np.asarray(x_ms, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    encoded = [{'x': _b64(x_ms[idx], np.float64), 'y': _b64(y[idx], np.float32), 'n': int(len(idx))}
+               for idx in levels]
+    return overview, encoded
+
+
+# 浏览器端: 缩放时按可见范围挑一级数据替换第一条曲线 (资金曲线)
+# {plot_id} 由 plotly 的 write_html(post_script=...) 替换成图表 div 的 id
+ZOOM_SCRIPT = """
+(function () {
+  var gd = document.getElementById('{plot_id}');
+  var meta = gd.layout.meta || {};
+  if (!meta.equity_levels) { return; }
+  function decode(s, T) {
+    var b = atob(s), u = new Uint8Array(b.length);
+    for (var i = 0; i < b.length; i++) { u[i] = b.charCodeAt(i); }
+    return new T(u.buffer);
+  }
+  function toMs(v) {
+    if (typeof v === 'number') { return v; }
+    v = String(v).replace(' ', 'T');
+    if (v.length === 10) { v += 'T00:00'; }
+    return Date.parse(v + 'Z');
+  }
+  function lower(a, v) {
+    var lo = 0, hi = a.length;
+    while (lo < hi) { var m = (lo + hi) >> 1; if (a[m] < v) { lo = m + 1; } else { hi = m; } }
+    return lo;
+  }
+  var levels = meta.equity_levels.map(function (l) {
+    return {x: decode(l.x, Float64Array), y: decode(l.y, Float32Array)};
+  });
+  var target = meta.equity_target;
+
+  function show(k, a, b) {
+    var lv = levels[k];
+    Plotly.restyle(gd, {x: [Array.from(lv.x.subarray(a, b))], y: [Array.from(lv.y.subarray(a, b))]}, [0]);
+  }
+
+  gd.on('plotly_relayout', function (ev) {
+    var r0, r1, auto = false;
+    Object.keys(ev).forEach(function (key) {
+      if (/^xaxis\\d*\\.autorange$/.test(key)) { auto = true; }
+      else if (/^xaxis\\d*\\.range\\[0\\]$/.test(key)) { r0 = ev[key]; }
+      else if (/^xaxis\\d*\\.range\\[1\\]$/.test(key)) { r1 = ev[key]; }
+      else if (/^xaxis\\d*\\.range$/.test(key)) { r0 = ev[key][0]; r1 = ev[key][1]; }
+    });
+    if (auto) {
+      show(0, 0, levels[0].x.length);
+      return;
+    }
+    if (r0 === undefined || r1 === undefined) { return; }
+    var t0 = toMs(r0), t1 = toMs(r1), k = 0, a = 0, b = 0;
+    for (k = 0; k < levels.length; k++) {
+      a = lower(levels[k].x, t0);
+      b = lower(levels[k].x, t1);
+      if (b - a >= target || k === levels.length - 1) { break; }
+    }
+    // 多取两端各一个点，曲线延伸到可见范围之外
+    show(k, Math.max(a - 1, 0), Math.min(b + 1, levels[k].x.length));
+  });
+})();
+"""
@@ -1,18 +1,31 @@
+import math
 import ccxt
 import pandas as pd
 import time
 
 class BinanceDriver:
-    def __init__(self, config):
+    # 行情数据里的最新价超过这么多秒没有更新，下单前才重新请求 ticker
+    PRICE_MAX_AGE = 60
+
+    def __init__(self, config, exchange=None):
+        """
+        exchange: 不传则连接币安；也可以传入 sim_exchange.SimExchange 离线测试/压测整个下单流程
+        """
         self.cfg = config
-        self.exchange = ccxt.binance({
+        self.rules = {}         # 交易对 -> 精度/步长/最小下单量 (来自 load_markets)
+        self.leverage = {}      # 交易对 -> 已设置的杠杆
+        self.margin_mode = {}   # 交易对 -> 已设置的保证金模式
+        self.prepared = set()   # 杠杆/保证金模式都已设置成功的交易对 (没成功的交易对不下单)
+        self.last_price = {}    # 交易对 -> (最新价, 更新时间)
+        self.latencies = []     # 每笔订单 信号 -> 交易所确认 的延迟记录
+        self.exchange = exchange or ccxt.binance({
             'apiKey': config.API_KEY,
             'secret': config.SECRET,
             'enableRateLimit': True,
             'options': {'defaultType': 'future'} # 默认做合约
         })
         
-        if config.SANDBOX_MODE:
+        if config.SANDBOX_MODE and exchange is None:
             self.exchange.set_sandbox_mode(True)
             print("⚠️ 警告：当前处于测试网 (Testnet) 模式")
 
@@ -32,7 +45,11 @@ class BinanceDriver:
                     print("❌ 多次连接失败，程序即将退出。请检查网络/代理或配置。")
                     raise e # 如果试了5次还不行，就只能让它报错停止了
                 
-        # =========================================================
+        # 精度规则在这里一次算好；杠杆/保证金模式只在允许交易时才去改 (启动时做，不在下单路径上)
+        self._load_market_rules(config.SYMBOL)
+        if getattr(config, 'ENABLE_TRADING', False):
+            if not self.prepare_symbol(config.SYMBOL):
+                print(f"⚠️ {config.SYMBOL} 杠杆/保证金模式没有设置成功，设置成功之前不会下单")
 
     def get_usdt_balance(self):
         """查询账户里的 USDT 余额"""
@@ -43,47 +60,147 @@ class BinanceDriver:
             print(f"❌ 获取余额失败: {e}")
             return 0
 
-    def execute_order(self, side):
+    # =========================================================
+    # 下单前的准备工作 (不在下单的关键路径上)
+    # =========================================================
+    def _load_market_rules(self, symbol):
+        """
+        从 load_markets 的结果里预先算好精度/步长/最小下单量，
+        下单时直接用，不再每次调用 amount_to_precision
+        """
+        market = self.exchange.market(symbol)
+        limits = market.get('limits') or {}
+        step = float(market['precision']['amount'])
+        if self.exchange.precisionMode != ccxt.TICK_SIZE:
+            # 精度以小数位数表示 (如 3)，换算成步长 0.001
+            step = 10.0 ** -step
+        self.rules[symbol] = {
+            'step': step,
+            'decimals': max(0, -int(math.floor(math.log10(step) + 1e-9))),
+            'min_amount': (limits.get('amount') or {}).get('min') or 0.0,
+            'min_cost': (limits.get('cost') or {}).get('min') or 0.0,
+        }
+        return self.rules[symbol]
+
+    def prepare_symbol(self, symbol):
+        """
+        设置杠杆和保证金模式，每个交易对只做一次，结果缓存起来
+        (原来每次下单前都要 set_leverage 一次，多一次往返)
+        全部成功才记入 prepared，返回是否成功 (启动时失败的，execute_order 会先重试一次)
+        """
+        leverage = self.cfg.LEVERAGE
+        if self.leverage.get(symbol) != leverage:
+            try:
+                self.exchange.set_leverage(leverage, symbol)
+                self.leverage[symbol] = leverage
+                print(f"⚙️ {symbol} 杠杆已设置为 {leverage} 倍")
+            except Exception as e:
+                print(f"⚠️ 设置杠杆失败: {e}")
+                return False
+
+        mode = getattr(self.cfg, 'MARGIN_MODE', None)
+        if mode and self.margin_mode.get(symbol) != mode:
+            try:
+                self.exchange.set_margin_mode(mode, symbol)
+            except Exception as e:
+                # 币安在模式没有变化时也会报错 (No need to change margin type)，视为已设置
+                if 'No need to change' not in str(e):
+                    print(f"⚠️ 设置保证金模式失败: {e}")
+                    return False
+            self.margin_mode[symbol] = mode
+            print(f"⚙️ {symbol} 保证金模式: {mode}")
+
+        self.prepared.add(symbol)
+        return True
+
+    def update_price(self, price, symbol=None):
+        """由行情数据 (轮询或推送) 喂入最新价，下单时直接用，不再调用 fetch_ticker"""
+        self.last_price[symbol or self.cfg.SYMBOL] = (float(price), time.time())
+
+    def _price(self, symbol):
+        """最新价：行情数据里的价格足够新就直接用，否则才请求一次 ticker"""
+        cached = self.last_price.get(symbol)
+        if cached is not None and time.time() - cached[1] <= self.PRICE_MAX_AGE:
+            return cached[0]
+        price = self.exchange.fetch_ticker(symbol)['last']
+        self.update_price(price, symbol)
+        return price
+
+    def _amount(self, symbol, raw_amount):
+        """按预先算好的步长向下取整，返回字符串 (与 amount_to_precision 相同)，不够最小下单量返回 None"""
+        rule = self.rules.get(symbol) or self._load_market_rules(symbol)
+        amount = math.floor(raw_amount / rule['step'] + 1e-9) * rule['step']
+        if amount <= 0 or amount < rule['min_amount']:
+            return None
+        return f"{amount:.{rule['decimals']}f}"
+
+    def execute_order(self, side, signal_time=None):
         """
         执行下单
         side: 'buy' 或 'sell'
+        signal_time: 信号产生时的 time.perf_counter()，用来统计 信号 -> 交易所确认 的延迟
+                     (不传则从进入本函数开始计时)
+
+        关键路径上只有 create_order 一次请求:
+        价格来自行情数据 (update_price)，精度和杠杆在启动时已经准备好
+        杠杆/保证金模式没设置成功时不下单 (否则会按账户上原来的杠杆成交)
         """
+        if signal_time is None:
+            signal_time = time.perf_counter()
         if not getattr(self.cfg, 'ENABLE_TRADING', False):
             print(f"🛡️ [安全模式] 触发 {side} 信号，但 ENABLE_TRADING = False，已拦截。")
             return None
-        
+
         symbol = self.cfg.SYMBOL
         amount_usdt = self.cfg.QUANTITY_USDT
 
         try:
-            # 1. 获取当前价格
-            ticker = self.exchange.fetch_ticker(symbol)
-            price = ticker['last']
-
-            # 2. 计算购买数量 (USDT / 价格)
-            raw_amount = amount_usdt / price
-
-            # 3. 精度修正 (关键步骤：防止小数位报错)
-            amount = self.exchange.amount_to_precision(symbol, raw_amount)
+            # 只有启动时设置失败才会走到这里重试
+            if symbol not in self.prepared and not self.prepare_symbol(symbol):
+                print(f"❌ 下单失败: {symbol} 的杠杆/保证金模式没有设置成功，已放弃本次 {side} 信号")
+                return None
 
-            # 4. 设置杠杆
-            try:
-                self.exchange.set_leverage(self.cfg.LEVERAGE, symbol)
-            except:
-                pass 
+            # 1. 数量 = USDT / 最新价，按步长取整
+            price = self._price(symbol)
+            amount = self._amount(symbol, amount_usdt / price)
+            if amount is None or float(amount) * price < self.rules[symbol]['min_cost']:
+                print(f"❌ 下单失败: {amount_usdt} U 不够 {symbol} 的最小下单量")
+                return None
 
             print(f"🚀 正在下单: {side} {amount} 个 {symbol} (约 {amount_usdt} U)")
 
-            # 5. 发送市价单
+            # 2. 发送市价单
+            sent = time.perf_counter()
             order = self.exchange.create_order(
                 symbol=symbol,
                 type='market',
                 side=side,
                 amount=amount
             )
-            print(f"✅ 下单成功！订单ID: {order['id']}")
+            acked = time.perf_counter()
+            self.latencies.append({
+                'time': time.time(), 'side': side, 'amount': float(amount), 'price': price,
+                'signal_ms': (acked - signal_time) * 1000, 'request_ms': (acked - sent) * 1000,
+            })
+            print(f"✅ 下单成功！订单ID: {order['id']} "
+                  f"(信号->确认 {(acked - signal_time) * 1000:.1f} ms，其中请求 {(acked - sent) * 1000:.1f} ms)")
             return order
 
         except Exception as e:
             print(f"❌ 下单失败: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def latency_summary(self):
+        """所有订单 信号->确认 延迟的统计 (毫秒)"""
+        if not self.latencies:
+            return {}
+        signal_ms = sorted(x['signal_ms'] for x in self.latencies)
+        request_ms = sorted(x['request_ms'] for x in self.latencies)
+        pick = lambda xs, q: xs[min(len(xs) - 1, int(q * len(xs)))]
+        return {
+            'orders': len(signal_ms),
+            'p50_ms': pick(signal_ms, 0.5),
+            'p95_ms': pick(signal_ms, 0.95),
+            'max_ms': signal_ms[-1],
+            'request_p50_ms': pick(request_ms, 0.5),
+        }
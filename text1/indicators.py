@@ -0,0 +1,305 @@
+# 文件名: indicators.py
+# 指标模块 (回测和实盘共用)
+#
+# 两种用法:
+#   1. 整段计算 (回测): sma() / rsi() / add_ma_columns()，结果与 pandas rolling/ewm 完全相同
+#   2. 逐根K线增量计算 (实盘): SMA / EMA / RSI 对象，每来一根K线 O(1) 更新，
+#      支持修正“还没收盘的最后一根”，也可以用历史数组预热
+#
+# 增量对象的约定:
+#   add(x)    新增一根K线
+#   revise(x) 修改最后一根K线 (未收盘K线价格变化时调用)
+#   value     最后一根K线对应的指标值 (数据不足时为 nan)
+#   prev_value 倒数第二根K线对应的指标值
+import math
+
+import numpy as np
+import pandas as pd
+
+NAN = float('nan')
+
+
+# =================================================================
+# 整段计算 (向量化)
+# =================================================================
+def sma(values, period):
+    """简单移动平均，等价于 pd.Series(values).rolling(period).mean()"""
+    return pd.Series(values, dtype='float64').rolling(period).mean().to_numpy()
+
+
+def rsi(values, period=14):
+    """RSI (Wilder 平滑)，与 backtest.calculate_rsi 的算法一致"""
+    close = pd.Series(values, dtype='float64')
+    delta = close.diff()
+    gain = (delta.where(delta > 0, 0)).fillna(0)
+    loss = (-delta.where(delta < 0, 0)).fillna(0)
+
+    avg_gain = gain.ewm(com=period-1, min_periods=period).mean()
+    avg_loss = loss.ewm(com=period-1, min_periods=period).mean()
+
+    rs = avg_gain / avg_loss
+    return (100 - (100 / (1 + rs))).to_numpy()
+
+
+def add_ma_columns(df, periods=(31, 128, 373), column='close', overwrite=False):
+    """
+    给 DataFrame 加上 ma31 / ma128 / ma373 等均线列
+    overwrite=False 时已经存在的列直接复用 (同一份数据反复回测时不用重复计算)
+    """
+    close = pd.to_numeric(df[column])
+    for period in periods:
+        name = f"ma{period}"
+        if overwrite or name not in df.columns:
+            df[name] = close.rolling(period).mean()
+    return df
+
+
+# =================================================================
+# 逐根增量计算
+# =================================================================
+class SMA:
+    """简单移动平均：环形缓冲区 + 滚动求和，每根K线 O(1)"""
+
+    # 每新增这么多根K线就重新求一次和，防止浮点误差长期累积
+    RESYNC_EVERY = 4096
+
+    def __init__(self, period):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self.buf = [0.0] * self.period
+        self.pos = -1          # 最后一根K线在环形缓冲区里的位置
+        self.count = 0         # 已经收到的K线数量
+        self.total = 0.0
+        self.value = NAN
+        self.prev_value = NAN
+        self._since_resync = 0
+
+    @property
+    def ready(self):
+        return self.count >= self.period
+
+    def _calc(self):
+        return self.total / self.period if self.count >= self.period else NAN
+
+    def add(self, x):
+        x = float(x)
+        self.pos = (self.pos + 1) % self.period
+        if self.count >= self.period:
+            self.total -= self.buf[self.pos]
+        self.buf[self.pos] = x
+        self.total += x
+        self.count += 1
+
+        self._since_resync += 1
+        if self._since_resync >= self.RESYNC_EVERY:
+            self.total = math.fsum(self.buf[:min(self.count, self.period)])
+            self._since_resync = 0
+
+        self.prev_value = self.value
+        self.value = self._calc()
+        return self.value
+
+    def revise(self, x):
+        if self.count == 0:
+            return self.add(x)
+        x = float(x)
+        self.total += x - self.buf[self.pos]
+        self.buf[self.pos] = x
+        self.value = self._calc()
+        return self.value
+
+    def warmup(self, values):
+        """用历史数组一次性预热 (向量化，不逐根循环)"""
+        values = np.asarray(values, dtype=np.float64)
+        self.reset()
+        if len(values) == 0:
+            return self.value
+        window = values[-self.period:]
+        self.buf = window.tolist() + [0.0] * (self.period - len(window))
+        self.pos = len(window) - 1
+        self.count = len(values)
+        self.total = math.fsum(self.buf[:len(window)])
+        self.value = self._calc()
+        if len(values) > self.period:
+            self.prev_value = math.fsum(values[-self.period-1:-1]) / self.period
+        return self.value
+
+
+class EMA:
+    """
+    指数移动平均，与 pandas ewm(...).mean() 一致
+    adjust=True  对应 pandas 默认 (加权平均形式)
+    adjust=False 对应递推形式 y = a*x + (1-a)*y_prev
+    """
+
+    def __init__(self, span=None, alpha=None, com=None, adjust=True, min_periods=0):
+        if alpha is None:
+            if span is not None:
+                alpha = 2.0 / (span + 1)
+            elif com is not None:
+                alpha = 1.0 / (com + 1)
+            else:
+                raise ValueError("EMA 需要 span / alpha / com 其中之一")
+        self.alpha = alpha
+        self.adjust = adjust
+        self.min_periods = max(min_periods, 1)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.num = 0.0         # adjust=True: 加权和; adjust=False: 当前值
+        self.den = 0.0         # adjust=True: 权重和
+        self._prev_state = (0, 0.0, 0.0)  # 最后一根K线加入之前的状态 (用于修正)
+        self.value = NAN
+        self.prev_value = NAN
+
+    @property
+    def ready(self):
+        return self.count >= self.min_periods
+
+    def _apply(self, x):
+        count, num, den = self._prev_state
+        if self.adjust:
+            decay = 1.0 - self.alpha
+            self.num = x + decay * num
+            self.den = 1.0 + decay * den
+        else:
+            self.num = x if count == 0 else self.alpha * x + (1.0 - self.alpha) * num
+        self.count = count + 1
+        if self.count < self.min_periods:
+            return NAN
+        return self.num / self.den if self.adjust else self.num
+
+    def add(self, x):
+        self._prev_state = (self.count, self.num, self.den)
+        self.prev_value = self.value
+        self.value = self._apply(float(x))
+        return self.value
+
+    def revise(self, x):
+        if self.count == 0:
+            return self.add(x)
+        self.value = self._apply(float(x))
+        return self.value
+
+    def warmup(self, values):
+        self.reset()
+        for x in values:
+            self.add(x)
+        return self.value
+
+
+class RSI:
+    """RSI (Wilder 平滑)，与 backtest.calculate_rsi 一致"""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self.avg_gain = EMA(com=self.period - 1, min_periods=self.period)
+        self.avg_loss = EMA(com=self.period - 1, min_periods=self.period)
+        self.last_close = None   # 最后一根K线的收盘价
+        self.prev_close = None   # 倒数第二根K线的收盘价 (修正最后一根时用)
+        self.value = NAN
+        self.prev_value = NAN
+
+    @property
+    def ready(self):
+        return self.avg_gain.ready
+
+    @staticmethod
+    def _split(delta):
+        return (delta if delta > 0 else 0.0), (-delta if delta < 0 else 0.0)
+
+    def _calc(self):
+        g, l = self.avg_gain.value, self.avg_loss.value
+        if math.isnan(g) or math.isnan(l):
+            return NAN
+        if l == 0:
+            return 100.0 if g > 0 else NAN
+        return 100 - (100 / (1 + g / l))
+
+    def add(self, x):
+        x = float(x)
+        # 第一根K线没有涨跌，按 0 处理 (与 pandas diff().fillna(0) 一致)
+        delta = 0.0 if self.last_close is None else x - self.last_close
+        gain, loss = self._split(delta)
+        self.avg_gain.add(gain)
+        self.avg_loss.add(loss)
+        self.prev_close, self.last_close = self.last_close, x
+        self.prev_value = self.value
+        self.value = self._calc()
+        return self.value
+
+    def revise(self, x):
+        if self.last_close is None:
+            return self.add(x)
+        x = float(x)
+        delta = 0.0 if self.prev_close is None else x - self.prev_close
+        gain, loss = self._split(delta)
+        self.avg_gain.revise(gain)
+        self.avg_loss.revise(loss)
+        self.last_close = x
+        self.value = self._calc()
+        return self.value
+
+    def warmup(self, values):
+        self.reset()
+        for x in values:
+            self.add(x)
+        return self.value
+
+
+class IndicatorFeed:
+    """
+    把一段K线 (时间 + 收盘价) 同步到一组增量指标上，只处理变化的部分:
+    - 最后一根时间没变: 只修正最后一根
+    - 出现新K线: 先把上次那根按最终收盘价修正，再逐根加入新K线
+    - 数据对不上 (第一次运行 / 断线太久 / 时间倒退): 用整段历史重新预热
+
+    用法:
+        feed = IndicatorFeed(ma31=SMA(31), ma128=SMA(128))
+        is_new_bar = feed.sync(df['time'], df['close'])
+        feed['ma31'].value
+    """
+
+    def __init__(self, **indicators):
+        self.indicators = indicators
+        self.last_time = None
+
+    def __getitem__(self, name):
+        return self.indicators[name]
+
+    def reset(self):
+        for ind in self.indicators.values():
+            ind.reset()
+        self.last_time = None
+
+    def sync(self, times, closes):
+        """返回 True 表示出现了新K线 (或重新预热)，False 表示只是最后一根的价格变了"""
+        times = pd.to_datetime(pd.Series(times)).to_numpy()
+        closes = np.asarray(pd.to_numeric(pd.Series(closes)), dtype=np.float64)
+        if len(times) == 0:
+            return False
+
+        pos = -1
+        if self.last_time is not None:
+            pos = int(np.searchsorted(times, self.last_time))
+            if pos >= len(times) or times[pos] != self.last_time:
+                pos = -1
+
+        if pos < 0:
+            for ind in self.indicators.values():
+                ind.warmup(closes)
+            self.last_time = times[-1]
+            return True
+
+        for ind in self.indicators.values():
+            ind.revise(closes[pos])
+            for x in closes[pos + 1:]:
+                ind.add(x)
+        self.last_time = times[-1]
+        return pos + 1 < len(times)
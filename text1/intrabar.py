@@ -0,0 +1,102 @@
+# 文件名: intrabar.py
+# K线内部的先后顺序判定 (用 1 分钟K线)
+#
+# 回测引擎在一根 5m K线里同时碰到止损价和止盈价时，不知道哪个先发生，
+# 一律按“先止损”记账，结果偏保守。高精度模式下，只有这种“两边都碰到”的K线
+# 才去查对应时间段的 1m K线，按分钟顺序找出先触发的是哪一边；
+# 其余K线仍按 5m 处理，额外开销只和这种K线的数量有关。
+#
+# 1m 数据直接用 np.memmap 映射本地存储 (data_download.py 的 .store 目录，
+# 或 CSV 的 .cache 缓存)，查找时二分定位，不需要把整段 1m 数据读进内存。
+import numpy as np
+import pandas as pd
+
+from kline_store import KlineStore, TIME_COLUMN, is_store, cache_path_for
+
+
+class SubBars:
+    def __init__(self, path):
+        """
+        path: 1m K线的 .store 目录或 CSV 文件 (CSV 第一次使用时会自动建立二进制缓存)
+        缓存不认识的 CSV 格式 (例如 timestamp 列是日期字符串) 和 load_from_csv 一样直接读进内存
+        """
+        self.path = path
+        self.lookups = 0      # 查询次数 (= 被判定的K线数)
+        self.misses = 0       # 找不到 1m 数据、退回默认规则的次数
+
+        if not is_store(path):
+            store = KlineStore(cache_path_for(path))
+            if not store.is_fresh(path):
+                print(f"🗜️ 正在建立 1m 数据的二进制缓存 (只需一次): {store.path}")
+                store.build_from_csv(path)
+            if not store.cacheable:
+                print("⚠️ 这个 1m CSV 的格式无法建立缓存，改为直接读取")
+                self._load_csv(path)
+                return
+            path = cache_path_for(path)
+        store = KlineStore(path)
+        if store.rows == 0:
+            raise ValueError(f"1m 数据为空或无法读取: {path}")
+        self.path = path
+        self.time = store._memmap(TIME_COLUMN)
+        self.open = store._memmap('open')
+        self.high = store._memmap('high')
+        self.low = store._memmap('low')
+
+    def _load_csv(self, csv_path):
+        """直接读取 CSV (时间列: datetime 或 timestamp，可以是日期字符串)"""
+        df = pd.read_csv(csv_path)
+        df.columns = [x.lower() for x in df.columns]
+        time_col = 'datetime' if 'datetime' in df.columns else TIME_COLUMN
+        missing = [c for c in (time_col, 'open', 'high', 'low') if c not in df.columns]
+        if missing:
+            raise ValueError(f"1m CSV 格式不认识，缺少列 {missing} (需要 timestamp 或 datetime，以及 open/high/low): {csv_path}")
+        if df.empty:
+            raise ValueError(f"1m 数据为空或无法读取: {csv_path}")
+
+        ts = pd.to_datetime(df[time_col]).to_numpy(dtype='datetime64[ms]').astype(np.int64)
+        order = np.argsort(ts, kind='stable')
+        self.time = ts[order]
+        self.open = df['open'].to_numpy(dtype=np.float64)[order]
+        self.high = df['high'].to_numpy(dtype=np.float64)[order]
+        self.low = df['low'].to_numpy(dtype=np.float64)[order]
+
+    def window(self, start_ms, end_ms):
+        """[start_ms, end_ms) 内的 1m K线 (开, 高, 低) 切片视图"""
+        lo = int(np.searchsorted(self.time, start_ms, side='left'))
+        hi = int(np.searchsorted(self.time, end_ms, side='left'))
+        return self.open[lo:hi], self.high[lo:hi], self.low[lo:hi]
+
+    def resolve_exit(self, otype, sl_price, tp_price, start_ms, end_ms):
+        """
+        按分钟顺序判定一根同时碰到止损和止盈的K线
+        otype: 1 = 多, -1 = 空
+        返回 (平仓原因, 平仓价)，找不到 1m 数据时返回 None (调用方按原规则处理)
+        规则与引擎一致，只是粒度变成 1 分钟:
+        - 分钟开盘价已经越过止损/止盈 -> 按开盘价成交
+        - 同一分钟里两边都碰到 -> 仍按先止损处理
+        """
+        self.lookups += 1
+        o, h, l = self.window(start_ms, end_ms)
+        for k in range(len(o)):
+            mo, mh, ml = float(o[k]), float(h[k]), float(l[k])
+            if otype == 1:
+                if mo <= sl_price:
+                    return "止损", mo
+                if mo >= tp_price:
+                    return "止盈", mo
+                if ml <= sl_price:
+                    return "止损", sl_price
+                if mh >= tp_price:
+                    return "止盈", tp_price
+            else:
+                if mo >= sl_price:
+                    return "止损", mo
+                if mo <= tp_price:
+                    return "止盈", mo
+                if mh >= sl_price:
+                    return "止损", sl_price
+                if ml <= tp_price:
+                    return "止盈", tp_price
+        self.misses += 1
+        return None
@@ -0,0 +1,315 @@
+# 文件名: kline_store.py
+# 本地K线列式存储 (二进制缓存)
+#
+# 目录结构 (每列一个文件，按时间戳升序排列):
+#   xxx.cache/
+#       meta.json        行数 / 列类型 / 源文件大小和修改时间 / 缺口记录
+#                        (格式不认识的 CSV 只写一个 cacheable: false 的 meta，下次不再重复解析)
+#       timestamp.bin    int64 毫秒时间戳
+#       open.bin ...     float64
+#
+# 读取时用 np.memmap 映射文件，按时间范围二分查找后只拷贝需要的那一段，
+# 不需要每次都把整个多年的 CSV 解析一遍。
+#
+# 同一格式也用作下载器的“只追加”存储 (见 data_download.py):
+# 每页数据先追加到各列文件末尾，再更新 meta.json 里的行数，
+# meta.json 记录的行数就是已提交的数据，崩溃后多出来的半页会在下次打开时截掉。
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+TIME_COLUMN = 'timestamp'
+META_FILE = 'meta.json'
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class KlineStore:
+    def __init__(self, path):
+        """path: 存储目录 (不存在时在写入时自动创建)"""
+        self.path = path
+        self.meta = self._read_meta()
+
+    # ------------------------------------------------------------------
+    # 元数据
+    # ------------------------------------------------------------------
+    def _read_meta(self):
+        meta_path = os.path.join(self.path, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, meta):
+        # 先写临时文件再替换，中途崩溃也不会留下半个 meta.json
+        tmp_path = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+        self.meta = meta
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    @property
+    def rows(self):
+        return self.meta['rows'] if self.meta else 0
+
+    @property
+    def columns(self):
+        return list(self.meta['columns'].keys()) if self.meta else []
+
+    @property
+    def cacheable(self):
+        """False 表示源 CSV 的格式不认识 (调用方应直接读 CSV)"""
+        return self.meta.get('cacheable', True) if self.meta else True
+
+    @property
+    def gaps(self):
+        return self.meta.get('gaps', []) if self.meta else []
+
+    def tail_timestamp(self):
+        """最后一根K线的毫秒时间戳，空存储返回 None"""
+        if self.rows == 0:
+            return None
+        return int(self._memmap(TIME_COLUMN)[-1])
+
+    # ------------------------------------------------------------------
+    # 只追加写入 (下载器使用)
+    # ------------------------------------------------------------------
+    def create(self, columns=None, **info):
+        """
+        新建空存储 (已存在则直接返回)
+        columns: 除 timestamp 外的数据列，默认 OHLCV
+        info: 额外写进 meta 的信息，如 symbol / timeframe / timeframe_ms
+        """
+        if self.meta is not None:
+            return self
+        os.makedirs(self.path, exist_ok=True)
+        spec = {TIME_COLUMN: 'int64'}
+        spec.update({name: 'float64' for name in (columns or OHLCV_COLUMNS)})
+        for name in spec:
+            open(self._column_path(name), 'wb').close()
+        meta = {'rows': 0, 'columns': spec, 'gaps': []}
+        meta.update(info)
+        self._write_meta(meta)
+        return self
+
+    def _truncate_uncommitted(self):
+        """截掉上次崩溃时写了一半、还没记进 meta 的数据"""
+        for name, dtype in self.meta['columns'].items():
+            path = self._column_path(name)
+            size = self.rows * np.dtype(dtype).itemsize
+            if os.path.getsize(path) != size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    def append(self, data):
+        """
+        追加一批K线并提交
+        data: {列名: 数组}，必须包含 timestamp，时间必须升序且晚于当前末尾
+        """
+        ts = np.asarray(data[TIME_COLUMN], dtype=np.int64)
+        if len(ts) == 0:
+            return 0
+        tail = self.tail_timestamp()
+        if tail is not None and ts[0] <= tail:
+            raise ValueError(f"追加的数据 ({ts[0]}) 不晚于存储末尾 ({tail})")
+        if np.any(np.diff(ts) <= 0):
+            raise ValueError("追加的数据时间戳必须严格递增")
+
+        self._truncate_uncommitted()
+        for name, dtype in self.meta['columns'].items():
+            values = np.ascontiguousarray(data[name], dtype=dtype)
+            with open(self._column_path(name), 'ab') as f:
+                values.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+
+        meta = dict(self.meta)
+        meta['rows'] = self.rows + len(ts)
+        self._write_meta(meta)
+        return len(ts)
+
+    def merge(self, data):
+        """
+        把一批K线合并进存储 (可以落在中间，用于补缺口)
+        按时间戳去重 (新数据优先) 后整体重写各列文件
+        """
+        ts = np.asarray(data[TIME_COLUMN], dtype=np.int64)
+        if len(ts) == 0:
+            return 0
+        self._truncate_uncommitted()
+        old = {name: np.fromfile(self._column_path(name), dtype=dtype)
+               for name, dtype in self.meta['columns'].items()}
+
+        merged_ts = np.concatenate([ts, old[TIME_COLUMN]])
+        # 新数据排在前面，np.unique 取第一次出现的位置 => 同一时间戳保留新数据
+        _, first = np.unique(merged_ts, return_index=True)
+        for name, dtype in self.meta['columns'].items():
+            values = np.concatenate([np.asarray(data[name], dtype=dtype), old[name]])[first]
+            tmp_path = self._column_path(name) + '.tmp'
+            values.tofile(tmp_path)
+            os.replace(tmp_path, self._column_path(name))
+
+        meta = dict(self.meta)
+        meta['rows'] = int(len(first))
+        self._write_meta(meta)
+        return int(len(first) - len(old[TIME_COLUMN]))
+
+    def set_gaps(self, gaps):
+        """gaps: [{'start': 缺口前最后一根, 'end': 缺口后第一根, ...}, ...] (毫秒时间戳)"""
+        meta = dict(self.meta)
+        meta['gaps'] = gaps
+        self._write_meta(meta)
+
+    def find_gaps(self, timeframe_ms, start_ms=None, end_ms=None):
+        """扫描存储里相邻K线间隔大于一个周期的位置"""
+        lo, hi = self.range_index(start_ms, end_ms)
+        ts = np.asarray(self._memmap(TIME_COLUMN)[lo:hi])
+        idx = np.flatnonzero(np.diff(ts) > timeframe_ms)
+        return [{'start': int(ts[i]), 'end': int(ts[i + 1]),
+                 'missing': int((ts[i + 1] - ts[i]) // timeframe_ms - 1)} for i in idx]
+
+    def to_csv(self, csv_path):
+        """导出成 data_download.py 以前的 CSV 格式 (datetime, Timestamp, Open, High, ...)"""
+        df = self.load()
+        out = pd.DataFrame({'Timestamp': df[TIME_COLUMN].to_numpy(dtype='datetime64[ms]').astype(np.int64)})
+        for name in self.columns:
+            if name != TIME_COLUMN:
+                out[name[:1].upper() + name[1:]] = df[name].to_numpy()
+        out['datetime'] = df[TIME_COLUMN].to_numpy()
+        out.set_index('datetime', inplace=True)
+        out.to_csv(csv_path)
+
+    # ------------------------------------------------------------------
+    # 从 CSV 转换
+    # ------------------------------------------------------------------
+    def is_fresh(self, csv_path):
+        """缓存是否还对应这个 CSV (按文件大小 + 修改时间判断)"""
+        if not self.meta or 'source' not in self.meta:
+            return False
+        st = os.stat(csv_path)
+        src = self.meta['source']
+        return src.get('size') == st.st_size and src.get('mtime_ns') == st.st_mtime_ns
+
+    def build_from_csv(self, csv_path):
+        """
+        把 CSV 一次性转换成列式二进制文件
+        支持 data_download.py 导出的格式 (datetime, Timestamp, Open, High, Low, Close, Volume)
+        返回 False 表示格式不认识 (调用方应回退到直接读 CSV)；
+        这种情况也会记进 meta (cacheable: false)，CSV 不变就不会每次都再解析一遍
+        """
+        st = os.stat(csv_path)
+        source = {'path': os.path.abspath(csv_path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        df = pd.read_csv(csv_path)
+        df.columns = [x.lower() for x in df.columns]
+
+        # 统一成 int64 毫秒时间戳：优先用数字型 timestamp 列 (秒/毫秒/微秒自动识别)，否则解析 datetime 字符串
+        if TIME_COLUMN in df.columns and pd.api.types.is_numeric_dtype(df[TIME_COLUMN]):
+            ts = epoch_to_ms(df[TIME_COLUMN].to_numpy())
+        elif 'datetime' in df.columns:
+            ts = pd.to_datetime(df['datetime']).to_numpy(dtype='datetime64[ms]').astype(np.int64)
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            self._write_meta({'rows': 0, 'columns': {}, 'cacheable': False, 'source': source})
+            return False
+
+        data = {TIME_COLUMN: ts}
+        for col in df.columns:
+            if col in (TIME_COLUMN, 'datetime'):
+                continue
+            if pd.api.types.is_numeric_dtype(df[col]):
+                data[col] = df[col].to_numpy(dtype=np.float64)
+
+        # 按时间排序，读取时才能二分查找
+        order = np.argsort(ts, kind='stable')
+        if not np.all(order == np.arange(len(order))):
+            data = {name: values[order] for name, values in data.items()}
+
+        os.makedirs(self.path, exist_ok=True)
+        for name, values in data.items():
+            np.ascontiguousarray(values).tofile(self._column_path(name))
+
+        self._write_meta({
+            'rows': int(len(ts)),
+            'columns': {name: str(values.dtype) for name, values in data.items()},
+            'source': source,
+        })
+        return True
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def _memmap(self, name):
+        if self.rows == 0:
+            return np.empty(0, dtype=self.meta['columns'][name])
+        return np.memmap(self._column_path(name), dtype=self.meta['columns'][name], mode='r', shape=(self.rows,))
+
+    def range_index(self, start_ms=None, end_ms=None):
+        """时间范围 [start_ms, end_ms] 对应的行号区间 (二分查找)"""
+        ts = self._memmap(TIME_COLUMN)
+        lo = 0 if start_ms is None else int(np.searchsorted(ts, start_ms, side='left'))
+        hi = len(ts) if end_ms is None else int(np.searchsorted(ts, end_ms, side='right'))
+        return lo, max(lo, hi)
+
+    def load(self, start_time=None, end_time=None):
+        """
+        读取时间范围内的K线 (两端都包含)，返回 DataFrame
+        timestamp 列为 datetime64，其余列为 float64
+        """
+        start_ms = None if start_time is None else pd.Timestamp(start_time).value // 10**6
+        end_ms = None if end_time is None else pd.Timestamp(end_time).value // 10**6
+        lo, hi = self.range_index(start_ms, end_ms)
+
+        out = {}
+        for name in self.columns:
+            values = np.array(self._memmap(name)[lo:hi])  # 只拷贝需要的一段
+            if name == TIME_COLUMN:
+                values = pd.to_datetime(values, unit='ms')
+            out[name] = values
+        return pd.DataFrame(out)
+
+
+def epoch_to_ms(values):
+    """
+    数字时间戳统一成 int64 毫秒，按第一个值的大小判断单位 (与 backtest 报告里的判断相同:
+    大于 1e10 是毫秒，否则是秒；再大三个数量级的是微秒)
+    """
+    values = np.asarray(values)
+    if len(values) == 0:
+        return values.astype(np.int64)
+    first = float(values[0])
+    if first > 1e13:
+        return (values // 1000).astype(np.int64)
+    if first > 1e10:
+        return values.astype(np.int64)
+    return (values * 1000).astype(np.int64)
+
+
+def is_store(path):
+    """path 是否是一个 KlineStore 目录"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def cache_path_for(csv_path):
+    """CSV 对应的缓存目录: 同目录下的 <文件名>.cache"""
+    return csv_path + '.cache'
+
+
+def load_csv_cached(csv_path, start_time=None, end_time=None):
+    """
+    带缓存读取 CSV：缓存不存在或 CSV 有变化时自动重建
+    返回 None 表示该 CSV 无法缓存 (调用方应回退到 pd.read_csv)
+    """
+    store = KlineStore(cache_path_for(csv_path))
+    if not store.is_fresh(csv_path):
+        print(f"🗜️ 正在建立二进制缓存 (只需一次): {store.path}")
+        store.build_from_csv(csv_path)
+    if not store.cacheable:
+        return None
+    return store.load(start_time, end_time)
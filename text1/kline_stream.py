@@ -0,0 +1,167 @@
+# 文件名: kline_stream.py
+# WebSocket K线推送数据源 (替代每 10 秒一次的 REST 轮询)
+#
+# - 启动时用 REST 预热一次各周期的历史K线
+# - 之后订阅币安合约的 kline 推送，在内存里维护每个周期的 CandleBuffer
+# - 每根K线收盘时发出一个“收盘事件”，主程序收到后立即跑策略，不用再等轮询
+# - 断线自动重连，重连后用 REST 补上断线期间的K线
+import asyncio
+import json
+import queue
+import threading
+
+import websockets
+
+from candle_buffer import CandleBuffer
+
+BINANCE_FUTURES_WS = 'wss://fstream.binance.com/stream'
+
+
+def stream_name(symbol, timeframe):
+    """'BTC/USDT', '5m' -> 'btcusdt@kline_5m'"""
+    return f"{symbol.replace('/', '').lower()}@kline_{timeframe}"
+
+
+class KlineStream:
+    def __init__(self, exchange, symbol, timeframes, url=BINANCE_FUTURES_WS, capacity=500):
+        """
+        exchange: 用于 REST 预热的 exchange 对象 (复用 BinanceDriver 的连接)
+        url: WebSocket 地址 (测试时可以指向本地模拟服务器)
+        """
+        self.exchange = exchange
+        self.symbol = symbol
+        self.timeframes = list(timeframes)
+        self.url = url
+        self.capacity = capacity
+
+        self.buffers = {tf: CandleBuffer(capacity) for tf in self.timeframes}
+        self.lock = threading.Lock()
+        self.events = queue.Queue()
+        self.connected = threading.Event()
+
+        self._streams = {stream_name(symbol, tf): tf for tf in self.timeframes}
+        self._thread = None
+        self._loop = None
+        self._stop = False
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+    def start(self):
+        """后台线程里启动 WebSocket 连接"""
+        self.warmup()
+        self._thread = threading.Thread(target=self._thread_main, name='kline-stream', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(lambda: None)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def next_event(self, timeout=None):
+        """
+        阻塞等待下一个收盘事件，返回 (symbol, timeframe, 收盘K线的毫秒时间戳)
+        超时返回 None
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_all_timeframes(self):
+        """
+        和 DataManager.get_all_timeframes 返回格式相同: {'5m': df, '15m': df, ...}
+        (各周期最后一行都是正在形成的K线)
+        这里返回拷贝，因为后台线程还在不断写入缓冲区
+        """
+        with self.lock:
+            return {tf: buf.to_frame(copy=True) for tf, buf in self.buffers.items() if len(buf) > 0}
+
+    # ------------------------------------------------------------------
+    # 预热 / 补数据
+    # ------------------------------------------------------------------
+    def warmup(self):
+        """用 REST 拉一次历史K线 (启动时和重连后调用)"""
+        for tf in self.timeframes:
+            try:
+                bars = self.exchange.fetch_ohlcv(self.symbol, tf, limit=self.capacity)
+            except Exception as e:
+                print(f"❌ [推送] 预热 {tf} 失败: {e}")
+                continue
+            with self.lock:
+                self.buffers[tf].extend(bars)
+            print(f"📥 [推送] {tf} 预热完成 ({len(self.buffers[tf])} 根)")
+
+    # ------------------------------------------------------------------
+    # 消息处理
+    # ------------------------------------------------------------------
+    def handle_message(self, raw):
+        """
+        处理一条币安 combined stream 消息:
+        {"stream": "btcusdt@kline_5m", "data": {"e": "kline", "k": {"t":..,"o":..,"x": false, ...}}}
+        """
+        msg = json.loads(raw)
+        data = msg.get('data', msg)
+        if data.get('e') != 'kline':
+            return
+        k = data['k']
+        tf = self._streams.get(msg.get('stream')) or k.get('i')
+        if tf not in self.buffers:
+            return
+
+        ts = int(k['t'])
+        close = float(k['c'])
+        with self.lock:
+            buf = self.buffers[tf]
+            buf.update(ts, float(k['o']), float(k['h']), float(k['l']), close, float(k['v']))
+            if k.get('x'):
+                # 收盘：先放一根以收盘价开盘的“新K线”占位，保证最后一行始终是正在形成的K线
+                # (与轮询模式看到的数据结构一致)，交易所推来下一根的真实数据后会覆盖它
+                next_ts = int(k['T']) + 1
+                buf.update(next_ts, close, close, close, close, 0.0)
+
+        if k.get('x'):
+            self.events.put((self.symbol, tf, ts))
+
+    # ------------------------------------------------------------------
+    # 后台线程
+    # ------------------------------------------------------------------
+    def _thread_main(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._run())
+        finally:
+            self._loop.close()
+
+    async def _run(self):
+        url = f"{self.url}?streams={'/'.join(self._streams.keys())}"
+        backoff = 1
+        first = True
+        while not self._stop:
+            try:
+                async with websockets.connect(url, ping_interval=20, open_timeout=10) as ws:
+                    print(f"🔗 [推送] 已连接: {url}")
+                    if not first:
+                        # 重连：补上断线期间错过的K线
+                        await asyncio.get_running_loop().run_in_executor(None, self.warmup)
+                    first = False
+                    backoff = 1
+                    self.connected.set()
+                    while not self._stop:
+                        try:
+                            raw = await asyncio.wait_for(ws.recv(), timeout=1)
+                        except asyncio.TimeoutError:
+                            continue
+                        self.handle_message(raw)
+            except Exception as e:
+                self.connected.clear()
+                if self._stop:
+                    break
+                print(f"⚠️ [推送] 连接断开: {e}，{backoff} 秒后重连")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+        self.connected.clear()
@@ -3,21 +3,120 @@ from config import Config
 from drive import BinanceDriver
 from Strategy import Strategy
 from data_manager import DataManager
-from alert_system import AlertSystem
+from kline_stream import KlineStream
+
+try:
+    from alert_system import AlertSystem
+except ImportError:
+    # alert_system.py 里目前只有独立运行的 AutoAlertBot，没有 AlertSystem 时主程序跳过报警检查
+    AlertSystem = None
+
+def process_cycle(kline_dict, driver, brain, alert_system, config=Config):
+    """
+    一轮处理：报警检查 -> 打印行情 -> 策略分析 -> 下单
+    轮询模式、推送模式和历史回放 (replay.py) 共用
+    config: 默认 Config；回放时传入它自己的配置 (关掉/打开真实下单)
+    返回 (信号, 订单)：没有信号时都是 None，没下单成功时订单为 None
+    """
+    # ==========================================
+    # === [新增] D. 独立报警模块 (插入在这里) ===
+    # ==========================================
+    # 只要数据里包含 5m，就让哨兵去检查一遍
+    # 注意：请确保 config.py 的 TIMEFRAMES 里包含 '5m'
+    if alert_system is not None and '5m' in kline_dict:
+        # 这里调用我们在 alert_system.py 里写好的检查函数
+        alert_system.check_signal(kline_dict['5m'])
+    # ==========================================
+
+    # === B. 满足你的需求：打印所有数据 ===
+    if kline_dict:
+        print(f"\n---  行情监控 ({config.SYMBOL}) ---")
+        for tf in config.TIMEFRAMES:
+            if tf in kline_dict:
+                df = kline_dict[tf]
+                current_price = df.iloc[-1]['close']
+                # 打印: [5m] 现价: 93000.5 | 涨跌幅等信息...
+                print(f" > [{tf: <3}] 最新价: {current_price:.2f} \t(数据量: {len(df)})")
+    
+    # === C. 保持原有功能：执行交易逻辑 ===
+    # 我们只把“主周期”的数据喂给策略
+    target_tf = config.TRADE_TIMEFRAME
+    
+    if target_tf in kline_dict:
+        target_df = kline_dict[target_tf]
+        # 把最新价交给驱动，下单时就不用再请求一次 ticker
+        driver.update_price(target_df['close'].iloc[-1], config.SYMBOL)
+        
+        print(f"\n---  策略分析 (基于 {target_tf}) ---")
+        
+        # 让大脑分析
+        signal = brain.analyze(target_df)
+        signal_time = time.perf_counter()
+        
+        # 执行信号
+        if signal:
+            print(f" 触发交易信号: 【{signal}】")
+            return signal, driver.execute_order(signal, signal_time)
+        print("💤 暂无交易信号，继续观察...")
+    else:
+        print(f" 警告：未获取到主交易周期 {target_tf} 的数据")
+    return None, None
+
+
+def run_stream(driver, brain, alert_system):
+    """
+    推送模式：订阅 WebSocket K线，主周期每根K线收盘时立刻处理一轮
+    (不再每 10 秒用 REST 把所有周期重新下载一遍)
+    """
+    stream = KlineStream(driver.exchange, Config.SYMBOL, Config.TIMEFRAMES, url=Config.STREAM_URL).start()
+    try:
+        while True:
+            event = stream.next_event(timeout=60)
+            if event is None:
+                print("⏳ 60 秒内没有收到收盘事件，继续等待...")
+                continue
+
+            symbol, tf, ts = event
+            if tf != Config.TRADE_TIMEFRAME:
+                continue
+
+            print("\n" + "=" * 50)
+            print(f" 系统时间: {time.strftime('%H:%M:%S')} | {tf} K线收盘")
+            try:
+                process_cycle(stream.get_all_timeframes(), driver, brain, alert_system)
+            except Exception as e:
+                print(f"主程序报错: {e}")
+            print("=" * 50)
+    except KeyboardInterrupt:
+        print("\n用户手动停止程序")
+    finally:
+        stream.stop()
 
 def main():
     print("=== 超级量化终端启动 ===")
     
+    if Config.DATA_SOURCE == 'replay':
+        # 历史回放：同样的 数据 -> 策略 -> 下单 流程，虚拟时钟代替 time.sleep，不连接交易所
+        from replay import run_replay
+        run_replay(Config.REPLAY_CSV, Config.REPLAY_START, Config.REPLAY_END)
+        return
+
     # 1. 初始化三大模块
     driver = BinanceDriver(Config)           # 驱动 (手)
     data_loader = DataManager(driver.exchange) # 数据 (眼)
     brain = Strategy(Config)                 # 策略 (脑)
-    alert_system = AlertSystem()             # 哨兵 (耳)
+    alert_system = AlertSystem() if AlertSystem else None  # 哨兵 (耳)
+    if alert_system is None:
+        print("⚠️ 未找到 alert_system.AlertSystem，本次运行不做报警检查")
 
     # 打印初始余额
     balance = driver.get_usdt_balance()
     print(f" 账户初始余额: {balance:.2f} USDT")
 
+    if Config.DATA_SOURCE == 'stream':
+        run_stream(driver, brain, alert_system)
+        return
+
     while True:
         try:
             print("\n" + "=" * 50)
@@ -29,46 +128,7 @@ def main():
                 Config.SYMBOL, 
                 Config.TIMEFRAMES
             )
-            # ==========================================
-            # === [新增] D. 独立报警模块 (插入在这里) ===
-            # ==========================================
-            # 只要数据里包含 5m，就让哨兵去检查一遍
-            # 注意：请确保 config.py 的 TIMEFRAMES 里包含 '5m'
-            if '5m' in kline_dict:
-                # 这里调用我们在 alert_system.py 里写好的检查函数
-                alert_system.check_signal(kline_dict['5m'])
-            # ==========================================
-
-            # === B. 满足你的需求：打印所有数据 ===
-            if kline_dict:
-                print(f"\n---  行情监控 ({Config.SYMBOL}) ---")
-                for tf in Config.TIMEFRAMES:
-                    if tf in kline_dict:
-                        df = kline_dict[tf]
-                        current_price = df.iloc[-1]['close']
-                        # 打印: [5m] 现价: 93000.5 | 涨跌幅等信息...
-                        print(f" > [{tf: <3}] 最新价: {current_price:.2f} \t(数据量: {len(df)})")
-            
-            # === C. 保持原有功能：执行交易逻辑 ===
-            # 我们只把“主周期”的数据喂给策略
-            target_tf = Config.TRADE_TIMEFRAME
-            
-            if target_tf in kline_dict:
-                target_df = kline_dict[target_tf]
-                
-                print(f"\n---  策略分析 (基于 {target_tf}) ---")
-                
-                # 让大脑分析
-                signal = brain.analyze(target_df)
-                
-                # 执行信号
-                if signal:
-                    print(f" 触发交易信号: 【{signal}】")
-                    driver.execute_order(signal)
-                else:
-                    print("💤 暂无交易信号，继续观察...")
-            else:
-                print(f" 警告：未获取到主交易周期 {target_tf} 的数据")
+            process_cycle(kline_dict, driver, brain, alert_system)
 
             print("=" * 50)
             
@@ -0,0 +1,112 @@
+# 文件名: metrics.py
+# 回测结果的紧凑存储和向量化统计
+#
+# 引擎把每笔平仓写进预分配的结构化数组 (TradeLog)，资金曲线写进预分配的 float64 数组，
+# 不再为每根K线/每笔交易创建 Python float 和 dict。结构化数组仍然可以按字段取值:
+#   trades['profit']          -> 所有交易的净利润 (float64 数组)
+#   trades[0]['type']         -> 'long' / 'short'
+# 下面的统计函数都直接在这些数组上运算 (回撤序列、夏普、胜率、盈亏比、每日盈亏)。
+import numpy as np
+import pandas as pd
+
+# 成交记录的字段 (与原来 closed_trades 里 dict 的键一致)
+TRADE_FIELDS = [
+    ('time', 'datetime64[ns]'),   # 平仓时间
+    ('type', 'U5'),               # 'long' / 'short'
+    ('profit', 'f8'),             # 净利润 (已扣平仓费，未扣开仓费)
+    ('entry_fee', 'f8'),          # 开仓手续费
+    ('exit_fee', 'f8'),           # 平仓手续费
+    ('margin', 'f8'),             # 占用保证金
+    ('reason', 'U2'),             # '止损' / '止盈'
+]
+TRADE_DTYPE = np.dtype(TRADE_FIELDS)
+
+
+class TradeLog:
+    """预分配的成交记录，容量不够时翻倍扩容"""
+
+    def __init__(self, dtype=TRADE_DTYPE, capacity=1024):
+        self.buf = np.empty(capacity, dtype=dtype)
+        self.n = 0
+
+    def append(self, row):
+        """row: 按 dtype 字段顺序排列的元组"""
+        if self.n == len(self.buf):
+            bigger = np.empty(len(self.buf) * 2, dtype=self.buf.dtype)
+            bigger[:self.n] = self.buf
+            self.buf = bigger
+        self.buf[self.n] = row
+        self.n += 1
+
+    def __len__(self):
+        return self.n
+
+    def to_array(self):
+        return self.buf[:self.n].copy()
+
+
+def as_trades(trades):
+    """结构化数组原样返回；list[dict] (手工构造的记录) 转成记录数组，方便按字段取值"""
+    if isinstance(trades, np.ndarray):
+        return trades
+    trades = list(trades)
+    if not trades:
+        return np.empty(0, dtype=TRADE_DTYPE)
+    return pd.DataFrame(trades).to_records(index=False)
+
+
+# =================================================================
+# 资金曲线
+# =================================================================
+def drawdown(equity):
+    """回撤序列 (0~1)：每个时刻相对此前最高点跌了多少"""
+    equity = np.asarray(equity, dtype=np.float64)
+    peak = np.maximum.accumulate(equity)
+    dd = np.zeros_like(equity)
+    np.divide(equity, peak, out=dd, where=peak > 0)
+    np.subtract(1, dd, out=dd, where=peak > 0)
+    return dd
+
+
+def max_drawdown(equity):
+    """最大回撤 (0~1)"""
+    return float(drawdown(equity).max()) if len(equity) else 0.0
+
+
+def daily_pnl(equity, times):
+    """每日盈亏 (按每天最后一根K线的资金相减，第一天记 0)"""
+    series = pd.Series(np.asarray(equity, dtype=np.float64), index=times)
+    return series.resample('D').last().diff().fillna(0)
+
+
+def sharpe(equity, times, periods_per_year=365):
+    """按日收益率计算的年化夏普比率 (无风险利率按 0，币圈全年无休按 365 天)"""
+    daily = pd.Series(np.asarray(equity, dtype=np.float64), index=times).resample('D').last().dropna()
+    if len(daily) < 3:
+        return 0.0
+    r = np.diff(daily.to_numpy()) / daily.to_numpy()[:-1]
+    r = r[np.isfinite(r)]
+    std = r.std(ddof=1) if len(r) > 1 else 0.0
+    return float(r.mean() / std * np.sqrt(periods_per_year)) if std > 0 else 0.0
+
+
+# =================================================================
+# 成交记录
+# =================================================================
+def win_rate(trades):
+    """胜率 (%)，净利润 > 0 记为盈利 (与原统计口径一致)"""
+    profit = as_trades(trades)['profit'] if len(trades) else np.empty(0)
+    return float((profit > 0).mean() * 100) if len(profit) else 0.0
+
+
+def profit_factor(trades):
+    """盈亏比 = 盈利单总盈利 / 亏损单总亏损 (都扣除开仓费和平仓费)；没有亏损单时为 inf"""
+    if not len(trades):
+        return 0.0
+    trades = as_trades(trades)
+    net = trades['profit'] - trades['entry_fee']
+    gain = net[net > 0].sum()
+    loss = -net[net < 0].sum()
+    if loss > 0:
+        return float(gain / loss)
+    return float('inf') if gain > 0 else 0.0
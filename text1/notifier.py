@@ -0,0 +1,151 @@
+# 文件名: notifier.py
+# 后台通知分发器 (Bark 推送 + TTS 语音)
+#
+# 检测循环只负责把消息放进队列，马上返回；
+# 真正的网络请求和语音播放在后台线程里做，不会卡住下一个交易对的检测。
+# - Bark: 复用 keep-alive 连接池，同时发给所有接收人，失败按指数退避重试
+# - TTS:  单独一个线程 (pyttsx3 的引擎必须在创建它的线程里使用)
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Notifier:
+    def __init__(self, bark_urls, enable_bark=True, enable_tts=True, proxies=None,
+                 workers=4, retries=3, backoff=1.0, timeout=5):
+        self.bark_urls = list(bark_urls)
+        self.enable_bark = enable_bark
+        self.enable_tts = enable_tts
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # 连接池：同一个 host 的请求复用 TCP/TLS 连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(workers, len(self.bark_urls)))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if proxies:
+            self.session.proxies.update(proxies)
+
+        self.bark_queue = queue.Queue()
+        self.tts_queue = queue.Queue()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bark')
+
+        # --- 统计 ---
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.spoken = 0
+        self.in_flight = 0       # 正在发送 (含重试等待) 的请求数
+        self.latencies = []      # 最近的投递延迟 (秒，从 notify 到对方收到)
+
+        self._threads = [threading.Thread(target=self._bark_loop, name='bark-dispatch', daemon=True)]
+        if enable_tts:
+            self._threads.append(threading.Thread(target=self._tts_loop, name='tts', daemon=True))
+        for t in self._threads:
+            t.start()
+
+    # ------------------------------------------------------------------
+    # 对外接口 (都是立即返回)
+    # ------------------------------------------------------------------
+    def bark(self, title, content):
+        if self.enable_bark and self.bark_urls:
+            self.bark_queue.put((time.perf_counter(), title, content))
+
+    def speak(self, text):
+        if self.enable_tts:
+            self.tts_queue.put(text)
+
+    def stats(self):
+        with self.lock:
+            lat = list(self.latencies)
+            return {
+                'bark_queue': self.bark_queue.qsize(),
+                'in_flight': self.in_flight,
+                'tts_queue': self.tts_queue.qsize(),
+                'sent': self.sent,
+                'failed': self.failed,
+                'retried': self.retried,
+                'spoken': self.spoken,
+                'avg_latency': sum(lat) / len(lat) if lat else 0.0,
+                'max_latency': max(lat) if lat else 0.0,
+            }
+
+    def close(self, timeout=10):
+        """等待队列里的消息发完 (程序退出前调用)"""
+        deadline = time.time() + timeout
+        while (self.bark_queue.unfinished_tasks or self.in_flight or self.tts_queue.unfinished_tasks) and time.time() < deadline:
+            time.sleep(0.05)
+        self.pool.shutdown(wait=True)
+
+    # ------------------------------------------------------------------
+    # Bark
+    # ------------------------------------------------------------------
+    def _bark_loop(self):
+        while True:
+            queued_at, title, content = self.bark_queue.get()
+            # 所有接收人并行发送 (不等它们发完就接着分发下一条)
+            with self.lock:
+                self.in_flight += len(self.bark_urls)
+            for url in self.bark_urls:
+                self.pool.submit(self._deliver, url, title, content, queued_at)
+            self.bark_queue.task_done()
+
+    def _deliver(self, base_url, title, content, queued_at):
+        try:
+            return self._deliver_once(base_url, title, content, queued_at)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _deliver_once(self, base_url, title, content, queued_at):
+        url = f"{base_url.rstrip('/')}/{quote(str(title), safe='')}/{quote(str(content), safe='')}"
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self.session.get(url, timeout=self.timeout)
+                resp.raise_for_status()
+                with self.lock:
+                    self.sent += 1
+                    self.latencies = (self.latencies + [time.perf_counter() - queued_at])[-200:]
+                return True
+            except Exception as e:
+                if attempt == self.retries:
+                    # 某一个人发送失败（比如网络不好），打印错误但不影响其他人
+                    print(f"⚠️ Bark推送失败: {e}")
+                    with self.lock:
+                        self.failed += 1
+                    return False
+                with self.lock:
+                    self.retried += 1
+                time.sleep(self.backoff * (2 ** attempt))
+
+    # ------------------------------------------------------------------
+    # TTS
+    # ------------------------------------------------------------------
+    def _tts_loop(self):
+        engine = None
+        try:
+            import pyttsx3
+            engine = pyttsx3.init()
+            engine.setProperty('rate', 150)
+        except Exception as e:
+            print(f"⚠️ 语音引擎初始化失败，语音提醒关闭: {e}")
+
+        while True:
+            text = self.tts_queue.get()
+            if engine is not None:
+                try:
+                    engine.say(text)
+                    engine.runAndWait()
+                    with self.lock:
+                        self.spoken += 1
+                except Exception:
+                    pass
+            self.tts_queue.task_done()
@@ -0,0 +1,370 @@
+# 文件名: portfolio.py
+# 多交易对组合回测 (共用一个保证金账户)
+#
+# backtest.py 只能跑一个交易对。这里把多个交易对放在同一条时间轴上逐根推进:
+# - 余额 / 备用金只有一份，所有交易对的挂单和持仓都从这里扣保证金
+# - MAX_ORDERS 是整个组合的上限 (持仓 + 挂单)
+# - 每个交易对的开单规则 (strategies.py)、撮合、止盈止损与 backtest 的 array 引擎完全相同，
+#   只放一个交易对时结果与 run_backtest 逐笔一致
+#
+# 数据按交易对从本地存储 (data_download.py 生成的 .store 目录，或 CSV) 按需读取，
+# 只读回测时间段，取成 (交易对数, K线数) 的 NumPy 数组后就释放 DataFrame。
+# 主循环里不碰 pandas；空仓时直接跳到下一根有信号的K线。
+import numpy as np
+import pandas as pd
+
+import backtest
+import metrics
+import strategies
+from data_download import store_path_for
+
+# 与 run_backtest 的 start_index 一致
+START_INDEX = 375
+
+
+class SymbolFeed:
+    """单个交易对的数据源 (第一次用到时才从本地读取)"""
+
+    def __init__(self, symbol, path=None, timeframe='5m'):
+        self.symbol = symbol
+        self.path = path or store_path_for(symbol, timeframe)
+        self._arrays = None
+
+    def load(self, start_time=None, end_time=None):
+        """返回 {'time': int64 纳秒, 'open'/'high'/'low'/'close': float64 数组}"""
+        if self._arrays is None:
+            df = backtest.load_from_csv(self.path, start_time, end_time)
+            if df.empty:
+                self._arrays = {}
+                return self._arrays
+            self._arrays = {'time': df['timestamp'].to_numpy().astype('datetime64[ns]').astype(np.int64)}
+            for name in ('open', 'high', 'low', 'close'):
+                self._arrays[name] = df[name].to_numpy(dtype=np.float64)
+        return self._arrays
+
+
+def align(feeds, start_time=None, end_time=None, strategy=None):
+    """
+    把各交易对的数据对齐到公共时间轴 (所有交易对时间戳的并集)
+    某个交易对在某根K线上没有数据时为 NaN (还没上线 / 数据缺口)
+    策略信号按各交易对自己的K线序列算好再对齐:
+    'long' / 'short' 为 1 表示这根K线满足开多/开空条件，'ref' 是上一根K线的偏离值参照线
+    返回 (时间 DatetimeIndex, {列名: (交易对数, K线数) 数组})
+    """
+    strategy = strategies.create(strategy or backtest.STRATEGY)
+    loaded = [feed.load(start_time, end_time) for feed in feeds]
+    times = np.unique(np.concatenate([d['time'] for d in loaded if d] or [np.empty(0, dtype=np.int64)]))
+    cols = {}
+    for name in ('open', 'high', 'low', 'close', 'long', 'short', 'ref'):
+        cols[name] = np.full((len(feeds), len(times)), np.nan)
+    for s, data in enumerate(loaded):
+        if not data:
+            continue
+        pos = np.searchsorted(times, data['time'])
+        for name in ('open', 'high', 'low', 'close'):
+            cols[name][s, pos] = data[name]
+        cols['long'][s, pos] = strategy.signals(data, True, False) == strategies.LONG
+        cols['short'][s, pos] = strategy.signals(data, False, True) == strategies.SHORT
+        cols['ref'][s, pos[1:]] = strategy.reference_line(data)[:-1]
+    return pd.DatetimeIndex(times), cols
+
+
+def trade_dtype(symbols):
+    """组合回测的成交记录: run_backtest 的字段 + 交易对"""
+    width = max([len(s) for s in symbols] + [1])
+    return np.dtype(metrics.TRADE_FIELDS + [('symbol', f'U{width}')])
+
+
+def run_portfolio_backtest(symbols, params=None, start_time=None, end_time=None, paths=None,
+                           timeframe='5m', verbose=True, strategy=None):
+    """
+    组合回测
+    symbols: 交易对列表，例如 ['BTC/USDT', 'ETH/USDT']
+    paths:   {交易对: 本地数据路径}，不传则用 data_download.store_path_for 的默认目录
+    strategy: 开单规则 (strategies.py 的策略对象或名字)，不传则使用 backtest.STRATEGY
+    返回 (closed_trades, equity_curve, final_reserve, times)
+    closed_trades 是结构化数组，比 run_backtest 多一个 'symbol' 字段；equity_curve 从第 START_INDEX 根开始，与 times 对齐
+    """
+    log = print if verbose else backtest._quiet
+    params = backtest.get_params(**(params or {}))
+    paths = paths or {}
+    feeds = [SymbolFeed(s, paths.get(s), timeframe) for s in symbols]
+    times, cols = align(feeds, start_time or backtest.START_TIME, end_time or backtest.END_TIME, strategy)
+    if len(times) <= START_INDEX:
+        log("❌ 数据为空或太短，无法回测")
+        return np.empty(0, dtype=trade_dtype(symbols)), np.empty(0), 0, times[:0]
+
+    trades, equity, final_reserve = _run_portfolio_arrays(symbols, times, cols, params, log)
+    return trades, equity, final_reserve, times[START_INDEX:]
+
+
+def _run_portfolio_arrays(symbols, times, cols, params, log=print):
+    (INITIAL_BALANCE, INITIAL_RESERVE, MAX_ORDERS, ENABLE_LONG, ENABLE_SHORT,
+     LEVERAGE, TP_PERCENT_LONG, SL_PERCENT_LONG, TP_PERCENT_SHORT, SL_PERCENT_SHORT, FEE_RATE,
+     MIX_UP, FIXED_MARGIN_RATE, MAX_OPEN, MAX_OPEN_LIMIT,
+     SIDE_DISTANCE_SWITCH, SAME_SIDE_DISTANCE_LONG, SAME_SIDE_DISTANCE_SHORT,
+     ENABLE_CONSECUTIVE_FILTER, MAX_CONS_LONG, MAX_CONS_SHORT) = [params[name] for name in backtest.PARAM_NAMES]
+
+    o, h, l, c = cols['open'], cols['high'], cols['low'], cols['close']
+    n_sym, n = c.shape
+    has_bar = ~np.isnan(c)
+
+    # 权益按各交易对“最近一根”收盘价估值 (没有K线的时刻沿用上一根)
+    idx = np.where(has_bar, np.arange(n), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    close_ff = np.take_along_axis(c, idx, axis=1)
+
+    # 原始策略信号 (align 里按该交易对的上一根K线算好)：1 = 多, -1 = 空, 0 = 无
+    # 上一根按各交易对自己的K线序列算 (中间缺K线时取缺口前最后一根)
+    prev = np.zeros_like(idx)
+    prev[:, 1:] = idx[:, :-1]
+    rows = np.arange(n_sym)[:, None]
+    last_close = c[rows, prev]
+    last_ref = cols['ref']
+    raw_signal = np.zeros((n_sym, n), dtype=np.int8)
+    if ENABLE_SHORT:
+        raw_signal[cols['short'] == 1] = -1
+    if ENABLE_LONG:
+        raw_signal[cols['long'] == 1] = 1
+    raw_signal[:, 0] = 0
+    raw_signal[~has_bar] = 0
+    signal_index = np.flatnonzero(raw_signal.any(axis=0))
+
+    # 主循环按K线逐根推进，每根只需要所有交易对在这一时刻的值:
+    # 转成 (K线数, 交易对数) 的连续数组，处理某根K线时把这一行取成 Python 列表
+    o_t, h_t, l_t = [np.ascontiguousarray(x.T) for x in (o, h, l)]
+    close_t, bar_t, signal_t = [np.ascontiguousarray(x.T) for x in (close_ff, has_bar, raw_signal)]
+    last_close_t, last_ref_t = [np.ascontiguousarray(x.T) for x in (last_close, last_ref)]
+
+    # === 1. 账户初始化 (整个组合共用) ===
+    balance = INITIAL_BALANCE
+    reserve_fund = INITIAL_RESERVE
+
+    # 持仓单: [交易对, 方向, 开仓价, 数量, 保证金, 止盈价, 止损价, 开仓费]，按开仓顺序排列
+    active = []
+    # 挂单: 每个交易对最多一张，None 表示没有
+    pending = [None] * n_sym
+    n_pending = 0
+
+    # 每个交易对各自的连续开单状态
+    last_trade_type = [0] * n_sym
+    consecutive_counts = [0] * n_sym
+
+    closed_trades = metrics.TradeLog(trade_dtype(symbols))
+    times_ns = times.to_numpy().astype('datetime64[ns]')
+    equity_curve = np.empty(max(n - START_INDEX, 0), dtype=np.float64)
+
+    log(f"🔄 开始组合回测 | {n_sym} 个交易对: {', '.join(symbols)} | 杠杆: {LEVERAGE}x | 最大同时持仓: {MAX_ORDERS}")
+    log(f"⏳ 正在逐根K线模拟 ({n - START_INDEX} 根)...")
+
+    i = START_INDEX
+    while i < n:
+        # --- 空仓快进：无挂单无持仓时，只有出现原始信号的K线才可能发生变化 ---
+        if n_pending == 0 and not active:
+            k = np.searchsorted(signal_index, i)
+            nxt = int(signal_index[k]) if k < len(signal_index) else n
+            if nxt > i:
+                equity_curve[i - START_INDEX:nxt - START_INDEX] = balance
+                i = nxt
+                if i >= n:
+                    break
+
+        o_i, h_i, l_i, bar_i = o_t[i].tolist(), h_t[i].tolist(), l_t[i].tolist(), bar_t[i].tolist()
+
+        # ============================================================
+        # 🟢【阶段一：挂单撮合】(只处理这根有K线的交易对)
+        # ============================================================
+        fills = []
+        if n_pending:
+            for s in range(n_sym):
+                p = pending[s]
+                if p is None or not bar_i[s]:
+                    continue
+                p_type, p_price, p_amount, p_margin, p_tp, p_sl = p
+                current_open = o_i[s]
+                filled = False
+                if p_type == 1:
+                    if current_open <= p_price:
+                        filled, fill_price = True, current_open
+                    elif l_i[s] <= p_price:
+                        filled, fill_price = True, p_price
+                else:
+                    if current_open >= p_price:
+                        filled, fill_price = True, current_open
+                    elif h_i[s] >= p_price:
+                        filled, fill_price = True, p_price
+
+                if filled:
+                    entry_fee = p_amount * fill_price * FEE_RATE
+                    balance -= entry_fee
+                    fills.append([s, p_type, fill_price, p_amount, p_margin, p_tp, p_sl, entry_fee])
+                else:
+                    balance += p_margin
+                pending[s] = None
+                n_pending -= 1
+
+        # ============================================================
+        # 🔵【阶段二：持仓管理】
+        # ============================================================
+        if active:
+            kept = []
+            for order in active:
+                s, otype, entry, amount, margin, tp_price, sl_price, fee = order
+                if not bar_i[s]:
+                    kept.append(order)
+                    continue
+                current_open = o_i[s]
+                current_high = h_i[s]
+                current_low = l_i[s]
+                is_closed = False
+
+                if otype == 1:
+                    if current_low <= sl_price:
+                        is_closed, close_reason = True, "止损"
+                        exit_price = current_open if current_open < sl_price else sl_price
+                    elif current_high >= tp_price:
+                        is_closed, close_reason = True, "止盈"
+                        exit_price = current_open if current_open > tp_price else tp_price
+                else:
+                    if current_high >= sl_price:
+                        is_closed, close_reason = True, "止损"
+                        exit_price = current_open if current_open > sl_price else sl_price
+                    elif current_low <= tp_price:
+                        is_closed, close_reason = True, "止盈"
+                        exit_price = current_open if current_open < tp_price else tp_price
+
+                if is_closed:
+                    if otype == 1:
+                        pnl = (exit_price - entry) * amount
+                    else:
+                        pnl = (entry - exit_price) * amount
+                    exit_fee = exit_price * amount * FEE_RATE
+                    net_pnl = pnl - exit_fee
+                    balance += margin + net_pnl
+
+                    if balance < 0:
+                        if reserve_fund > abs(balance):
+                            reserve_fund += balance
+                            balance = 0
+                        else:
+                            balance = 0
+
+                    closed_trades.append((times_ns[i], 'long' if otype == 1 else 'short', net_pnl,
+                                          fee, exit_fee, margin, close_reason, symbols[s]))
+                else:
+                    kept.append(order)
+            active = kept
+
+        # 刚成交的单子排在最后 (T+1)
+        active.extend(fills)
+
+        # ============================================================
+        # 🟡【阶段三：信号生成】(按交易对列表顺序，共用 MAX_ORDERS 和余额)
+        # ============================================================
+        signal_i = signal_t[i]
+        for s in np.flatnonzero(signal_i).tolist():
+            if len(active) + n_pending >= MAX_ORDERS:
+                break
+            signal = int(signal_i[s])
+            prev_close = float(last_close_t[i, s])
+            prev_ref = float(last_ref_t[i, s])
+
+            if SIDE_DISTANCE_SWITCH and last_trade_type[s] == signal:
+                if signal == 1:
+                    if prev_close <= prev_ref * (1 + SAME_SIDE_DISTANCE_LONG): signal = 0
+                else:
+                    if prev_close >= prev_ref * (1 - SAME_SIDE_DISTANCE_SHORT): signal = 0
+
+            if ENABLE_CONSECUTIVE_FILTER and signal != 0 and last_trade_type[s] == signal:
+                if signal == 1 and consecutive_counts[s] >= MAX_CONS_LONG: signal = 0
+                elif signal == -1 and consecutive_counts[s] >= MAX_CONS_SHORT: signal = 0
+
+            if signal == 0:
+                continue
+
+            if last_trade_type[s] == signal:
+                consecutive_counts[s] += 1
+            else:
+                consecutive_counts[s] = 1
+                last_trade_type[s] = signal
+
+            margin_to_use = balance * FIXED_MARGIN_RATE if MIX_UP else INITIAL_BALANCE
+            if MAX_OPEN and MAX_OPEN_LIMIT > 0:
+                margin_to_use = min(margin_to_use, MAX_OPEN_LIMIT)
+
+            if margin_to_use > 5 and balance > margin_to_use:
+                limit_price = prev_close
+                amount = (margin_to_use * LEVERAGE) / limit_price
+                if signal == 1:
+                    tp = limit_price * (1 + TP_PERCENT_LONG)
+                    sl = limit_price * (1 - SL_PERCENT_LONG)
+                else:
+                    tp = limit_price * (1 - TP_PERCENT_SHORT)
+                    sl = limit_price * (1 + SL_PERCENT_SHORT)
+                balance -= margin_to_use
+                pending[s] = (signal, limit_price, amount, margin_to_use, tp, sl)
+                n_pending += 1
+
+        # ============================================================
+        # 🟣【阶段四：统计资金】
+        # ============================================================
+        equity = balance
+        if n_pending:
+            for p in pending:
+                if p is not None:
+                    equity += p[3]
+        if active:
+            close_i = close_t[i].tolist()
+        for s, otype, entry, amount, margin, _, _, _ in active:
+            current_close = close_i[s]
+            equity += margin
+            if otype == 1:
+                equity += (current_close - entry) * amount
+            else:
+                equity += (entry - current_close) * amount
+        equity_curve[i - START_INDEX] = equity
+
+        i += 1
+
+    log(f"✅ 组合回测完成! 总交易数: {len(closed_trades)} | 最终权益: {equity_curve[-1]:.2f}")
+    return closed_trades.to_array(), equity_curve, reserve_fund
+
+
+def summarize_by_symbol(trades, symbols):
+    """按交易对分组统计: 交易数 / 胜率 / 净盈亏 (U)"""
+    rows = []
+    trades = metrics.as_trades(trades)
+    net = trades['profit'] - trades['entry_fee'] if len(trades) else np.empty(0)
+    for symbol in symbols:
+        mine = trades['symbol'] == symbol if len(trades) else np.zeros(0, dtype=bool)
+        count = int(mine.sum())
+        rows.append({
+            'symbol': symbol,
+            'trades': count,
+            'win_rate': metrics.win_rate(trades[mine]) if count else 0.0,
+            'net_profit': float(net[mine].sum()),
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    SYMBOLS = ['BTC/USDT', 'ETH/USDT']
+
+    # 默认读取 data_download.py 下载的 FUTURES_<交易对>_5m.store，也可以指定 CSV
+    PATHS = {
+        # 'BTC/USDT': r"F:\BIANRobot\text1\FUTURES_BTCUSDT_5m_2020.csv",
+    }
+
+    trades, equity, final_reserve, times = run_portfolio_backtest(SYMBOLS, paths=PATHS)
+    if len(equity) > 0:
+        stats = backtest.summarize(trades, equity, final_reserve)
+        print("\n" + "=" * 40)
+        print(f"📊 组合回测结果 ({times[0]} 至 {times[-1]})")
+        print("-" * 40)
+        print(f"   最终总资产: {stats['total_final_assets']:.2f} U")
+        print(f"   总收益率:   {stats['profit_rate']:.2f}%")
+        print(f"   🚀 峰值收益: {stats['peak_profit_rate']:.2f}%")
+        print(f"   总交易数:   {stats['total_trades']} | 胜率: {stats['win_rate']:.2f}%")
+        print("-" * 40)
+        print(summarize_by_symbol(trades, SYMBOLS).to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+        print("=" * 40)
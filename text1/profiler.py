@@ -0,0 +1,167 @@
+# 文件名: profiler.py
+# 回测引擎的分阶段计时
+#
+# run_backtest 每根K线分四个阶段: 挂单撮合 / 持仓管理 / 信号生成 / 统计资金。
+# 传入一个 PhaseProfiler (或把 backtest.PROFILE 设为 True)，引擎会在每个阶段结束时
+# 调用一次 lap()，累计各阶段的 用时、调用次数、扫描的订单数 (挂单/持仓)，以及 (可选) 分配的内存。
+# 不传时引擎里只多一个 "is not None" 判断，几乎没有开销。
+#
+# 结果可以打印成表格，也可以导出为火焰图工具 (flamegraph.pl / speedscope) 能读的
+# 折叠栈格式: 每行 "run_backtest;array;exit 12345"，数值单位是微秒。
+import time
+import tracemalloc
+
+import pandas as pd
+
+# 阶段名 -> 中文说明 (表格里显示)
+PHASE_LABELS = {
+    'data': '读取K线 (df.iloc)',
+    'entry': '挂单撮合',
+    'exit': '持仓管理',
+    'signal': '信号生成',
+    'equity': '统计资金',
+    'other': '其他 (准备/空仓快进/计时本身)',
+}
+
+
+class PhaseProfiler:
+    def __init__(self, allocations=False):
+        """
+        allocations: 是否统计每个阶段分配的内存 (用 tracemalloc，回测期间所有内存分配都会变慢，
+                     用时会整体偏大，只适合看“哪个阶段在分配内存”)
+                     记的是阶段内内存峰值比阶段开始时多出的字节数: 每根K线的临时对象
+                     (Series、dict、float) 大多在阶段结束前就释放了，只看净增长会显示为 0
+        """
+        self.allocations = allocations
+        self.engine = None
+        self.seconds = {}       # 阶段 -> 累计秒数
+        self.calls = {}         # 阶段 -> 调用次数
+        self.scanned = {}       # 阶段 -> 扫描的订单总数
+        self.alloc = {}         # 阶段 -> 分配的字节数 (每次 = 阶段内峰值 - 阶段开始时)
+        self.bars = 0           # 逐根处理的K线数
+        self.skipped = 0        # 空仓快进跳过的K线数
+        self.max_scanned = 0    # 单根K线单个阶段最多扫描的订单数
+        self.total = 0.0        # 整次回测用时
+        self._run_start = 0.0
+        self._t = 0.0
+        self._m = 0
+        self._alloc_floor = 0   # lap 自身读内存带来的分配 (begin 时量出来，统计时扣掉)
+        self._own_tracemalloc = False
+
+    # -----------------------------------------------------------------
+    # 引擎里调用的接口
+    # -----------------------------------------------------------------
+    def begin(self, engine):
+        """回测开始"""
+        self.engine = engine
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracemalloc = True
+        if self.allocations:
+            self._calibrate()
+        self._run_start = time.perf_counter()
+
+    def _calibrate(self, rounds=9):
+        """
+        空跑几次 lap，量出计时本身的分配量 (取中位数)，统计时扣掉
+        (读内存时创建的 tuple/int 也会被 tracemalloc 记到峰值里，每次几十字节)
+        """
+        self._alloc_floor = 0
+        phases = [('_calibrate', k) for k in range(rounds)]
+        self.mark()
+        for phase in phases:
+            self.lap(phase)
+        samples = sorted(self.alloc.get(phase, 0) for phase in phases)
+        self._alloc_floor = samples[rounds // 2]
+        for table in (self.seconds, self.calls, self.alloc):
+            for phase in phases:
+                table.pop(phase, None)
+        self.bars -= 1
+
+    def end(self):
+        """回测结束，剩余的时间记到 other"""
+        self.total += time.perf_counter() - self._run_start
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+            self._own_tracemalloc = False
+        self.seconds['other'] = self.total - sum(v for k, v in self.seconds.items() if k != 'other')
+
+    def mark(self):
+        """一根K线开始处理"""
+        self.bars += 1
+        if self.allocations:
+            tracemalloc.reset_peak()
+            self._m = tracemalloc.get_traced_memory()[0]
+        self._t = time.perf_counter()
+
+    def lap(self, phase, scanned=0):
+        """一个阶段结束: 从上一次 mark/lap 到现在的时间记到 phase 上"""
+        now = time.perf_counter()
+        if self.allocations:
+            m, peak = tracemalloc.get_traced_memory()
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + (now - self._t)
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        if scanned:
+            self.scanned[phase] = self.scanned.get(phase, 0) + scanned
+            if scanned > self.max_scanned:
+                self.max_scanned = scanned
+        if self.allocations:
+            self.alloc[phase] = self.alloc.get(phase, 0) + max(peak - self._m - self._alloc_floor, 0)
+            # 下一个阶段从这里重新计峰值 (上面更新字典的分配也不算进去)
+            tracemalloc.reset_peak()
+            self._m = tracemalloc.get_traced_memory()[0]
+        # 本次统计自身的开销不算进下一个阶段
+        self._t = time.perf_counter()
+
+    # -----------------------------------------------------------------
+    # 输出
+    # -----------------------------------------------------------------
+    def summary(self):
+        """各阶段统计表 (DataFrame，按用时从高到低)"""
+        rows = []
+        total = self.total or sum(self.seconds.values()) or 1e-12
+        for phase, sec in self.seconds.items():
+            calls = self.calls.get(phase, 0)
+            rows.append({
+                'phase': phase,
+                'label': PHASE_LABELS.get(phase, phase),
+                'seconds': sec,
+                'share_pct': sec / total * 100,
+                'calls': calls,
+                'us_per_call': sec / calls * 1e6 if calls else None,
+                'orders_scanned': self.scanned.get(phase, 0),
+                'scanned_per_bar': self.scanned.get(phase, 0) / self.bars if self.bars else 0.0,
+                'alloc_kb': self.alloc.get(phase, 0) / 1024 if self.allocations else None,
+            })
+        return pd.DataFrame(rows).sort_values('seconds', ascending=False).reset_index(drop=True)
+
+    def print_summary(self, log=print):
+        table = self.summary()
+        log("\n" + "=" * 90)
+        log(f"⏱️ 回测分阶段耗时 [{self.engine}] | 总用时 {self.total:.3f} 秒 | "
+            f"逐根处理 {self.bars} 根 | 空仓快进 {self.skipped} 根 | 单根最多扫描 {self.max_scanned} 单")
+        log("-" * 90)
+        log(f"   {'阶段':<22} {'用时(秒)':>10} {'占比':>7} {'次数':>10} {'微秒/次':>9} "
+            f"{'扫描单数':>10} {'单数/根':>8} {'分配KB':>10}")
+        for _, r in table.iterrows():
+            per_call = f"{r['us_per_call']:.2f}" if r['calls'] else '-'
+            alloc = f"{r['alloc_kb']:,.0f}" if self.allocations else '-'
+            log(f"   {r['label']:<22} {r['seconds']:>10.4f} {r['share_pct']:>6.1f}% {r['calls']:>10,} {per_call:>9} "
+                f"{r['orders_scanned']:>10,} {r['scanned_per_bar']:>8.2f} {alloc:>10}")
+        log("=" * 90)
+        return table
+
+    def folded(self, root='run_backtest'):
+        """折叠栈格式的行列表 (单位: 微秒)"""
+        prefix = f"{root};{self.engine}" if self.engine else root
+        return [f"{prefix};{phase} {int(round(sec * 1e6))}"
+                for phase, sec in self.seconds.items() if sec > 0]
+
+    def dump_folded(self, path, root='run_backtest'):
+        """
+        导出火焰图数据，例如:
+        flamegraph.pl backtest.folded > backtest.svg   或直接拖进 https://www.speedscope.app
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(self.folded(root)) + "\n")
+        return path
@@ -0,0 +1,233 @@
+# 文件名: replay.py
+# 实盘主循环的历史回放 (加速版 main.py)
+#
+# 用本地K线冒充交易所 (sim_exchange.SimExchange)，让历史数据按时间顺序走一遍
+# 和实盘完全相同的 DataManager -> Strategy -> BinanceDriver 路径 (每一轮直接调用 main.process_cycle):
+# - 虚拟时钟代替 time.sleep(10)：每一轮直接把模拟的“现在”往前推，CPU 有多快就跑多快
+# - 只有 5m 数据时，一根K线内部的多次轮询看到的数据完全一样 (正在形成的K线只知道开盘价)，
+#   所以默认每根K线开盘后轮询一次；提供 1m 数据时可以按真实的轮询间隔回放
+# - 下单走 SimExchange 撮合，不碰真实账户
+# - 输出每秒处理的K线数和信号记录，信号记录可以和 run_backtest 的开单条件逐根对比
+import contextlib
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import strategies
+from config import Config
+from data_manager import DataManager
+from drive import BinanceDriver
+from main import process_cycle
+from resampler import aggregate, bucket_offset, timeframe_ms
+from sim_exchange import SimExchange
+from Strategy import Strategy
+
+# DataManager 第一次完整拉取的根数，回放开始前要多读这么多根K线
+WARMUP_BARS = 500
+
+# 回放用的交易规则: 最小名义价值按币安 U 本位合约常见的 5 USDT
+# (模拟交易所默认 100 USDT，QUANTITY_USDT = 100 按步长向下取整后永远不够，回放里一单都成交不了)
+REPLAY_MARKET = {'min_cost': 5.0}
+
+
+def _candles(df):
+    """DataFrame (timestamp/open/high/low/close[/volume]) -> fetch_ohlcv 格式的 numpy 数组"""
+    times = df['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    cols = [df[name].to_numpy(dtype=np.float64) for name in ('open', 'high', 'low', 'close')]
+    vol = df['volume'].to_numpy(dtype=np.float64) if 'volume' in df.columns else np.zeros(len(df))
+    return np.column_stack([times, *cols, vol])
+
+
+def build_exchange(df, timeframes, symbol=Config.SYMBOL, base_tf='5m', sub_df=None, **kwargs):
+    """
+    用本地K线建一个模拟交易所:
+    base_tf 的K线直接用 df，更大的周期在本地合成 (供 DataManager 第一次拉历史)
+    sub_df: 可选的 1m 数据，让正在形成的K线在一根K线内部逐分钟变化
+    kwargs: 传给 SimExchange；没有指定 markets 时用 REPLAY_MARKET 的交易规则
+    """
+    base = _candles(df)
+    by_tf = {base_tf: base}
+    for tf in timeframes:
+        if tf != base_tf and timeframe_ms(tf) > timeframe_ms(base_tf):
+            t, o, h, l, c, v = aggregate(base[:, 0], *base[:, 1:].T, timeframe_ms(tf), bucket_offset(tf))
+            by_tf[tf] = np.column_stack([t, o, h, l, c, v])
+    if sub_df is not None:
+        by_tf['1m'] = _candles(sub_df)
+    kwargs.setdefault('markets', {symbol: REPLAY_MARKET})
+    return SimExchange({symbol: by_tf}, **kwargs)
+
+
+class ReplayRunner:
+    """
+    按虚拟时钟一轮一轮跑 DataManager -> Strategy -> BinanceDriver
+    exchange: build_exchange 建好的 SimExchange
+    poll_seconds: 每轮之间的虚拟秒数；None = 每根最小周期K线开盘后轮询一次
+    alert: 可选的报警对象 (有 check_signal(df) 方法)，每轮用 5m 数据检查一次
+    trade: False 时只记录信号，不下单
+    """
+
+    def __init__(self, exchange, config=Config, poll_seconds=None, alert=None, trade=True):
+        self.exchange = exchange
+        self.cfg = type('ReplayConfig', (config,), {'ENABLE_TRADING': trade, 'SANDBOX_MODE': False})
+        self.poll_seconds = poll_seconds
+        self.alert = alert
+
+        self.driver = BinanceDriver(self.cfg, exchange=exchange)
+        self.data = DataManager(exchange)
+        self.brain = Strategy(self.cfg)
+        self.signals = []   # 每次出信号一条: 时钟 / 正在形成的K线 / 信号 / 价格 / 是否成交
+        self.cycles = 0
+        self.bars = 0
+        self.errors = 0
+
+    def cycle(self):
+        """一轮: 取数据 -> 调用 main.process_cycle (报警 -> 策略 -> 下单)，记录信号"""
+        kline_dict = self.data.get_all_timeframes(self.cfg.SYMBOL, self.cfg.TIMEFRAMES)
+        signal, order = process_cycle(kline_dict, self.driver, self.brain, self.alert, self.cfg)
+        if signal:
+            target_df = kline_dict[self.cfg.TRADE_TIMEFRAME]
+            self.signals.append({
+                'clock': pd.Timestamp(self.exchange.milliseconds(), unit='ms'),
+                'bar_time': pd.Timestamp(target_df['time'].iloc[-1]),
+                'signal': signal,
+                'prev_close': float(target_df['close'].iloc[-2]),
+                'price': float(target_df['close'].iloc[-1]),
+                'filled': order is not None,
+            })
+        return signal
+
+    def _clock_times(self, start_ms, end_ms):
+        """每一轮的虚拟时间 (毫秒)"""
+        if self.poll_seconds:
+            return np.arange(start_ms, end_ms, int(self.poll_seconds * 1000), dtype=np.int64)
+        finest = min(self.exchange.candles[self.cfg.SYMBOL], key=timeframe_ms)
+        ts = self.exchange.candles[self.cfg.SYMBOL][finest][:, 0].astype(np.int64)
+        ts = ts[(ts >= start_ms) & (ts < end_ms)]
+        return ts + 1  # 刚开盘 1 毫秒: 上一根已收盘，新的一根正在形成
+
+    def run(self, start_time, end_time, quiet=True):
+        """
+        从 start_time 回放到 end_time
+        quiet=True 时不打印每一轮的日志 (打印本身比策略还慢)
+        返回统计 dict
+        """
+        start_ms = int(pd.Timestamp(start_time).value // 1_000_000)
+        end_ms = int(pd.Timestamp(end_time).value // 1_000_000)
+        clock = self._clock_times(start_ms, end_ms)
+        trade_ms = timeframe_ms(self.cfg.TRADE_TIMEFRAME)
+
+        out = io.StringIO() if quiet else None
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(out) if quiet else contextlib.nullcontext():
+            for now in clock:
+                self.exchange.now_ms = int(now)
+                try:
+                    self.cycle()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"主程序报错: {e}")
+                self.cycles += 1
+                if quiet:
+                    out.seek(0)
+                    out.truncate()
+        elapsed = time.perf_counter() - t0
+
+        self.bars = int(len(clock) and (clock[-1] - clock[0]) // trade_ms + 1)
+        balance = self.exchange.fetch_balance()['USDT']
+        return {
+            'cycles': self.cycles,
+            'bars': self.bars,
+            'seconds': elapsed,
+            'bars_per_second': self.bars / elapsed if elapsed > 0 else float('inf'),
+            'signals': len(self.signals),
+            'orders': sum(s['filled'] for s in self.signals),
+            'balance': balance['total'],
+            'errors': self.errors,
+            'requests': self.exchange.request_count,
+            'latency': self.driver.latency_summary(),
+        }
+
+    def signal_log(self):
+        return pd.DataFrame(self.signals, columns=['clock', 'bar_time', 'signal', 'prev_close', 'price', 'filled'])
+
+
+def backtest_signals(df, params=None, strategy=None):
+    """
+    run_backtest 每根K线的开单条件 (只看策略规则，不含持仓/偏离值/连续开单这些状态过滤):
+    第 i 根K线用第 i-1 根已收盘K线判断，规则与实盘 Strategy 共用 strategies.py
+    返回 DataFrame: bar_time / signal ('long' / 'short')
+    """
+    p = backtest.get_params(**(params or {}))
+    raw = strategies.create(strategy or Config.STRATEGY).signals(df, p['ENABLE_LONG'], p['ENABLE_SHORT'])
+    signal = np.where(raw == strategies.LONG, 'long', np.where(raw == strategies.SHORT, 'short', ''))
+    out = pd.DataFrame({'bar_time': df['timestamp'].to_numpy(), 'signal': signal})
+    return out[out['signal'] != ''].reset_index(drop=True)
+
+
+def compare_signals(replay_log, bt_signals, start_time=None, end_time=None):
+    """
+    按K线对比回放信号和回测开单条件 ('buy' 对应 'long'，'sell' 对应 'short')
+    返回 (对比表, 一致的根数, 只在回放里出现的根数, 只在回测里出现的根数)
+    """
+    live = replay_log.drop_duplicates('bar_time', keep='first')
+    live = pd.DataFrame({'bar_time': live['bar_time'].to_numpy(),
+                         'replay': live['signal'].map({'buy': 'long', 'sell': 'short'}).to_numpy()})
+    bt = bt_signals.rename(columns={'signal': 'backtest'})
+    if start_time is not None:
+        bt = bt[bt['bar_time'] >= pd.Timestamp(start_time)]
+    if end_time is not None:
+        bt = bt[bt['bar_time'] < pd.Timestamp(end_time)]
+    table = live.merge(bt, on='bar_time', how='outer').sort_values('bar_time').reset_index(drop=True)
+    same = int((table['replay'] == table['backtest']).sum())
+    only_replay = int((table['replay'].notna() & (table['replay'] != table['backtest'])).sum())
+    only_bt = int((table['backtest'].notna() & (table['replay'] != table['backtest'])).sum())
+    return table, same, only_replay, only_bt
+
+
+def run_replay(csv_path, start_time, end_time, sub_csv=None, poll_seconds=None, trade=True,
+               signal_path=None, quiet=True):
+    """
+    读取本地K线并回放 main.py 的实盘循环，打印速度和与回测信号的对比
+    sub_csv: 可选的 1m 数据 (CSV 或 .store)，提供时正在形成的K线逐分钟变化
+    signal_path: 把信号记录和对比表保存成 CSV
+    """
+    warmup = pd.Timedelta(milliseconds=timeframe_ms('5m')) * WARMUP_BARS
+    df = backtest.load_from_csv(csv_path, str(pd.Timestamp(start_time) - warmup), end_time)
+    if df.empty:
+        return None
+    sub_df = backtest.load_from_csv(sub_csv, start_time, end_time) if sub_csv else None
+
+    exchange = build_exchange(df, Config.TIMEFRAMES, sub_df=sub_df, now_ms=int(df['timestamp'].iloc[0].value // 1_000_000),
+                              leverage=Config.LEVERAGE)
+    runner = ReplayRunner(exchange, poll_seconds=poll_seconds, trade=trade)
+    print(f"⏩ 开始回放: {start_time} ~ {end_time} | 周期: {', '.join(Config.TIMEFRAMES)}")
+    stats = runner.run(start_time, end_time, quiet=quiet)
+
+    log = runner.signal_log()
+    # 回测这一侧也要用实盘的策略和多空开关，否则实盘只做多时会多出一堆“只有回测”的空单信号
+    bt_signals = backtest_signals(df, params={'ENABLE_LONG': Config.ENABLE_LONG, 'ENABLE_SHORT': Config.ENABLE_SHORT},
+                                  strategy=Config.STRATEGY)
+    table, same, only_replay, only_bt = compare_signals(log, bt_signals, start_time, end_time)
+    print("\n" + "=" * 50)
+    print(f"⏱️ {stats['bars']} 根K线 / {stats['cycles']} 轮，用时 {stats['seconds']:.2f} 秒 "
+          f"({stats['bars_per_second']:.0f} 根/秒)")
+    print(f"📶 信号 {stats['signals']} 次 | 成交 {stats['orders']} 单 | 模拟账户余额 {stats['balance']:.2f} USDT")
+    if stats['errors']:
+        print(f"⚠️ 有 {stats['errors']} 轮报错 (quiet=False 可以看到详细信息)")
+    print(f"🔍 与回测开单条件对比: 一致 {same} 根 | 只有回放 {only_replay} 根 | 只有回测 {only_bt} 根")
+    print("=" * 50)
+
+    if signal_path:
+        table.to_csv(signal_path, index=False)
+        print(f"✅ 信号对比已保存: {signal_path}")
+    return stats, log, table
+
+
+if __name__ == "__main__":
+    CSV_PATH = r"F:\BIANRobot\text1\FUTURES_BTCUSDT_5m_2020.csv"
+
+    run_replay(CSV_PATH, '2026-01-01 00:00:00', '2026-01-10 00:00:00',
+               signal_path=r"F:\BIANRobot\text1\replay_signals.csv")
@@ -0,0 +1,97 @@
+# 文件名: resampler.py
+# 用基础周期 (5m) 的K线在本地合成更大周期 (15m / 30m / 1h ...)
+#
+# 15m / 30m / 1h 都能由 5m 合成，不需要每轮再向交易所各请求一次:
+# - 按交易所的分桶边界对齐: 分钟/小时/天按 UTC 从 1970-01-01 起整除，周线从周一 00:00 开始
+# - 开 = 桶内第一根的开盘，高/低 = 最高/最低，收 = 最后一根的收盘，量 = 求和
+# - 最后一个桶里的基础K线还没走完时，合成出来的也是“正在形成”的K线，随基础K线一起更新
+# - 增量合成: 每轮只重算基础K线有变化的那一两个桶，写进目标周期的 CandleBuffer
+# 月线长度不固定，不能这样合成，仍由交易所提供。
+import ccxt
+import numpy as np
+import pandas as pd
+
+# 周线从周一开始，1970-01-01 是周四，往后 4 天是第一个周一
+_WEEK_OFFSET_MS = 4 * 86400_000
+
+
+def timeframe_ms(timeframe):
+    """'15m' -> 900000"""
+    return int(ccxt.Exchange.parse_timeframe(timeframe) * 1000)
+
+
+def bucket_offset(timeframe):
+    """分桶起点的偏移 (毫秒)，只有周线不是从 1970-01-01 00:00 开始"""
+    return _WEEK_OFFSET_MS if timeframe.endswith('w') else 0
+
+
+def can_derive(base_tf, timeframe, capacity=500):
+    """
+    timeframe 能否由 base_tf 的缓冲区合成:
+    必须是 base_tf 的整数倍、不是月线，并且一个桶的根数不超过缓冲区的一半
+    (保证需要重算的桶在缓冲区里总是完整的)
+    """
+    if timeframe == base_tf or timeframe.endswith('M'):
+        return False
+    base, tf = timeframe_ms(base_tf), timeframe_ms(timeframe)
+    return tf > base and tf % base == 0 and tf // base <= capacity // 2
+
+
+def aggregate(times, o, h, l, c, v, tf_ms, offset=0):
+    """
+    把按时间升序的K线数组合成 tf_ms 周期 (纯数组运算)
+    times 为毫秒时间戳；缺失的基础K线直接跳过 (桶里有几根算几根)
+    返回 (桶起始时间, 开, 高, 低, 收, 量) 数组
+    """
+    times = np.asarray(times, dtype=np.int64)
+    if len(times) == 0:
+        empty = np.empty(0)
+        return np.empty(0, dtype=np.int64), empty, empty, empty, empty, empty
+    bucket = (times - offset) // tf_ms * tf_ms + offset
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bucket)]
+    return (bucket[starts], o[starts], np.maximum.reduceat(h, starts), np.minimum.reduceat(l, starts),
+            c[ends - 1], np.add.reduceat(v, starts))
+
+
+def resample_frame(df, timeframe, time_column='timestamp'):
+    """
+    DataFrame 版 (回测/统计用): 列 time_column (datetime) + open/high/low/close[/volume]
+    返回同样列名的合成结果
+    """
+    times = df[time_column].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    cols = [df[name].to_numpy(dtype=np.float64) for name in ('open', 'high', 'low', 'close')]
+    vol = df['volume'].to_numpy(dtype=np.float64) if 'volume' in df.columns else np.zeros(len(df))
+    t, o, h, l, c, v = aggregate(times, *cols, vol, timeframe_ms(timeframe), bucket_offset(timeframe))
+    out = pd.DataFrame({time_column: t.astype('datetime64[ms]'), 'open': o, 'high': h, 'low': l, 'close': c})
+    if 'volume' in df.columns:
+        out['volume'] = v
+    return out
+
+
+def resample_into(base_buf, target_buf, timeframe, since=None):
+    """
+    增量合成: 把 base_buf 里 since (毫秒) 之后有变化的基础K线合成进 target_buf
+    since=None 表示重算缓冲区里所有完整的桶
+    桶的起点早于 base_buf 最早一根时 (基础数据不完整)，保留 target_buf 里原来的那根不动
+    返回新增的K线根数
+    """
+    times, ohlcv = base_buf.view()
+    if len(times) == 0:
+        return 0
+    tf_ms, offset = timeframe_ms(timeframe), bucket_offset(timeframe)
+    first = int(times[0])
+    start = first if since is None else max(int(since), first)
+    start = (start - offset) // tf_ms * tf_ms + offset
+    if start < first:
+        # 这个桶开头的基础K线已经不在缓冲区里了，从下一个桶开始
+        start += tf_ms
+    lo = int(np.searchsorted(times, start))
+    if lo >= len(times):
+        return 0
+
+    t, o, h, l, c, v = aggregate(times[lo:], *ohlcv[:, lo:], tf_ms, offset)
+    added = 0
+    for k in range(len(t)):
+        added += target_buf.update(int(t[k]), float(o[k]), float(h[k]), float(l[k]), float(c[k]), float(v[k]))
+    return added
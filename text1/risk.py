@@ -0,0 +1,271 @@
+# 文件名: risk.py
+# 蒙特卡洛 / 自助法 (bootstrap) 风险分析
+#
+# 回测只给出“这一种交易顺序”下的结果。把 run_backtest 的 closed_trades 打乱/重抽成几万条路径，
+# 按同样的开仓金额规则 (MIX_UP / FIXED_MARGIN_RATE / MAX_OPEN_LIMIT) 重新复利，
+# 就能看到最终资金、最大回撤的分布，以及爆仓 (资金少到开不了单) 的概率。
+#
+# 所有路径放在一个二维数组里一起算，不逐条路径循环:
+# - 资金曲线 (replay_equity):
+#   按比例复利 (没有封顶): 资金 = 本金 × 累乘(1 + 比例 × 单笔收益率)
+#   固定金额开单:          资金 = 本金 + 累加(固定保证金 × 单笔收益率)
+#   有 MAX_OPEN_LIMIT 封顶: 开仓金额随资金变化且有上限，只能按交易顺序逐笔推进，
+#   但每一步仍是对所有路径的一次数组运算
+# - 蒙特卡洛 (monte_carlo) 只要 最终资金 / 最大回撤 / 最低资金，统一逐笔推进、边走边记，
+#   不生成整条资金曲线 (整段累乘/累加要在大矩阵上来回扫很多遍，反而更慢)
+# 内部矩阵按 (交易数, 路径数) 排列，逐笔推进时每一步读写的都是连续内存。
+# 路径按批次计算，内存占用约为 批次 × 交易数 × 12 字节。
+import numpy as np
+
+import backtest
+import metrics
+
+# 开仓金额不超过这个数时引擎不会开单 (与 run_backtest 的 margin_to_use > 5 一致)
+MIN_MARGIN = 5
+
+
+def trade_returns(trades):
+    """
+    每笔交易相对保证金的净收益率 (已扣开仓费和平仓费)
+    例: 保证金 100U，净赚 3U -> 0.03
+    """
+    if not len(trades):
+        return np.empty(0)
+    trades = metrics.as_trades(trades)
+    return (trades['profit'] - trades['entry_fee']) / trades['margin']
+
+
+def _resample_t(rng, n, paths, method='shuffle', block=20):
+    """resample_index 的实现，按 (交易数, 路径数) 排列: 每一行是所有路径的同一笔，逐笔推进时内存连续"""
+    if method == 'shuffle':
+        # 每条路径单独洗牌 (rng.permutation 是 C 实现的 Fisher-Yates，比 rng.permuted 整块洗快)
+        idx = np.empty((paths, n), dtype=np.int32)
+        for row in idx:
+            row[:] = rng.permutation(n)
+        return np.ascontiguousarray(idx.T)
+    if method == 'bootstrap':
+        return rng.integers(0, n, size=(n, paths), dtype=np.int32)
+    if method == 'block':
+        block = max(1, min(block, n))
+        n_blocks = -(-n // block)
+        starts = rng.integers(0, n - block + 1, size=(n_blocks, paths), dtype=np.int32)
+        return (starts[:, None, :] + np.arange(block, dtype=np.int32)[None, :, None]).reshape(-1, paths)[:n]
+    raise ValueError(f"未知的抽样方法: {method} (可选 'shuffle' / 'bootstrap' / 'block')")
+
+
+def _resample_returns_t(rng, r, paths, method='shuffle', block=20):
+    """重抽样后的收益率矩阵 (交易数, 路径数)，与 r[resample_index(...)] 的转置相同"""
+    if method == 'shuffle':
+        # 直接洗收益率本身 (交换顺序与洗序号完全一样)，省掉一次大矩阵的随机取值
+        out = np.empty((len(r), paths))
+        for i in range(paths):
+            out[:, i] = rng.permutation(r)
+        return out
+    return r[_resample_t(rng, len(r), paths, method, block)]
+
+
+def resample_index(rng, n, paths, method='shuffle', block=20):
+    """
+    生成 (paths, n) 的交易序号矩阵
+    - shuffle:   每条路径是原交易的一个随机排列 (交易不变，只改顺序)
+    - bootstrap: 有放回地随机抽 n 笔
+    - block:     按连续 block 笔一段整段抽取 (保留连胜/连亏的聚集性)
+    """
+    return _resample_t(rng, n, paths, method, block).T
+
+
+def _margin_rule(params):
+    """开仓金额规则: (本金, 复利比例, 封顶金额, 开不了单的资金线)"""
+    balance0 = float(params['INITIAL_BALANCE'])
+    rate = float(params['FIXED_MARGIN_RATE'])
+    cap = float(params['MAX_OPEN_LIMIT']) if params['MAX_OPEN'] and params['MAX_OPEN_LIMIT'] > 0 else np.inf
+    # run_backtest 只在 margin_to_use > 5 且 资金 > margin_to_use 时开单，换算成资金的下限:
+    # 资金不高于这条线就再也开不了单，之后资金不再变化
+    if params['MIX_UP']:
+        dead_level = MIN_MARGIN / rate if rate < 1 and cap > MIN_MARGIN else np.inf
+    else:
+        margin = min(balance0, cap)
+        dead_level = margin if margin > MIN_MARGIN else np.inf
+    return balance0, rate, cap, dead_level
+
+
+def _freeze_after_ruin(equity_t, dead_level):
+    """资金跌到开不了单之后就不会再有交易，把之后的数值固定住"""
+    dead = equity_t <= dead_level
+    after = np.zeros_like(dead)
+    np.logical_or.accumulate(dead[:-1], axis=0, out=after[1:])
+    first = np.argmax(dead, axis=0)
+    np.copyto(equity_t, equity_t[first, np.arange(equity_t.shape[1])][None, :], where=after)
+    return equity_t
+
+
+def _replay_steps(returns_t, params, equity_t=None):
+    """
+    逐笔推进 (每一步对所有路径一起算一次数组运算)，开仓金额规则与 run_backtest 相同
+    封顶复利只能这样算；其它规则也用它做蒙特卡洛，因为不需要整条资金曲线:
+    equity_t=None 时边走边记，返回 (最终资金, 最大回撤, 最低资金)，内存只有几个长度为路径数的数组
+    """
+    balance0, rate, cap, dead_level = _margin_rule(params)
+    fixed = None if params['MIX_UP'] else min(balance0, cap)
+    paths = returns_t.shape[1]
+    balance = np.full(paths, balance0)
+    peak = balance.copy()
+    low = np.full(paths, np.inf)
+    worst = np.ones(paths)       # 资金 / 峰值 的最小值
+    margin = np.empty(paths)
+    ratio = np.empty(paths)
+    alive = np.empty(paths, dtype=bool)
+    for k, r in enumerate(returns_t):
+        np.greater(balance, dead_level, out=alive)
+        if fixed is None:
+            np.multiply(balance, rate, out=margin)
+            if cap < np.inf:
+                np.minimum(margin, cap, out=margin)
+            margin *= alive
+        else:
+            np.multiply(alive, fixed, out=margin)
+        margin *= r
+        balance += margin
+        np.maximum(balance, 0, out=balance)
+        if equity_t is not None:
+            equity_t[k + 1] = balance
+            continue
+        np.maximum(peak, balance, out=peak)
+        np.divide(balance, peak, out=ratio)
+        np.minimum(worst, ratio, out=worst)
+        np.minimum(low, balance, out=low)
+    return balance, 1 - worst, low
+
+
+def _equity_t(returns_t, params):
+    """replay_equity 的实现，returns_t 为 (交易数, 路径数)，返回 (交易数 + 1, 路径数)"""
+    balance0, rate, cap, dead_level = _margin_rule(params)
+    n, paths = returns_t.shape
+    equity = np.empty((n + 1, paths))
+    equity[0] = balance0
+
+    if params['MIX_UP'] and np.isinf(cap):
+        # 按比例复利: 每笔都是当前资金的固定比例
+        growth = rate * returns_t
+        growth += 1
+        np.cumprod(growth, axis=0, out=equity[1:])
+        equity[1:] *= balance0
+        np.maximum(equity, 0, out=equity)
+        return _freeze_after_ruin(equity, dead_level)
+
+    if not params['MIX_UP']:
+        # 固定金额: 每笔都是 INITIAL_BALANCE (可能被封顶)，资金必须大于它才开单
+        np.cumsum(min(balance0, cap) * returns_t, axis=0, out=equity[1:])
+        equity[1:] += balance0
+        np.maximum(equity, 0, out=equity)
+        return _freeze_after_ruin(equity, dead_level)
+
+    # 按比例复利 + 封顶
+    _replay_steps(returns_t, params, equity)
+    return equity
+
+
+def replay_equity(returns, params):
+    """
+    按回测的开仓金额规则，把每条路径的单笔收益率复利成资金曲线
+    returns: (paths, n) 单笔收益率
+    返回 (paths, n + 1) 的账户资金，第 0 列是本金
+    """
+    return _equity_t(np.ascontiguousarray(np.asarray(returns, dtype=np.float64).T), params).T
+
+
+def _max_drawdown_t(equity_t):
+    ratio = np.maximum.accumulate(equity_t, axis=0)
+    np.divide(equity_t, ratio, out=ratio)
+    return 1 - ratio.min(axis=0)
+
+
+def max_drawdown(equity):
+    """每条路径的最大回撤 (0~1)"""
+    # 峰值从本金开始只增不减，始终大于 0
+    return _max_drawdown_t(np.asarray(equity).T)
+
+
+def monte_carlo(trades, params=None, paths=100000, method='shuffle', block=20,
+                ruin_level=0.0, batch=None, seed=None):
+    """
+    对 closed_trades 做重抽样，返回各路径的 最终资金 / 最大回撤 / 是否爆仓
+    params:     回测参数 (见 backtest.get_params)，只需给出要覆盖的项
+    ruin_level: 资金跌破 本金 × ruin_level 记为爆仓 (0 = 只有资金少到开不了单才算)
+    batch:      每批路径数，默认让每批的收益率矩阵约 100MB
+    """
+    params = backtest.get_params(**(params or {}))
+    r = trade_returns(trades)
+    n = len(r)
+    balance0, rate, cap, dead_level = _margin_rule(params)
+    if n == 0:
+        return {'final': np.full(paths, balance0), 'max_drawdown': np.zeros(paths),
+                'ruined': np.zeros(paths, dtype=bool), 'trades': 0}
+
+    # 逐笔推进，每一步是一次 Python 调用: 批次大一些摊薄调用开销
+    batch = batch or max(1, min(paths, 12_000_000 // n))
+    rng = np.random.default_rng(seed)
+    ruin_line = max(balance0 * ruin_level, dead_level)
+
+    final = np.empty(paths)
+    mdd = np.empty(paths)
+    ruined = np.empty(paths, dtype=bool)
+    for lo in range(0, paths, batch):
+        hi = min(lo + batch, paths)
+        returns_t = _resample_returns_t(rng, r, hi - lo, method, block)
+        final[lo:hi], mdd[lo:hi], low = _replay_steps(returns_t, params)
+        ruined[lo:hi] = low <= ruin_line
+
+    return {'final': final, 'max_drawdown': mdd, 'ruined': ruined, 'trades': n,
+            'actual': replay_equity(r[None, :], params)[0]}
+
+
+def summarize_risk(result, params=None):
+    """把 monte_carlo 的结果整理成分位数表 (收益率和回撤单位 %)"""
+    params = backtest.get_params(**(params or {}))
+    balance0 = float(params['INITIAL_BALANCE'])
+    ret = (result['final'] / balance0 - 1) * 100
+    dd = result['max_drawdown'] * 100
+    q = [5, 25, 50, 75, 95]
+    return {
+        'paths': len(ret),
+        'trades': result['trades'],
+        'return_mean': float(ret.mean()),
+        'return_pct': dict(zip(q, np.percentile(ret, q).tolist())),
+        'max_dd_pct': dict(zip(q, np.percentile(dd, q).tolist())),
+        'prob_loss': float((ret < 0).mean() * 100),
+        'prob_ruin': float(result['ruined'].mean() * 100),
+    }
+
+
+def print_risk_report(result, params=None, method='shuffle'):
+    s = summarize_risk(result, params)
+    print("\n" + "=" * 60)
+    print(f"🎲 蒙特卡洛风险分析 [{method}] | {s['paths']} 条路径 × {s['trades']} 笔交易")
+    print("-" * 60)
+    if 'actual' in result:
+        balance0 = result['actual'][0]
+        print(f"   实际顺序:  收益 {(result['actual'][-1] / balance0 - 1) * 100:.2f}% | "
+              f"最大回撤 {max_drawdown(result['actual'][None, :])[0] * 100:.2f}%")
+    print(f"   {'分位':>6} | {'收益率':>10} | {'最大回撤':>10}")
+    for p in s['return_pct']:
+        print(f"   {p:>5}% | {s['return_pct'][p]:>9.2f}% | {s['max_dd_pct'][p]:>9.2f}%")
+    print("-" * 60)
+    print(f"   平均收益: {s['return_mean']:.2f}% | 亏损概率: {s['prob_loss']:.2f}% | 爆仓概率: {s['prob_ruin']:.2f}%")
+    print("=" * 60)
+    return s
+
+
+if __name__ == "__main__":
+    import time
+
+    CSV_PATH = r"F:\BIANRobot\text1\FUTURES_BTCUSDT_5m_2020.csv"
+
+    df = backtest.load_from_csv(CSV_PATH)
+    trades, equity, final_reserve = backtest.run_backtest(df)
+
+    for method in ('shuffle', 'bootstrap', 'block'):
+        t0 = time.time()
+        result = monte_carlo(trades, paths=100000, method=method, ruin_level=0.5)
+        print_risk_report(result, method=method)
+        print(f"⏱️ 用时 {time.time() - t0:.1f} 秒")
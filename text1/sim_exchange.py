@@ -0,0 +1,671 @@
+# 文件名: sim_exchange.py
+# 本地模拟交易所 (离线测试 / 压测用)
+#
+# 用本地K线数据冒充 ccxt.binance，接口名字和返回格式与 ccxt 一致，
+# 可以注入网络延迟、限频和随机错误，用来测试下载器、数据层、下单驱动等代码，不需要联网。
+#
+# 行情: fetch_ohlcv / fetch_open_interest_history / fetch_ticker
+# 账户: load_markets / fetch_balance / set_leverage / set_margin_mode
+# 下单: create_order / cancel_order / fetch_order / fetch_open_orders / fetch_positions
+# 成交规则与 run_backtest 相同: 限价买单开盘价更低按开盘价成交，否则最低价碰到挂单价按挂单价成交
+# (卖单对称)，手续费按名义价值 × fee_rate 收取，保证金 = 名义价值 / 杠杆。
+# 设置了 now_ms (模拟的“现在”) 时只返回那一刻已经发生的数据，没有未来数据。
+import asyncio
+import itertools
+import json
+import threading
+import time
+
+import ccxt
+import numpy as np
+import pandas as pd
+from ccxt.base.decimal_to_precision import ROUND, TICK_SIZE, TRUNCATE, decimal_to_precision
+
+
+def make_candles(n, start='2020-01-01 00:00:00', timeframe='5m', price=10000.0, seed=0):
+    """生成 n 根随机游走K线，格式同 fetch_ohlcv: [[ts, open, high, low, close, volume], ...] (numpy 数组)"""
+    rng = np.random.default_rng(seed)
+    tf_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+    ts = ccxt.Exchange.parse8601(start) + np.arange(n, dtype=np.int64) * tf_ms
+    close = price * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    open_ = np.concatenate([[price], close[:-1]])
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.001, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.001, n)))
+    volume = rng.uniform(1, 100, n)
+    return np.column_stack([ts, open_, high, low, close, volume])
+
+
+def make_open_interest(candles, base=50000.0, seed=0):
+    """按K线生成一份随机的持仓量历史 [[ts, 持仓数量, 持仓价值], ...] (时间戳与K线相同)"""
+    rng = np.random.default_rng(seed)
+    candles = np.asarray(candles, dtype=np.float64)
+    amount = base * np.exp(np.cumsum(rng.normal(0, 0.001, len(candles))))
+    return np.column_stack([candles[:, 0], amount, amount * candles[:, 4]])
+
+
+def candles_from_csv(csv_path):
+    """读取 data_download.py 导出的 CSV，转成 fetch_ohlcv 格式的 numpy 数组"""
+    df = pd.read_csv(csv_path)
+    df.columns = [x.lower() for x in df.columns]
+    return df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64)
+
+
+# 模拟市场的默认交易规则 (与币安 BTCUSDT 永续相同)
+DEFAULT_MARKET = {
+    'amount_step': 0.001,   # 数量步长
+    'price_step': 0.1,      # 价格步长
+    'min_amount': 0.001,    # 最小下单数量
+    'min_cost': 100.0,      # 最小名义价值 (USDT)
+}
+
+
+class SimExchange:
+    """
+    同步版模拟交易所
+    candles: {symbol: {timeframe: 数组}} 或 {symbol: 数组} (只有一个周期时)
+    latency: 每次请求额外等待的秒数 (模拟网络往返)
+    open_interest: 持仓量历史，格式同 candles (不传则 fetch_open_interest_history 返回空)
+    now_ms: 模拟的“现在” (毫秒)，None = 所有数据都已发生；可以随时修改或用 advance() 推进
+    balance: 初始 USDT 余额
+    fee_rate / leverage: 手续费率和默认杠杆，不传则用 backtest.py 的 FEE_RATE / LEVERAGE
+    slippage: 市价单相对最新价的滑点比例 (买入加价，卖出减价)
+    rate_limit: 每秒最多请求次数 (None = 不限制)；超出时 enableRateLimit=True 就等待，否则抛 RateLimitExceeded
+    error_rate: 每次请求随机失败 (NetworkError) 的概率，用 seed 固定随机序列
+    markets: {symbol: 覆盖 DEFAULT_MARKET 的字段}
+    """
+
+    precisionMode = ccxt.TICK_SIZE
+
+    def __init__(self, candles, timeframe='5m', latency=0.0, now_ms=None, open_interest=None,
+                 balance=10000.0, fee_rate=None, leverage=None, slippage=0.0,
+                 rate_limit=None, enableRateLimit=True, error_rate=0.0, seed=0, markets=None):
+        self.candles = {}
+        for symbol, value in candles.items():
+            by_tf = value if isinstance(value, dict) else {timeframe: value}
+            self.candles[symbol] = {tf: np.asarray(arr, dtype=np.float64) for tf, arr in by_tf.items()}
+        self.open_interest = {}
+        for symbol, value in (open_interest or {}).items():
+            by_tf = value if isinstance(value, dict) else {timeframe: value}
+            self.open_interest[symbol] = {tf: np.asarray(arr, dtype=np.float64) for tf, arr in by_tf.items()}
+        self.latency = latency
+        self.now_ms = now_ms
+        self.request_count = 0
+        self.calls = {}  # 方法名 -> 请求次数
+
+        # --- 限频 / 错误注入 ---
+        self.rate_limit = rate_limit
+        self.enableRateLimit = enableRateLimit
+        self.error_rate = error_rate
+        self._rng = np.random.default_rng(seed)
+        self._errors = []           # fail_next() 排队的错误
+        self._window = []           # 最近 1 秒内的请求时间
+        self._lock = threading.Lock()
+
+        # --- 账户 ---
+        if fee_rate is None or leverage is None:
+            import backtest
+            fee_rate = backtest.FEE_RATE if fee_rate is None else fee_rate
+            leverage = backtest.LEVERAGE if leverage is None else leverage
+        self.fee_rate = fee_rate
+        self.default_leverage = leverage
+        self.slippage = slippage
+        self.wallet = float(balance)
+        self.leverages = {}
+        self.margin_modes = {}
+        self.positions = {}         # symbol -> {'amount': 带符号数量, 'entry_price', 'margin'}
+        self.orders = {}            # id -> ccxt 格式订单
+        self.trades = []            # 所有成交记录
+        self._order_ids = itertools.count(1)
+        self._matched_to = {}       # symbol -> 限价单已经撮合到的时间 (毫秒)
+
+        self._market_rules = {symbol: dict(DEFAULT_MARKET, **((markets or {}).get(symbol) or {}))
+                              for symbol in self.candles}
+        self.markets = None
+        self.symbols = []
+
+    # --- 与 ccxt 相同的工具函数 ---
+    parse8601 = staticmethod(ccxt.Exchange.parse8601)
+    parse_timeframe = staticmethod(ccxt.Exchange.parse_timeframe)
+    iso8601 = staticmethod(ccxt.Exchange.iso8601)
+
+    def milliseconds(self):
+        """模拟的“现在”：默认是所有数据最后一根K线收盘的时间"""
+        if self.now_ms is not None:
+            return self.now_ms
+        last = 0
+        for by_tf in self.candles.values():
+            for tf, arr in by_tf.items():
+                if len(arr):
+                    last = max(last, int(arr[-1, 0]) + self.parse_timeframe(tf) * 1000)
+        return last
+
+    def advance(self, ms):
+        """把模拟时钟往前推 ms 毫秒 (now_ms 为 None 时从第一根K线开始)"""
+        if self.now_ms is None:
+            self.now_ms = min(int(arr[0, 0]) for by_tf in self.candles.values() for arr in by_tf.values() if len(arr))
+        self.now_ms += int(ms)
+        return self.now_ms
+
+    def set_sandbox_mode(self, enabled):
+        pass
+
+    # ------------------------------------------------------------------
+    # 请求入口: 计数 / 限频 / 错误注入
+    # ------------------------------------------------------------------
+    def fail_next(self, error=None, count=1):
+        """让接下来 count 次请求抛出 error (默认 ccxt.NetworkError)"""
+        self._errors.extend([error or ccxt.NetworkError('模拟网络错误')] * count)
+
+    def _admit(self, method):
+        """
+        每个接口开头调用一次: 记录请求次数，检查限频和错误注入
+        返回因为限频需要额外等待的秒数 (由同步/异步版本各自去等)
+        """
+        with self._lock:
+            self.request_count += 1
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if self._errors:
+                raise self._errors.pop(0)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                raise ccxt.NetworkError(f'模拟网络错误 ({method})')
+
+            wait = 0.0
+            if self.rate_limit:
+                now = time.monotonic()
+                self._window = [t for t in self._window if now - t < 1.0]
+                if len(self._window) >= self.rate_limit:
+                    if not self.enableRateLimit:
+                        raise ccxt.RateLimitExceeded(f'binance 429 Too Many Requests ({method})')
+                    wait = self._window[-self.rate_limit] + 1.0 - now
+                self._window.append(now + wait)
+            return wait
+
+    def _request(self, method):
+        wait = self._admit(method)
+        if self.latency or wait:
+            time.sleep(self.latency + wait)
+
+    # ------------------------------------------------------------------
+    # 行情
+    # ------------------------------------------------------------------
+    def _finest(self, symbol):
+        """该交易对最小的周期 (用来算最新价、撮合限价单)"""
+        return min(self.candles[symbol], key=self.parse_timeframe)
+
+    def _forming_bar(self, symbol, timeframe, start):
+        """
+        now_ms 落在 [start, start + 周期) 里时正在形成的那根K线:
+        用更小周期里已经收盘的K线合成；没有更小周期的数据时只知道开盘价
+        """
+        now = self.now_ms
+        finer = [tf for tf in self.candles[symbol]
+                 if self.parse_timeframe(tf) < self.parse_timeframe(timeframe)]
+        if finer:
+            tf = min(finer, key=self.parse_timeframe)
+            arr = self.candles[symbol][tf]
+            tf_ms = self.parse_timeframe(tf) * 1000
+            lo = int(np.searchsorted(arr[:, 0], start, side='left'))
+            hi = int(np.searchsorted(arr[:, 0], now - tf_ms, side='right'))
+            part = arr[lo:hi]
+            if len(part):
+                return [start, float(part[0, 1]), float(part[:, 2].max()), float(part[:, 3].min()),
+                        float(part[-1, 4]), float(part[:, 5].sum())]
+        arr = self.candles[symbol][timeframe]
+        row = arr[int(np.searchsorted(arr[:, 0], start, side='left'))]
+        return [start, float(row[1]), float(row[1]), float(row[1]), float(row[1]), 0.0]
+
+    def _slice_ohlcv(self, symbol, timeframe, since=None, limit=500):
+        arr = self.candles[symbol][timeframe]
+        ts = arr[:, 0]
+        # now_ms 之后开盘的K线还没发生
+        end = len(arr) if self.now_ms is None else int(np.searchsorted(ts, self.now_ms, side='right'))
+        if since is None:
+            lo = max(end - limit, 0)
+        else:
+            lo = int(np.searchsorted(ts, since, side='left'))
+        rows = arr[lo:min(lo + limit, end)]
+        out = [[int(r[0]), float(r[1]), float(r[2]), float(r[3]), float(r[4]), float(r[5])] for r in rows]
+        if out and self.now_ms is not None and out[-1][0] + self.parse_timeframe(timeframe) * 1000 > self.now_ms:
+            out[-1] = self._forming_bar(symbol, timeframe, out[-1][0])
+        return out
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=500, params=None):
+        self._request('fetch_ohlcv')
+        return self._slice_ohlcv(symbol, timeframe, since, limit)
+
+    def _slice_open_interest(self, symbol, timeframe, since=None, limit=None):
+        limit = min(limit or 30, 500)  # 与币安一致: 默认 30 条，最多 500 条
+        arr = self.open_interest.get(symbol, {}).get(timeframe)
+        if arr is None:
+            return []
+        if self.now_ms is not None:
+            arr = arr[:int(np.searchsorted(arr[:, 0], self.now_ms, side='right'))]
+        lo = max(len(arr) - limit, 0) if since is None else int(np.searchsorted(arr[:, 0], since, side='left'))
+        return [{'symbol': symbol, 'timestamp': int(r[0]), 'datetime': self.iso8601(int(r[0])),
+                 'openInterestAmount': float(r[1]), 'openInterestValue': float(r[2])}
+                for r in arr[lo:lo + limit]]
+
+    def fetch_open_interest_history(self, symbol, timeframe='5m', since=None, limit=None, params=None):
+        self._request('fetch_open_interest_history')
+        return self._slice_open_interest(symbol, timeframe, since, limit)
+
+    def _last_price(self, symbol):
+        """最新价 = 最小周期正在形成 (或最后一根) K线的收盘价"""
+        bars = self._slice_ohlcv(symbol, self._finest(symbol), limit=1)
+        if not bars:
+            raise ccxt.BadSymbol(f'{symbol} 在 {self.iso8601(self.now_ms)} 之前没有行情')
+        return bars[-1][4]
+
+    def _ticker(self, symbol):
+        last = self._last_price(symbol)
+        now = self.milliseconds()
+        return {'symbol': symbol, 'timestamp': now, 'datetime': self.iso8601(now),
+                'last': last, 'close': last, 'bid': last, 'ask': last}
+
+    def fetch_ticker(self, symbol, params=None):
+        self._request('fetch_ticker')
+        return self._ticker(symbol)
+
+    # ------------------------------------------------------------------
+    # 市场规则 / 账户
+    # ------------------------------------------------------------------
+    def _markets(self):
+        markets = {}
+        for symbol, rule in self._market_rules.items():
+            base, quote = symbol.split('/')
+            markets[symbol] = {
+                'id': base + quote, 'symbol': symbol, 'base': base, 'quote': quote, 'settle': quote,
+                'type': 'swap', 'swap': True, 'future': False, 'contract': True, 'linear': True,
+                'active': True, 'contractSize': 1.0,
+                'precision': {'amount': rule['amount_step'], 'price': rule['price_step']},
+                'limits': {'amount': {'min': rule['min_amount'], 'max': None},
+                           'price': {'min': None, 'max': None},
+                           'cost': {'min': rule['min_cost'], 'max': None},
+                           'leverage': {'min': 1, 'max': 125}},
+                'taker': self.fee_rate, 'maker': self.fee_rate,
+            }
+        return markets
+
+    def load_markets(self, reload=False, params=None):
+        if self.markets is None or reload:
+            self._request('load_markets')
+            self.markets = self._markets()
+            self.symbols = sorted(self.markets)
+        return self.markets
+
+    def market(self, symbol):
+        if self.markets is None:
+            self.markets = self._markets()
+            self.symbols = sorted(self.markets)
+        if symbol not in self.markets:
+            raise ccxt.BadSymbol(f'binance does not have market symbol {symbol}')
+        return self.markets[symbol]
+
+    def amount_to_precision(self, symbol, amount):
+        step = self.market(symbol)['precision']['amount']
+        return decimal_to_precision(amount, TRUNCATE, step, TICK_SIZE)
+
+    def price_to_precision(self, symbol, price):
+        step = self.market(symbol)['precision']['price']
+        return decimal_to_precision(price, ROUND, step, TICK_SIZE)
+
+    def _used_margin(self):
+        used = sum(p['margin'] for p in self.positions.values())
+        used += sum(o['info']['margin'] for o in self.orders.values() if o['status'] == 'open')
+        return used
+
+    def _balance(self):
+        used = self._used_margin()
+        free, total = self.wallet - used, self.wallet
+        return {'info': {}, 'USDT': {'free': free, 'used': used, 'total': total},
+                'free': {'USDT': free}, 'used': {'USDT': used}, 'total': {'USDT': total}}
+
+    def fetch_balance(self, params=None):
+        self._request('fetch_balance')
+        self._match_orders()
+        return self._balance()
+
+    def _set_leverage(self, leverage, symbol):
+        self.market(symbol)
+        if not 1 <= int(leverage) <= 125:
+            raise ccxt.BadRequest(f'binance leverage {leverage} is not valid')
+        self.leverages[symbol] = int(leverage)
+        return {'symbol': symbol, 'leverage': int(leverage)}
+
+    def set_leverage(self, leverage, symbol=None, params=None):
+        self._request('set_leverage')
+        return self._set_leverage(leverage, symbol)
+
+    def _set_margin_mode(self, margin_mode, symbol):
+        self.market(symbol)
+        if self.margin_modes.get(symbol, 'cross') == margin_mode:
+            # 与币安一致: 模式没变也报错
+            raise ccxt.MarginModeAlreadySet('binance {"code":-4046,"msg":"No need to change margin type."}')
+        self.margin_modes[symbol] = margin_mode
+        return {'symbol': symbol, 'marginMode': margin_mode}
+
+    def set_margin_mode(self, marginMode, symbol=None, params=None):
+        self._request('set_margin_mode')
+        return self._set_margin_mode(marginMode, symbol)
+
+    def _fetch_positions(self, symbols=None):
+        self._match_orders()
+        out = []
+        for symbol, pos in self.positions.items():
+            if symbols and symbol not in symbols:
+                continue
+            last = self._last_price(symbol)
+            out.append({'symbol': symbol, 'side': 'long' if pos['amount'] > 0 else 'short',
+                        'contracts': abs(pos['amount']), 'entryPrice': pos['entry_price'],
+                        'markPrice': last, 'initialMargin': pos['margin'],
+                        'unrealizedPnl': (last - pos['entry_price']) * pos['amount'],
+                        'leverage': self.leverages.get(symbol, self.default_leverage),
+                        'marginMode': self.margin_modes.get(symbol, 'cross')})
+        return out
+
+    def fetch_positions(self, symbols=None, params=None):
+        self._request('fetch_positions')
+        return self._fetch_positions(symbols)
+
+    # ------------------------------------------------------------------
+    # 下单 / 撮合
+    # ------------------------------------------------------------------
+    def _fill(self, order, price):
+        """
+        按 run_backtest 的记账方式成交 (单向持仓):
+        同方向加仓 -> 均价合并，冻结 名义价值/杠杆 的保证金，扣开仓手续费
+        反方向     -> 先平掉已有仓位 (盈亏 - 平仓手续费)，多出来的部分反向开仓
+        """
+        symbol, amount = order['symbol'], order['amount']
+        sign = 1.0 if order['side'] == 'buy' else -1.0
+        leverage = self.leverages.get(symbol, self.default_leverage)
+        fee = amount * price * self.fee_rate
+        pos = self.positions.get(symbol)
+        realized = 0.0
+
+        remaining = amount
+        if pos is not None and pos['amount'] * sign < 0:
+            closed = min(remaining, abs(pos['amount']))
+            pnl = (price - pos['entry_price']) * closed * (1.0 if pos['amount'] > 0 else -1.0)
+            realized += pnl
+            self.wallet += pnl
+            pos['margin'] *= 1 - closed / abs(pos['amount'])
+            pos['amount'] += sign * closed
+            remaining -= closed
+            if abs(pos['amount']) < 1e-12:
+                del self.positions[symbol]
+                pos = None
+        if remaining > 1e-12:
+            margin = remaining * price / leverage
+            if pos is None:
+                self.positions[symbol] = {'amount': sign * remaining, 'entry_price': price, 'margin': margin}
+            else:
+                total = abs(pos['amount']) + remaining
+                pos['entry_price'] = (pos['entry_price'] * abs(pos['amount']) + price * remaining) / total
+                pos['amount'] += sign * remaining
+                pos['margin'] += margin
+        self.wallet -= fee
+
+        now = self.milliseconds()
+        order.update({'status': 'closed', 'filled': amount, 'remaining': 0.0, 'average': price,
+                      'cost': amount * price, 'lastTradeTimestamp': now,
+                      'fee': {'cost': fee, 'currency': 'USDT'}})
+        order['info']['margin'] = 0.0
+        order['info']['realizedPnl'] = realized
+        self.trades.append({'id': str(len(self.trades) + 1), 'order': order['id'], 'symbol': symbol,
+                            'timestamp': now, 'side': order['side'], 'price': price, 'amount': amount,
+                            'cost': amount * price, 'fee': {'cost': fee, 'currency': 'USDT'},
+                            'realizedPnl': realized})
+
+    def _match_orders(self):
+        """
+        用 now_ms 之前新收盘的最小周期K线撮合挂着的限价单 (规则同 run_backtest 的挂单成交):
+        买单: 开盘价 <= 挂单价按开盘价成交，否则最低价 <= 挂单价按挂单价成交；卖单对称
+        """
+        pending = [o for o in self.orders.values() if o['status'] == 'open']
+        if not pending:
+            return
+        now = self.milliseconds()
+        for symbol in {o['symbol'] for o in pending}:
+            tf = self._finest(symbol)
+            tf_ms = self.parse_timeframe(tf) * 1000
+            arr = self.candles[symbol][tf]
+            orders = [o for o in pending if o['symbol'] == symbol]
+            start = max(self._matched_to.get(symbol, 0), min(o['info']['match_from'] for o in orders))
+            lo = int(np.searchsorted(arr[:, 0], start, side='left'))
+            hi = int(np.searchsorted(arr[:, 0], now - tf_ms, side='right'))
+            for row in arr[lo:hi]:
+                ts, o, h, l = int(row[0]), row[1], row[2], row[3]
+                for order in orders:
+                    if order['status'] != 'open' or ts < order['info']['match_from']:
+                        continue
+                    price = order['price']
+                    fill = None
+                    if order['side'] == 'buy':
+                        fill = o if o <= price else (price if l <= price else None)
+                    else:
+                        fill = o if o >= price else (price if h >= price else None)
+                    if fill is not None:
+                        self._fill(order, float(fill))
+            if hi > lo:
+                self._matched_to[symbol] = int(arr[hi - 1, 0]) + 1
+
+    def _create_order(self, symbol, type, side, amount, price=None, params=None):
+        market = self.market(symbol)
+        type, side = type.lower(), side.lower()
+        if side not in ('buy', 'sell') or type not in ('market', 'limit'):
+            raise ccxt.BadRequest(f'binance 不支持的订单: {type} {side}')
+        amount = float(self.amount_to_precision(symbol, float(amount)))
+        self._match_orders()
+        reference = float(price) if type == 'limit' else self._last_price(symbol)
+        if amount < market['limits']['amount']['min'] or amount * reference < market['limits']['cost']['min']:
+            raise ccxt.InvalidOrder(f'binance {{"code":-4164,"msg":"Order\'s notional must be no smaller than '
+                                    f'{market["limits"]["cost"]["min"]}"}}')
+        margin = amount * reference / self.leverages.get(symbol, self.default_leverage)
+        pos = self.positions.get(symbol)
+        reduces = pos is not None and pos['amount'] * (1 if side == 'buy' else -1) < 0
+        if not reduces and margin > self._balance()['free']['USDT']:
+            raise ccxt.InsufficientFunds('binance {"code":-2019,"msg":"Margin is insufficient."}')
+
+        now = self.milliseconds()
+        order_id = str(next(self._order_ids))
+        order = {
+            'id': order_id, 'clientOrderId': (params or {}).get('clientOrderId'),
+            'timestamp': now, 'datetime': self.iso8601(now), 'lastTradeTimestamp': None,
+            'symbol': symbol, 'type': type, 'side': side, 'price': float(price) if price is not None else None,
+            'amount': amount, 'filled': 0.0, 'remaining': amount, 'average': None, 'cost': 0.0,
+            'status': 'open', 'fee': None, 'trades': [],
+            'info': {'margin': 0.0 if type == 'market' or reduces else margin, 'match_from': 0},
+        }
+        self.orders[order_id] = order
+        if type == 'market':
+            slip = self.slippage if side == 'buy' else -self.slippage
+            self._fill(order, reference * (1 + slip))
+        else:
+            # 限价单从下一根 (还没开始的) 最小周期K线开始撮合，与回测“本根挂单、下根成交”一致
+            tf_ms = self.parse_timeframe(self._finest(symbol)) * 1000
+            order['info']['match_from'] = (now // tf_ms + (1 if now % tf_ms else 0)) * tf_ms
+        return dict(order)
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        self._request('create_order')
+        return self._create_order(symbol, type, side, amount, price, params)
+
+    def _cancel_order(self, id, symbol=None):
+        self._match_orders()
+        order = self.orders.get(str(id))
+        if order is None or order['status'] != 'open':
+            raise ccxt.OrderNotFound(f'binance {{"code":-2011,"msg":"Unknown order sent."}} ({id})')
+        order['status'] = 'canceled'
+        order['info']['margin'] = 0.0
+        return dict(order)
+
+    def cancel_order(self, id, symbol=None, params=None):
+        self._request('cancel_order')
+        return self._cancel_order(id, symbol)
+
+    def _fetch_order(self, id, symbol=None):
+        self._match_orders()
+        if str(id) not in self.orders:
+            raise ccxt.OrderNotFound(f'binance {{"code":-2013,"msg":"Order does not exist."}} ({id})')
+        return dict(self.orders[str(id)])
+
+    def fetch_order(self, id, symbol=None, params=None):
+        self._request('fetch_order')
+        return self._fetch_order(id, symbol)
+
+    def _fetch_open_orders(self, symbol=None):
+        self._match_orders()
+        return [dict(o) for o in self.orders.values()
+                if o['status'] == 'open' and (symbol is None or o['symbol'] == symbol)]
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params=None):
+        self._request('fetch_open_orders')
+        return self._fetch_open_orders(symbol)
+
+    def close(self):
+        pass
+
+
+class AsyncSimExchange(SimExchange):
+    """异步版 (接口对应 ccxt.async_support)，延迟和限频等待用 asyncio.sleep，可以并发"""
+
+    async def _request(self, method):
+        wait = self._admit(method)
+        if self.latency or wait:
+            await asyncio.sleep(self.latency + wait)
+
+    async def load_markets(self, reload=False, params=None):
+        if self.markets is None or reload:
+            await self._request('load_markets')
+            self.markets = self._markets()
+            self.symbols = sorted(self.markets)
+        return self.markets
+
+    async def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=500, params=None):
+        await self._request('fetch_ohlcv')
+        return self._slice_ohlcv(symbol, timeframe, since, limit)
+
+    async def fetch_open_interest_history(self, symbol, timeframe='5m', since=None, limit=None, params=None):
+        await self._request('fetch_open_interest_history')
+        return self._slice_open_interest(symbol, timeframe, since, limit)
+
+    async def fetch_ticker(self, symbol, params=None):
+        await self._request('fetch_ticker')
+        return self._ticker(symbol)
+
+    async def fetch_balance(self, params=None):
+        await self._request('fetch_balance')
+        self._match_orders()
+        return self._balance()
+
+    async def set_leverage(self, leverage, symbol=None, params=None):
+        await self._request('set_leverage')
+        return self._set_leverage(leverage, symbol)
+
+    async def set_margin_mode(self, marginMode, symbol=None, params=None):
+        await self._request('set_margin_mode')
+        return self._set_margin_mode(marginMode, symbol)
+
+    async def fetch_positions(self, symbols=None, params=None):
+        await self._request('fetch_positions')
+        return self._fetch_positions(symbols)
+
+    async def create_order(self, symbol, type, side, amount, price=None, params=None):
+        await self._request('create_order')
+        return self._create_order(symbol, type, side, amount, price, params)
+
+    async def cancel_order(self, id, symbol=None, params=None):
+        await self._request('cancel_order')
+        return self._cancel_order(id, symbol)
+
+    async def fetch_order(self, id, symbol=None, params=None):
+        await self._request('fetch_order')
+        return self._fetch_order(id, symbol)
+
+    async def fetch_open_orders(self, symbol=None, since=None, limit=None, params=None):
+        await self._request('fetch_open_orders')
+        return self._fetch_open_orders(symbol)
+
+    async def close(self):
+        pass
+
+
+class SimKlineServer:
+    """
+    本地 WebSocket K线推送服务器 (模拟币安合约 combined stream)
+    把给定的K线逐根“播放”出去：每根先推 ticks 次未收盘更新，最后推一次收盘 (x=true)
+    interval: 每根K线播放用时 (秒)
+    用法:
+        server = SimKlineServer({'BTC/USDT': {'5m': candles}}).start()
+        KlineStream(exchange, 'BTC/USDT', ['5m'], url=server.url)
+    """
+
+    def __init__(self, candles, host='127.0.0.1', port=0, interval=0.05, ticks=2):
+        self.candles = candles
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.ticks = ticks
+        self.sent = 0
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/stream"
+
+    def start(self):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True)
+        self._thread.start()
+        self.ready.wait(5)
+        return self
+
+    async def _serve(self):
+        import websockets
+        async with websockets.serve(self._handler, self.host, self.port) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self.ready.set()
+            await self._wait_done()
+
+    async def _wait_done(self):
+        while not self.done.is_set():
+            await asyncio.sleep(0.05)
+
+    def stop(self):
+        self.done.set()
+
+    def _messages(self, symbol, timeframe, row):
+        tf_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        ts, o, h, l, c, v = row
+        name = f"{symbol.replace('/', '').lower()}@kline_{timeframe}"
+        for i in range(self.ticks + 1):
+            final = i == self.ticks
+            # 未收盘时价格从开盘价逐步走向收盘价
+            frac = (i + 1) / (self.ticks + 1)
+            price = c if final else o + (c - o) * frac
+            yield json.dumps({'stream': name, 'data': {'e': 'kline', 's': symbol.replace('/', ''), 'k': {
+                't': int(ts), 'T': int(ts) + tf_ms - 1, 'i': timeframe,
+                'o': str(o), 'h': str(max(h if final else o, price)), 'l': str(min(l if final else o, price)),
+                'c': str(price), 'v': str(v * frac), 'x': final,
+            }}})
+
+    async def _handler(self, ws, path=None):
+        # 按时间顺序把所有订阅的K线流交错播放
+        events = []
+        for symbol, by_tf in self.candles.items():
+            for tf, arr in by_tf.items():
+                tf_ms = ccxt.Exchange.parse_timeframe(tf) * 1000
+                for row in np.asarray(arr):
+                    events.append((int(row[0]) + tf_ms, symbol, tf, row))
+        events.sort(key=lambda e: e[0])
+
+        for _, symbol, tf, row in events:
+            for msg in self._messages(symbol, tf, row):
+                await ws.send(msg)
+                self.sent += 1
+            await asyncio.sleep(self.interval)
+
+        # 播放完保持连接 (和真实交易所一样不会主动断开)，直到 stop()
+        await self._wait_done()
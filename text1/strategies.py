@@ -0,0 +1,163 @@
+# 文件名: strategies.py
+# 开单规则插件 (回测引擎和实盘共用同一份定义)
+#
+# 一个策略只写一次规则 rule(close, cur, prev):
+#   close: 刚收盘那根K线的收盘价
+#   cur:   {指标名: 刚收盘那根K线的指标值}
+#   prev:  {指标名: 再往前一根的指标值} (判断交叉用)
+#   返回 (做多条件, 做空条件)
+# 规则里只用 > < & | 这类逐元素运算，所以同一个函数既能吃整段数组 (回测，一次算出所有K线)，
+# 也能吃单根的数值 (实盘，指标用 indicators.py 的增量对象每根 O(1) 更新)。
+#
+# 两种用法看的是同一根K线: 第 i 根K线 (正在形成 / 准备挂单的那根) 的信号由第 i-1 根已收盘K线决定，
+# 和 run_backtest 一样不会用到未收盘的数据。
+import numpy as np
+
+from indicators import RSI, SMA, IndicatorFeed, rsi, sma
+
+LONG = 1
+SHORT = -1
+
+
+def _series(indicator, close):
+    """增量指标对象 -> 对应的整段 (向量化) 计算结果"""
+    if isinstance(indicator, SMA):
+        return sma(close, indicator.period)
+    if isinstance(indicator, RSI):
+        return rsi(close, indicator.period)
+    raise TypeError(f"不支持向量化计算的指标: {type(indicator).__name__}")
+
+
+class SignalStrategy:
+    """
+    策略基类，子类需要实现:
+    indicators(): {指标名: 增量指标对象}，例如 {'ma31': SMA(31)}
+    rule(close, cur, prev): 见文件开头
+    reference: 偏离值过滤参照的指标名 (同向加仓时价格要离它足够远)
+    """
+
+    name = 'base'
+    reference = None
+
+    def indicators(self):
+        return {}
+
+    def rule(self, close, cur, prev):
+        raise NotImplementedError
+
+    @property
+    def warmup(self):
+        """指标需要的最少K线数"""
+        return max([getattr(ind, 'period', 1) for ind in self.indicators().values()] + [1])
+
+    # ------------------------------------------------------------------
+    # 回测: 整段数组
+    # ------------------------------------------------------------------
+    def lines(self, data):
+        """
+        计算整段指标，data 是 DataFrame 或 {列名: 数组} (至少有 'close')
+        已经有同名列 (比如 add_ma_columns 算好的 ma31) 就直接用
+        """
+        close = np.asarray(data['close'], dtype=np.float64)
+        names = data.columns if hasattr(data, 'columns') else data.keys()
+        return {name: (np.asarray(data[name], dtype=np.float64) if name in names else _series(ind, close))
+                for name, ind in self.indicators().items()}
+
+    def signals(self, data, enable_long=True, enable_short=True):
+        """
+        每根K线的原始信号数组 (int8): 1 = 多, -1 = 空, 0 = 无，两个条件同时成立时做多优先
+        第 0 根没有上一根，恒为 0
+        """
+        close = np.asarray(data['close'], dtype=np.float64)
+        out = np.zeros(len(close), dtype=np.int8)
+        if len(close) < 2:
+            return out
+        lines = self.lines(data)
+        cur = {name: line[:-1] for name, line in lines.items()}
+        prev = {name: np.concatenate([[np.nan], line[:-2]]) for name, line in lines.items()}
+        with np.errstate(invalid='ignore'):
+            long_, short = self.rule(close[:-1], cur, prev)
+        if enable_short:
+            out[1:][np.asarray(short, dtype=bool)] = SHORT
+        if enable_long:
+            out[1:][np.asarray(long_, dtype=bool)] = LONG
+        return out
+
+    def reference_line(self, data):
+        """偏离值过滤用的参照线 (与 data 逐根对齐，引擎取第 i-1 根)"""
+        close = np.asarray(data['close'], dtype=np.float64)
+        if self.reference is None:
+            return close
+        return self.lines(data)[self.reference]
+
+    # ------------------------------------------------------------------
+    # 实盘: 逐根增量
+    # ------------------------------------------------------------------
+    def new_feed(self):
+        """实盘用的增量指标组 (每个交易对一份)"""
+        return IndicatorFeed(**self.indicators())
+
+    def latest(self, feed, times, closes, enable_long=True, enable_short=True):
+        """
+        times / closes: 已经收盘的K线 (不含正在形成的那根)
+        同步增量指标后返回下一根K线的信号 1 / -1 / 0
+        """
+        feed.sync(times, closes)
+        close = float(np.asarray(closes, dtype=np.float64)[-1])
+        cur = {name: feed[name].value for name in feed.indicators}
+        prev = {name: feed[name].prev_value for name in feed.indicators}
+        long_, short = self.rule(close, cur, prev)
+        if enable_long and long_:
+            return LONG
+        if enable_short and short:
+            return SHORT
+        return 0
+
+
+class MAStack(SignalStrategy):
+    """均线多头/空头排列: 收盘价 > 快线 > 慢线 做多，收盘价 < 快线 < 慢线 做空 (run_backtest 原来的规则)"""
+
+    name = 'ma_stack'
+
+    def __init__(self, fast=31, slow=128):
+        self.fast, self.slow = f"ma{fast}", f"ma{slow}"
+        self.periods = (fast, slow)
+        self.reference = self.fast
+
+    def indicators(self):
+        return {self.fast: SMA(self.periods[0]), self.slow: SMA(self.periods[1])}
+
+    def rule(self, close, cur, prev):
+        fast, slow = cur[self.fast], cur[self.slow]
+        return (close > fast) & (fast > slow), (close < fast) & (fast < slow)
+
+
+class MACross(SignalStrategy):
+    """均线交叉: 快线上穿慢线 (金叉) 做多，下穿 (死叉) 做空 (alert_system.py 的 MA128 / MA373)"""
+
+    name = 'ma_cross'
+
+    def __init__(self, fast=128, slow=373):
+        self.fast, self.slow = f"ma{fast}", f"ma{slow}"
+        self.periods = (fast, slow)
+        self.reference = self.fast
+
+    def indicators(self):
+        return {self.fast: SMA(self.periods[0]), self.slow: SMA(self.periods[1])}
+
+    def rule(self, close, cur, prev):
+        golden = (prev[self.fast] < prev[self.slow]) & (cur[self.fast] > cur[self.slow])
+        death = (prev[self.fast] > prev[self.slow]) & (cur[self.fast] < cur[self.slow])
+        return golden, death
+
+
+STRATEGIES = {cls.name: cls for cls in (MAStack, MACross)}
+
+
+def create(strategy='ma_stack', **kwargs):
+    """按名字创建策略 ('ma_stack' / 'ma_cross')；传入的已经是策略对象就原样返回"""
+    if isinstance(strategy, SignalStrategy):
+        return strategy
+    if strategy not in STRATEGIES:
+        raise ValueError(f"未知的策略: {strategy} (可选 {', '.join(STRATEGIES)})")
+    return STRATEGIES[strategy](**kwargs)
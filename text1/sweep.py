@@ -0,0 +1,107 @@
+# 文件名: sweep.py
+# 止盈/止损参数批量扫描 (多进程并行)
+# 以前是手动改 backtest.py 里的全局变量 -> 跑一遍 -> 抄到 参数设置.txt
+# 现在给一个参数网格，一次跑完并按收益排好序
+import itertools
+import os
+import time
+from multiprocessing import Pool
+
+import pandas as pd
+
+import backtest
+import indicators
+
+# 每个工作进程各持有一份数据 (进程启动时传入一次，之后每组参数都复用)
+_WORKER_DF = None
+
+
+def _init_worker(df):
+    global _WORKER_DF
+    _WORKER_DF = df
+
+
+def _run_one(params):
+    """在工作进程里跑一组参数，只返回统计数字 (不回传交易明细，减少进程间传输)"""
+    df = _WORKER_DF.copy(deep=False)
+    trades, equity, final_reserve = backtest.run_backtest(df, params=params, verbose=False)
+    stats = backtest.summarize(trades, equity, final_reserve, params)
+    row = dict(params)
+    row.update({
+        'total_return': stats['profit_rate'],
+        'peak_return': stats['peak_profit_rate'],
+        'win_rate': stats['win_rate'],
+        'trades': stats['total_trades'],
+    })
+    return row
+
+
+def expand_grid(grid, base=None):
+    """
+    参数网格展开成参数字典列表
+    grid: {'TP_PERCENT_LONG': [0.007, 0.0075], 'SL_PERCENT_LONG': [0.009, 0.0093]}
+    base: 网格以外需要固定覆盖的参数 (如 {'LEVERAGE': 10})
+    """
+    names = list(grid.keys())
+    combos = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        overrides = dict(base or {})
+        overrides.update(zip(names, values))
+        combos.append(backtest.get_params(**overrides))
+    return combos
+
+
+def run_sweep(csv_path, grid, base=None, start_time=None, end_time=None, processes=None, sort_by='total_return'):
+    """
+    并行跑完整个参数网格
+    - CSV 只读取一次，均线只算一次，然后分发给进程池 (默认每个CPU核一个进程)
+    - 返回按 sort_by 从高到低排序的 DataFrame
+    """
+    df = backtest.load_from_csv(csv_path, start_time, end_time)
+    if df.empty:
+        return pd.DataFrame()
+
+    # 先把均线算好，工作进程里就不用每组参数再算一遍
+    indicators.add_ma_columns(df, (31, 128, 373))
+
+    combos = expand_grid(grid, base)
+    processes = processes or os.cpu_count() or 1
+    print(f"🧪 参数扫描: {len(combos)} 组参数 | {processes} 个进程 | {len(df)} 根K线")
+
+    t0 = time.time()
+    with Pool(processes=processes, initializer=_init_worker, initargs=(df,)) as pool:
+        rows = pool.map(_run_one, combos)
+    print(f"✅ 扫描完成，用时 {time.time() - t0:.1f} 秒")
+
+    result = pd.DataFrame(rows)
+    result.sort_values(sort_by, ascending=False, inplace=True)
+    result.reset_index(drop=True, inplace=True)
+    return result
+
+
+def print_ranking(result, grid, top=20):
+    """打印排行榜：只显示网格里变化的参数 + 结果列"""
+    cols = list(grid.keys()) + ['total_return', 'peak_return', 'win_rate', 'trades']
+    print("\n" + "=" * 80)
+    print(f"🏆 参数排行 (前 {min(top, len(result))} 名)")
+    print("=" * 80)
+    print(result[cols].head(top).to_string(float_format=lambda v: f"{v:.4f}"))
+
+
+if __name__ == "__main__":
+    CSV_PATH = r"F:\BIANRobot\text1\FUTURES_BTCUSDT_5m_2020.csv"
+
+    GRID = {
+        'TP_PERCENT_LONG':  [0.007, 0.0071, 0.0072, 0.0075],
+        'SL_PERCENT_LONG':  [0.009, 0.0092, 0.0093],
+        'TP_PERCENT_SHORT': [0.007, 0.0075],
+        'SL_PERCENT_SHORT': [0.009, 0.0093],
+    }
+    BASE = {'LEVERAGE': 10}
+
+    result = run_sweep(CSV_PATH, GRID, BASE)
+    if not result.empty:
+        print_ranking(result, GRID)
+        save_path = f"sweep_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        result.to_csv(save_path, index=False)
+        print(f"💾 完整结果已保存: {save_path}")
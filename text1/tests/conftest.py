@@ -0,0 +1,7 @@
+# 文件名: tests/conftest.py
+# 测试直接导入 text1 下的模块 (和 python main.py 一样的运行方式，不需要安装成包)
+# 运行: 在 text1 目录下 python -m pytest -q tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
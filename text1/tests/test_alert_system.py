@@ -0,0 +1,133 @@
+# 文件名: tests/test_alert_system.py
+# AutoAlertBot 对着异步模拟交易所扫描: 每个交易对独立的交叉状态、并发上限、共用的权重令牌桶
+import numpy as np
+import pandas as pd
+import pytest
+
+import alert_system
+from alert_system import AutoAlertBot
+from sim_exchange import AsyncSimExchange, make_candles
+
+TF_MS = 15 * 60 * 1000
+T0 = 1_700_000_000_000 - 1_700_000_000_000 % TF_MS
+
+
+def line_candles(closes):
+    """收盘价序列 -> 开高低收都等于收盘价的 15m K线"""
+    closes = np.asarray(closes, dtype=np.float64)
+    ts = T0 + np.arange(len(closes), dtype=np.int64) * TF_MS
+    return np.column_stack([ts, closes, closes, closes, closes, np.ones(len(closes))])
+
+
+def cross_bars(closes, fast=128, slow=373):
+    """pandas 算出的金叉/死叉K线下标"""
+    s = pd.Series(closes)
+    diff = (s.rolling(fast).mean() - s.rolling(slow).mean()).to_numpy()
+    golden = [k for k in range(1, len(s)) if diff[k - 1] < 0 < diff[k]]
+    death = [k for k in range(1, len(s)) if diff[k - 1] > 0 > diff[k]]
+    return golden, death
+
+
+class RecordingBudget:
+    """记录每次请求的权重，不限速"""
+
+    def __init__(self):
+        self.weights = []
+
+    async def acquire(self, weight):
+        self.weights.append(weight)
+
+
+class ConcurrencyExchange(AsyncSimExchange):
+    """记录同时在途的K线请求数"""
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=500, params=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await super().fetch_ohlcv(symbol, timeframe, since, limit, params)
+        finally:
+            self.in_flight -= 1
+
+
+def make_bot(monkeypatch, exchange, symbols, max_in_flight=16):
+    config = dict(alert_system.CONFIG, SYMBOLS=symbols, ENABLE_BARK=False, ENABLE_TTS=False,
+                  USE_PROXY=False, MAX_IN_FLIGHT=max_in_flight)
+    monkeypatch.setattr(alert_system, 'CONFIG', config)
+    bot = AutoAlertBot(exchange=exchange)
+    bot.alerts = []
+    bot.send_bark = lambda title, content: bot.alerts.append((exchange.now_ms, content))
+    return bot
+
+
+def test_each_symbol_keeps_its_own_cross_state(monkeypatch):
+    n = 800
+    down_up = np.r_[np.linspace(200, 100, 500), np.linspace(100, 300, n - 500)]
+    up_down = np.r_[np.linspace(100, 200, 500), np.linspace(200, 50, n - 500)]
+    rising = np.linspace(100, 300, n)
+    candles = {'AAA/USDT': line_candles(down_up), 'BBB/USDT': line_candles(up_down),
+               'CCC/USDT': line_candles(rising)}
+    (golden,), _ = cross_bars(down_up)
+    _, (death,) = cross_bars(up_down)
+    assert cross_bars(rising) == ([], [])
+
+    ex = AsyncSimExchange(candles, timeframe='15m', now_ms=T0)
+    bot = make_bot(monkeypatch, ex, list(candles))
+    seen = {}
+    try:
+        for j in range(450, n):
+            ex.now_ms = int(T0 + j * TF_MS + 1)     # 第 j 根刚开盘: 第 j-1 根是刚收盘的那根
+            before = len(bot.alerts)
+            cycle, failed = bot.scan_once()
+            assert failed == 0
+            for _, content in bot.alerts[before:]:
+                seen[content] = j
+    finally:
+        bot.close()
+
+    # 交叉出现在第 k 根收盘时，下一根开盘后的那一轮报警，每个交易对只报一次
+    assert seen == {"'AAA' 可以多啦": golden + 1, "'BBB' 可以空啦": death + 1}
+    assert len(bot.alerts) == 2
+    a, b, c = (bot.states[s] for s in candles)
+    assert (a.last_signal, b.last_signal, c.last_signal) == ("可以多啦", "可以空啦", None)
+    assert a.last_ts == pd.Timestamp(T0 + golden * TF_MS, unit='ms')
+    # 面板快照: 最后一轮的 MA 来自已收盘K线
+    closed = pd.Series(rising[:n - 1])
+    assert c.ma128 == pytest.approx(closed.iloc[-128:].mean())
+    assert c.ma373 == pytest.approx(closed.iloc[-373:].mean())
+
+
+def test_scan_is_concurrent_within_the_in_flight_limit(monkeypatch):
+    symbols = [f'S{k:02d}/USDT' for k in range(48)]
+    candles = {s: make_candles(400, timeframe='15m', seed=k) for k, s in enumerate(symbols)}
+    ex = ConcurrencyExchange(candles, timeframe='15m', latency=0.05)
+    bot = make_bot(monkeypatch, ex, symbols, max_in_flight=8)
+    bot.budget = RecordingBudget()
+    try:
+        cycle, failed = bot.scan_once()
+        assert failed == 0
+        assert ex.max_in_flight == 8
+        # 48 个请求、同时 8 个、每个 50ms: 约 0.3 秒 (串行要 2.4 秒)
+        assert 0.25 <= cycle < 1.2
+        # 每个请求都先从共用的令牌桶取权重: 第一轮完整拉取 400 根，之后是增量
+        assert bot.budget.weights == [2] * len(symbols)
+        bot.scan_once()
+        assert bot.budget.weights[len(symbols):] == [1] * len(symbols)
+        assert ex.calls['fetch_ohlcv'] == 2 * len(symbols)
+    finally:
+        bot.close()
+
+
+def test_failed_symbols_are_counted(monkeypatch):
+    symbols = ['BTC/USDT', 'ETH/USDT']
+    ex = AsyncSimExchange({s: make_candles(400, timeframe='15m') for s in symbols}, timeframe='15m')
+    bot = make_bot(monkeypatch, ex, symbols)
+    ex.fail_next(count=1)
+    try:
+        cycle, failed = bot.scan_once()
+        assert failed == 1
+        assert bot.scan_once()[1] == 0
+    finally:
+        bot.close()
@@ -0,0 +1,111 @@
+# 文件名: tests/test_backtest_engines.py
+# loop 引擎 (逐根 df.iloc，对照基准) 和 array 引擎 (NumPy) 逐笔一致: 成交记录、资金曲线、剩余备用金
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+from intrabar import SubBars
+
+MIN_MS = 60_000
+T0 = 1_767_225_600_000      # 2026-01-01 00:00:00 UTC
+
+
+def minutes(n, seed=7):
+    """n 根 1m K线 (波动放大一些，让止盈止损经常在同一根 5m K线里都被碰到)"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.003, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.002, n)) * close
+    return pd.DataFrame({
+        'timestamp': T0 + np.arange(n, dtype=np.int64) * MIN_MS,
+        'open': open_,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'close': close,
+        'volume': 1.0,
+    })
+
+
+def five_minutes(m1):
+    """1m -> 5m (与交易所的 5m K线一致)"""
+    bucket = m1['timestamp'] // (5 * MIN_MS) * (5 * MIN_MS)
+    g = m1.groupby(bucket)
+    df = pd.DataFrame({'open': g['open'].first(), 'high': g['high'].max(), 'low': g['low'].min(),
+                       'close': g['close'].last(), 'volume': g['volume'].sum()})
+    df.insert(0, 'timestamp', pd.to_datetime(df.index.to_numpy(), unit='ms'))
+    return df.reset_index(drop=True)
+
+
+M1 = minutes(5 * 2400)
+BARS = five_minutes(M1)
+
+PARAM_SETS = {
+    'default': {},
+    'multi_orders': dict(MAX_ORDERS=4, SAME_SIDE_DISTANCE_LONG=0.003, SAME_SIDE_DISTANCE_SHORT=0.003),
+    'multi_no_distance': dict(MAX_ORDERS=3, SIDE_DISTANCE_SWITCH=False, ENABLE_CONSECUTIVE_FILTER=True,
+                              MAX_CONS_LONG=2, MAX_CONS_SHORT=1),
+    # 高杠杆 + 止损超过保证金: 亏穿后从备用金填坑
+    'reserve_refill': dict(MAX_ORDERS=2, FIXED_MARGIN_RATE=0.9, LEVERAGE=100, SL_PERCENT_LONG=0.012,
+                           SL_PERCENT_SHORT=0.012, INITIAL_RESERVE=5000, SIDE_DISTANCE_SWITCH=False),
+    'long_only_tight': dict(ENABLE_SHORT=False, TP_PERCENT_LONG=0.004, SL_PERCENT_LONG=0.003,
+                            MAX_OPEN_LIMIT=2000),
+}
+
+
+def run(engine, params, sub_bars=None, df=BARS):
+    return backtest.run_backtest(df.copy(), params, engine=engine, verbose=False, sub_bars=sub_bars)
+
+
+def assert_same(loop, array):
+    (t1, e1, r1), (t2, e2, r2) = loop, array
+    assert t1.dtype.names == t2.dtype.names
+    assert len(t1) == len(t2)
+    for name in t1.dtype.names:
+        if np.issubdtype(t1.dtype[name], np.floating):
+            np.testing.assert_allclose(t2[name], t1[name], rtol=1e-12, atol=1e-9, err_msg=name)
+        else:
+            np.testing.assert_array_equal(t2[name], t1[name], err_msg=name)
+    np.testing.assert_allclose(e2, e1, rtol=1e-12, atol=1e-9)
+    assert r2 == pytest.approx(r1, rel=1e-12, abs=1e-9)
+
+
+@pytest.mark.parametrize('name', list(PARAM_SETS))
+def test_engines_agree(name):
+    params = PARAM_SETS[name]
+    loop = run('loop', params)
+    assert len(loop[0]) > 0
+    assert_same(loop, run('array', params))
+    if name == 'reserve_refill':
+        assert loop[2] < params['INITIAL_RESERVE']
+
+
+@pytest.fixture(scope='module')
+def sub_bars_csv(tmp_path_factory):
+    path = tmp_path_factory.mktemp('intrabar') / 'm1.csv'
+    M1.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize('name', ['default', 'multi_orders', 'reserve_refill'])
+def test_engines_agree_with_sub_bars(name, sub_bars_csv):
+    # 止盈止损收窄，同一根 5m K线里两边都碰到的情况才多
+    params = dict(PARAM_SETS[name], TP_PERCENT_LONG=0.004, SL_PERCENT_LONG=0.003,
+                  TP_PERCENT_SHORT=0.004, SL_PERCENT_SHORT=0.003)
+    loop_sub, array_sub = SubBars(sub_bars_csv), SubBars(sub_bars_csv)
+    loop = run('loop', params, loop_sub)
+    assert_same(loop, run('array', params, array_sub))
+    # 确实有K线是按 1m 数据判定的，且两边查询的次数一样
+    assert loop_sub.lookups > 0 and loop_sub.misses == 0
+    assert (array_sub.lookups, array_sub.misses) == (loop_sub.lookups, loop_sub.misses)
+
+
+@pytest.mark.parametrize('engine', ['loop', 'array'])
+@pytest.mark.parametrize('n', [370, 375])
+def test_too_few_bars_for_warmup(engine, n):
+    """不足 start_index 根K线: 一根都不回测，返回空结果而不是报错"""
+    trades, equity, reserve = backtest.run_backtest(BARS.iloc[:n].copy(), engine=engine, verbose=True)
+    assert len(trades) == 0 and len(equity) == 0
+    assert reserve == backtest.INITIAL_RESERVE
+    stats = backtest.summarize(trades, equity, reserve)
+    assert stats['final_trading_balance'] == backtest.INITIAL_BALANCE
@@ -0,0 +1,50 @@
+# 文件名: tests/test_candle_buffer.py
+# CandleBuffer: 追加 / 覆盖正在形成的K线 / 写满后滚动，任何时候都是最近 capacity 根
+import numpy as np
+
+from candle_buffer import COLUMNS, CandleBuffer
+from sim_exchange import make_candles
+
+
+def test_update_appends_overwrites_and_ignores_evicted():
+    c = make_candles(12)
+    buf = CandleBuffer(capacity=10)
+    assert buf.last_time is None and len(buf) == 0
+
+    assert buf.extend(c) == 12
+    assert len(buf) == 10 and buf.last_time == c[-1, 0]
+
+    # 最后一根还在变化: 覆盖，不新增
+    assert buf.update(c[-1, 0], 1, 2, 0.5, 1.5, 7) is False
+    times, ohlcv = buf.view()
+    np.testing.assert_array_equal(ohlcv[:, -1], [1, 2, 0.5, 1.5, 7])
+    # 缓冲区里更早的一根也能修正
+    buf.update(c[5, 0], 9, 9, 9, 9, 9)
+    assert ohlcv[3, 3] == 9
+    # 已经被挤出去的K线直接忽略
+    assert buf.update(c[0, 0], 0, 0, 0, 0, 0) is False
+    assert times[0] == c[2, 0] and len(buf) == 10
+
+
+def test_view_is_always_the_latest_capacity_bars():
+    c = make_candles(1000, seed=2)
+    buf = CandleBuffer(capacity=64)
+    for k in range(len(c)):
+        buf.update(*c[k])
+        n = min(k + 1, 64)
+        times, ohlcv = buf.view()
+        np.testing.assert_array_equal(times, c[k + 1 - n:k + 1, 0])
+        np.testing.assert_array_equal(ohlcv.T, c[k + 1 - n:k + 1, 1:])
+
+
+def test_to_frame_columns_and_copy():
+    c = make_candles(5)
+    buf = CandleBuffer(capacity=10)
+    buf.extend(c)
+    view, copied = buf.to_frame(), buf.to_frame(copy=True)
+    assert list(view.columns) == COLUMNS
+    assert view['time'].iloc[0].value // 10 ** 6 == c[0, 0]
+
+    buf.update(c[-1, 0], 1, 1, 1, 42, 1)
+    assert view['close'].iloc[-1] == 42            # 不拷贝: 跟着缓冲区变
+    assert copied['close'].iloc[-1] == c[-1, 4]
@@ -0,0 +1,169 @@
+# 文件名: tests/test_data_download.py
+# 并发分段下载 (fetch_ohlcv_concurrent / download_concurrent) 对着本地模拟交易所测试:
+# 结果与串行下载完全一致，分段边界去重，失败重试，权重令牌桶限速
+import asyncio
+import time
+
+import ccxt
+import numpy as np
+import pytest
+
+import data_download
+from data_download import WeightBudget, download_concurrent, download_to_store, fetch_ohlcv_concurrent
+from sim_exchange import AsyncSimExchange, SimExchange, make_candles
+
+SYMBOL = 'BTC/USDT'
+TF_MS = 5 * 60 * 1000
+START = '2020-01-01 00:00:00'
+
+
+@pytest.fixture
+def candles():
+    return {SYMBOL: make_candles(5000)}
+
+
+def fetch(exchange, start_ms, end_ms, **kwargs):
+    kwargs.setdefault('budget', WeightBudget(10 ** 9))
+    return asyncio.run(fetch_ohlcv_concurrent(exchange, SYMBOL, '5m', start_ms, end_ms, **kwargs))
+
+
+def expected_ts(start_ms, end_ms):
+    return np.arange(start_ms, end_ms + 1, TF_MS, dtype=np.int64)
+
+
+class OverlapExchange(AsyncSimExchange):
+    """每页都从 since 的前一根开始返回 (页与页、分段与分段之间有重复的K线)"""
+
+    async def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=500, params=None):
+        return await super().fetch_ohlcv(symbol, timeframe, since - TF_MS, limit + 1, params)
+
+
+class CountingExchange(AsyncSimExchange):
+    """记录同时在路上的请求数"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=500, params=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await super().fetch_ohlcv(symbol, timeframe, since, limit, params)
+        finally:
+            self.in_flight -= 1
+
+
+def test_concurrent_matches_serial_store(candles, tmp_path):
+    serial = download_to_store(SYMBOL, '5m', START, store_path=str(tmp_path / 'serial.store'),
+                               exchange=SimExchange(candles), pause=0)
+    fast = download_concurrent(SYMBOL, '5m', START, store_path=str(tmp_path / 'concurrent.store'),
+                               exchange=AsyncSimExchange(candles), max_in_flight=4, window_chunks=2)
+    assert serial.rows == fast.rows == 5000
+    assert serial.load().equals(fast.load())
+
+
+def test_concurrent_resumes_serial_store(candles, tmp_path):
+    """串行下到一半，再用并发版续传，结果与一次性串行下载相同"""
+    path = str(tmp_path / 'resume.store')
+    download_to_store(SYMBOL, '5m', START, '2020-01-07 00:00:00', store_path=path,
+                      exchange=SimExchange(candles), pause=0)
+    resumed = download_concurrent(SYMBOL, '5m', START, store_path=path, exchange=AsyncSimExchange(candles))
+    full = download_to_store(SYMBOL, '5m', START, store_path=str(tmp_path / 'full.store'),
+                             exchange=SimExchange(candles), pause=0)
+    assert resumed.load().equals(full.load())
+
+
+@pytest.mark.parametrize('chunk_bars,page_limit', [(1000, 1000), (7, 3), (10, 10), (250, 99)])
+def test_chunk_boundaries(candles, chunk_bars, page_limit):
+    ex = AsyncSimExchange(candles)
+    start = int(candles[SYMBOL][100, 0])
+    end = int(candles[SYMBOL][1899, 0])
+    data = fetch(ex, start, end, chunk_bars=chunk_bars, page_limit=page_limit)
+    np.testing.assert_array_equal(data['timestamp'], expected_ts(start, end))
+    np.testing.assert_array_equal(data['close'], candles[SYMBOL][100:1900, 4])
+
+
+def test_overlapping_pages_deduplicated(candles):
+    ex = OverlapExchange(candles)
+    start = int(candles[SYMBOL][10, 0])
+    end = int(candles[SYMBOL][2009, 0])
+    data = fetch(ex, start, end, chunk_bars=100, page_limit=30)
+    np.testing.assert_array_equal(data['timestamp'], expected_ts(start, end))
+    np.testing.assert_array_equal(data['open'], candles[SYMBOL][10:2010, 1])
+
+
+def test_in_flight_limit(candles):
+    ex = CountingExchange(candles, latency=0.01)
+    start = int(candles[SYMBOL][0, 0])
+    end = int(candles[SYMBOL][-1, 0])
+    data = fetch(ex, start, end, max_in_flight=3, chunk_bars=200)
+    assert len(data['timestamp']) == 5000
+    assert ex.max_in_flight == 3
+
+
+def test_retry_after_failures(candles, monkeypatch):
+    waits = []
+    real_sleep = asyncio.sleep
+
+    async def fast_sleep(seconds, *args):
+        waits.append(seconds)
+        await real_sleep(0)
+
+    monkeypatch.setattr(data_download.asyncio, 'sleep', fast_sleep)
+    # 同一页连续失败 3 次: 指数退避后成功
+    ex = AsyncSimExchange(candles)
+    ex.fail_next(count=3)
+    start, end = int(candles[SYMBOL][0, 0]), int(candles[SYMBOL][999, 0])
+    data = fetch(ex, start, end)
+    np.testing.assert_array_equal(data['timestamp'], expected_ts(start, end))
+    assert ex.calls['fetch_ohlcv'] == 1 + 3
+    assert waits == [1, 2, 4]
+
+    # 多个分段各失败一次: 都重试成功，合并结果完整
+    ex = AsyncSimExchange(candles, error_rate=0.3, seed=1)
+    start, end = int(candles[SYMBOL][0, 0]), int(candles[SYMBOL][-1, 0])
+    data = fetch(ex, start, end, chunk_bars=250, page_limit=100)
+    np.testing.assert_array_equal(data['timestamp'], expected_ts(start, end))
+    assert ex.calls['fetch_ohlcv'] > 50
+
+
+def test_retry_gives_up(candles, monkeypatch):
+    real_sleep = asyncio.sleep
+
+    async def fast_sleep(seconds, *args):
+        await real_sleep(0)
+
+    monkeypatch.setattr(data_download.asyncio, 'sleep', fast_sleep)
+    ex = AsyncSimExchange(candles)
+    ex.fail_next(count=5)
+    with pytest.raises(ccxt.NetworkError):
+        fetch(ex, int(candles[SYMBOL][0, 0]), int(candles[SYMBOL][999, 0]), max_in_flight=1)
+
+
+def test_weight_budget_waits_for_refill():
+    budget = WeightBudget(per_minute=600)    # 每秒补 10
+    t0 = time.monotonic()
+    asyncio.run(budget.acquire(600))          # 一次用光
+    assert time.monotonic() - t0 < 0.1
+    asyncio.run(budget.acquire(5))            # 要等 0.5 秒
+    assert time.monotonic() - t0 >= 0.45
+
+
+def test_weight_budget_limits_download(candles):
+    """令牌桶是空的: 10 页 (每页权重 1) 按每秒 20 的速度要 0.5 秒左右"""
+    budget = WeightBudget(per_minute=1200)
+    budget.tokens = 0.0
+    ex = AsyncSimExchange(candles)
+    start = int(candles[SYMBOL][0, 0])
+    end = int(candles[SYMBOL][499, 0])
+    t0 = time.monotonic()
+    data = fetch(ex, start, end, budget=budget, chunk_bars=50, page_limit=50, max_in_flight=8)
+    elapsed = time.monotonic() - t0
+
+    assert len(data['timestamp']) == 500
+    assert ex.calls['fetch_ohlcv'] == 10
+    assert data_download.kline_weight(50) == 1
+    assert elapsed >= 10 / 20 - 0.05
+    assert budget.tokens < 1.0
@@ -0,0 +1,123 @@
+# 文件名: tests/test_data_manager.py
+# DataManager 增量拉取: 正在形成的K线被修正、断开超过 DELTA_LIMIT 根后重新完整拉取，
+# 每一步缓冲区都要和交易所当时完整返回的最近 limit 根一模一样 (不缺K线、不重复)
+import asyncio
+
+import numpy as np
+import pytest
+
+from data_manager import DataManager
+from sim_exchange import AsyncSimExchange, SimExchange, make_candles
+
+SYMBOL = 'BTC/USDT'
+MIN_MS = 60_000
+BAR_MS = 5 * MIN_MS
+LIMIT = 100
+DELTA = DataManager.DELTA_LIMIT
+
+
+def five_minutes(m1):
+    """1m -> 5m，模拟交易所用 1m 合成正在形成的 5m K线"""
+    k = len(m1) // 5 * 5
+    g = m1[:k].reshape(-1, 5, 6)
+    return np.column_stack([g[:, 0, 0], g[:, 0, 1], g[:, :, 2].max(axis=1), g[:, :, 3].min(axis=1),
+                            g[:, -1, 4], g[:, :, 5].sum(axis=1)])
+
+
+M1 = make_candles(5 * 400, start='2024-01-01 00:00:00', timeframe='1m', seed=11)
+CANDLES = {SYMBOL: {'1m': M1, '5m': five_minutes(M1)}}
+T0 = int(M1[0, 0])
+
+
+def setup(cls=SimExchange, bars=200, minute=2):
+    """时钟停在第 bars 根 5m K线开盘后 minute 分钟 (这一根正在形成)"""
+    now = T0 + bars * BAR_MS + minute * MIN_MS + 1
+    return DataManager(cls(CANDLES, now_ms=now)), SimExchange(CANDLES, now_ms=now)
+
+
+def assert_matches_exchange(df, ref, now_ms):
+    """和交易所此刻完整返回的最近 LIMIT 根一致"""
+    ref.now_ms = now_ms
+    expected = np.asarray(ref.fetch_ohlcv(SYMBOL, '5m', limit=LIMIT))
+    times = df['time'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    np.testing.assert_array_equal(times, expected[:, 0])
+    np.testing.assert_allclose(df[['open', 'high', 'low', 'close', 'vol']].to_numpy(), expected[:, 1:])
+    assert (np.diff(times) == BAR_MS).all()
+
+
+def test_forming_bar_is_revised_in_place():
+    dm, ref = setup()
+    ex = dm.exchange
+    df = dm.fetch_kline(SYMBOL, '5m', limit=LIMIT)
+    assert_matches_exchange(df, ref, ex.now_ms)
+    forming = int(df['time'].iloc[-1].value // 10 ** 6)
+
+    # 同一根 5m K线里每过 1 分钟拉一次: 只修正最后一根，不新增
+    for _ in range(2):
+        ex.advance(MIN_MS)
+        before = df['close'].iloc[-1]
+        df = dm.fetch_kline(SYMBOL, '5m', limit=LIMIT)
+        assert_matches_exchange(df, ref, ex.now_ms)
+        assert df['time'].iloc[-1].value // 10 ** 6 == forming
+        assert df['close'].iloc[-1] != before
+
+    # 跨过收盘: 上一根定稿成交易所的最终值，新开一根
+    ex.advance(MIN_MS)
+    df = dm.fetch_kline(SYMBOL, '5m', limit=LIMIT)
+    assert_matches_exchange(df, ref, ex.now_ms)
+    assert df['time'].iloc[-2].value // 10 ** 6 == forming
+    np.testing.assert_allclose(df.iloc[-2, 1:].to_numpy(dtype=float), CANDLES[SYMBOL]['5m'][200, 1:])
+    # 第一次完整拉取，之后都是增量
+    assert ex.calls['fetch_ohlcv'] == 4
+
+
+@pytest.mark.parametrize('missed, full_refetch', [
+    (1, False),
+    (DELTA - 2, False),     # 增量返回 DELTA-1 根 (上次那根 + 新的)，还没取满
+    (DELTA - 1, True),      # 正好取满 DELTA 根: 分不清后面还有没有，按缺失过多处理
+    (DELTA + 5, True),
+    (150, True),            # 比整个缓冲区还多
+])
+def test_gap_after_missed_bars(missed, full_refetch, capsys):
+    dm, ref = setup()
+    ex = dm.exchange
+    dm.fetch_kline(SYMBOL, '5m', limit=LIMIT)
+    capsys.readouterr()
+
+    ex.advance(missed * BAR_MS)
+    df = dm.fetch_kline(SYMBOL, '5m', limit=LIMIT)
+    assert_matches_exchange(df, ref, ex.now_ms)
+    assert ex.calls['fetch_ohlcv'] == (3 if full_refetch else 2)
+    assert ('缺失K线过多' in capsys.readouterr().out) == full_refetch
+
+    # 之后恢复增量
+    ex.advance(BAR_MS)
+    df = dm.fetch_kline(SYMBOL, '5m', limit=LIMIT)
+    assert_matches_exchange(df, ref, ex.now_ms)
+
+
+def test_failed_request_keeps_the_buffer():
+    dm, ref = setup()
+    ex = dm.exchange
+    dm.fetch_kline(SYMBOL, '5m', limit=LIMIT)
+    ex.advance(3 * BAR_MS)
+    ex.fail_next(count=1)
+    assert dm.fetch_kline(SYMBOL, '5m', limit=LIMIT) is None
+    ex.advance(BAR_MS)
+    assert_matches_exchange(dm.fetch_kline(SYMBOL, '5m', limit=LIMIT), ref, ex.now_ms)
+
+
+def test_async_fetch_handles_gaps_the_same_way():
+    dm, ref = setup(AsyncSimExchange)
+    ex = dm.exchange
+
+    async def run():
+        frames = [await dm.fetch_kline_async(SYMBOL, '5m', limit=LIMIT)]
+        for step in (MIN_MS, (DELTA + 5) * BAR_MS, BAR_MS):
+            ex.advance(step)
+            frames.append((await dm.fetch_kline_async(SYMBOL, '5m', limit=LIMIT)).copy())
+            assert_matches_exchange(frames[-1], ref, ex.now_ms)
+
+    asyncio.run(run())
+    # 完整 + 增量 + (取满的增量 + 完整) + 增量
+    assert ex.calls['fetch_ohlcv'] == 5
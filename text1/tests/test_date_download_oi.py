@@ -0,0 +1,116 @@
+# 文件名: tests/test_date_download_oi.py
+# K线 + OI 并发下载: 请求失败的 OI 分段会记成缺口并补回来，as-of 对齐
+import asyncio
+
+import numpy as np
+import pytest
+
+import data_download
+import date_download_oi
+from date_download_oi import OI_LIMIT, asof_merge, fetch_binance_futures_data_with_oi, fill_oi_gaps, oi_store_path_for
+from kline_store import KlineStore
+from sim_exchange import AsyncSimExchange, make_candles, make_open_interest
+
+SYMBOL = 'BTC/USDT'
+TF_MS = 5 * 60 * 1000
+START = '2020-01-01 00:00:00'
+
+
+class FlakyOIExchange(AsyncSimExchange):
+    """指定起点的 OI 请求前 fail_times 次报错 (模拟某一段一直超时)"""
+
+    def __init__(self, *args, bad_since=(), fail_times=3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bad = {int(t): fail_times for t in bad_since}
+
+    async def fetch_open_interest_history(self, symbol, timeframe='5m', since=None, limit=None, params=None):
+        if self.bad.get(since, 0) > 0:
+            self.bad[since] -= 1
+            await self._request('fetch_open_interest_history')
+            raise data_download.ccxt.RequestTimeout('模拟超时')
+        return await super().fetch_open_interest_history(symbol, timeframe, since, limit, params)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch, tmp_path):
+    """重试退避不真的等；存储写在临时目录"""
+    real_sleep = asyncio.sleep
+
+    async def fast_sleep(seconds, *args):
+        await real_sleep(0)
+
+    monkeypatch.setattr(date_download_oi.asyncio, 'sleep', fast_sleep)
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def market():
+    candles = make_candles(3000)
+    return {SYMBOL: candles}, {SYMBOL: make_open_interest(candles)}
+
+
+def chunk_start(i):
+    return make_candles(1)[0, 0] + i * OI_LIMIT * TF_MS
+
+
+def download(exchange, **kwargs):
+    return fetch_binance_futures_data_with_oi(SYMBOL, '5m', START, None, exchange=exchange, save=False,
+                                              window_chunks=2, **kwargs)
+
+
+def test_download_complete(market):
+    candles, oi = market
+    df = download(AsyncSimExchange(candles, open_interest=oi))
+    assert len(df) == 3000
+    np.testing.assert_array_equal(df['OpenInterest'].to_numpy(), oi[SYMBOL][:3000, 1])
+    assert KlineStore(oi_store_path_for(SYMBOL, '5m')).gaps == []
+
+
+@pytest.mark.parametrize('bad', [[0], [2], [1, 5], [5]])
+def test_failed_oi_chunks_refetched(market, bad):
+    """
+    分段在下载时重试用完仍失败 (开头 / 中间 / 最后一个窗口的末尾)，
+    下载结束前的补缺口会重新请求，最终 OI 完整、缺口清空
+    """
+    candles, oi = market
+    ex = FlakyOIExchange(candles, open_interest=oi, bad_since=[chunk_start(i) for i in bad], fail_times=3)
+    df = download(ex)
+    assert not df['OpenInterest'].isna().any()
+    np.testing.assert_array_equal(df['OpenInterest'].to_numpy(), oi[SYMBOL][:3000, 1])
+    assert KlineStore(oi_store_path_for(SYMBOL, '5m')).gaps == []
+
+
+def test_gap_kept_until_fill_succeeds(market):
+    """补缺口时还在报错: 缺口留在 meta.json，之后 fill_oi_gaps 再补上"""
+    candles, oi = market
+    bad = chunk_start(2)
+    ex = FlakyOIExchange(candles, open_interest=oi, bad_since=[bad], fail_times=6)
+    df = download(ex)
+    store = KlineStore(oi_store_path_for(SYMBOL, '5m'))
+    assert df['OpenInterest'].isna().sum() == OI_LIMIT
+    assert [(g['start'], g['end'], g.get('confirmed')) for g in store.gaps] == \
+        [(bad - TF_MS, bad + OI_LIMIT * TF_MS, None)]
+
+    store = fill_oi_gaps(SYMBOL, '5m', exchange=ex)
+    assert store.gaps == []
+    assert store.rows == 3000
+    np.testing.assert_array_equal(store.load()['open_interest'].to_numpy(), oi[SYMBOL][:3000, 1])
+
+
+def test_missing_on_exchange_confirmed(market):
+    """交易所本身就没有的 OI (中间一段空着): 补一次后标记为 confirmed，不再重试"""
+    candles, oi = market
+    keep = np.ones(len(oi[SYMBOL]), dtype=bool)
+    keep[1200:1250] = False
+    df = download(AsyncSimExchange(candles, open_interest={SYMBOL: oi[SYMBOL][keep]}))
+    gaps = KlineStore(oi_store_path_for(SYMBOL, '5m')).gaps
+    assert len(gaps) == 1 and gaps[0]['confirmed'] and gaps[0]['missing'] == 50
+    assert df['OpenInterest'].isna().sum() == 50
+
+
+def test_asof_merge_tolerance():
+    ts = np.array([0, 5, 10, 15, 20], dtype=np.int64)
+    oi_ts = np.array([0, 9, 20], dtype=np.int64)
+    vals = np.array([1.0, 2.0, 3.0])
+    np.testing.assert_array_equal(asof_merge(ts, oi_ts, vals), [1, np.nan, np.nan, np.nan, 3])
+    np.testing.assert_array_equal(asof_merge(ts, oi_ts, vals, tolerance_ms=6), [1, 1, 2, 2, 3])
@@ -0,0 +1,90 @@
+# 文件名: tests/test_drive.py
+# BinanceDriver: 杠杆/保证金模式在启动时设置；没设置成功时不下单，下一次信号先重试设置
+import ccxt
+
+from drive import BinanceDriver
+from sim_exchange import SimExchange, make_candles
+
+SYMBOL = 'BTC/USDT'
+
+
+class Cfg:
+    API_KEY = SECRET = ''
+    SANDBOX_MODE = False
+    ENABLE_TRADING = True
+    SYMBOL = SYMBOL
+    LEVERAGE = 10
+    MARGIN_MODE = None
+    QUANTITY_USDT = 1000
+
+
+def make_driver(fail=0, error=None, **overrides):
+    """fail: 启动时开始有几次请求失败 (load_markets 预先加载好，失败落在杠杆/保证金模式的设置上)"""
+    cfg = type('TestCfg', (Cfg,), overrides)
+    ex = SimExchange({SYMBOL: make_candles(500)})
+    ex.load_markets()
+    if fail:
+        ex.fail_next(error or ccxt.NetworkError('模拟网络错误'), count=fail)
+    driver = BinanceDriver(cfg, exchange=ex)
+    driver.update_price(ex.candles[SYMBOL]['5m'][-1, 4], SYMBOL)
+    return driver, ex
+
+
+def test_symbol_is_prepared_at_startup():
+    driver, ex = make_driver()
+    assert SYMBOL in driver.prepared
+    assert ex.calls['set_leverage'] == 1
+
+    # 下单路径上不再设置杠杆
+    assert driver.execute_order('buy') is not None
+    assert ex.calls['set_leverage'] == 1
+    assert ex.calls['create_order'] == 1
+
+
+def test_failed_leverage_blocks_orders_until_retry_succeeds():
+    driver, ex = make_driver(fail=2)
+    assert SYMBOL not in driver.prepared
+
+    # 启动失败 + 第一次信号重试也失败: 不能按账户原来的杠杆下单
+    assert driver.execute_order('buy') is None
+    assert 'create_order' not in ex.calls
+    assert ex.calls['set_leverage'] == 2
+
+    assert driver.execute_order('buy') is not None
+    assert ex.leverages[SYMBOL] == Cfg.LEVERAGE
+    assert SYMBOL in driver.prepared
+    assert ex.calls['create_order'] == 1
+
+    driver.execute_order('sell')
+    assert ex.calls['set_leverage'] == 3
+
+
+class BusyMarginExchange(SimExchange):
+    """前 margin_failures 次 set_margin_mode 报错，其它请求正常"""
+    margin_failures = 2
+
+    def set_margin_mode(self, marginMode, symbol=None, params=None):
+        if self.margin_failures:
+            self.margin_failures -= 1
+            self._request('set_margin_mode')
+            raise ccxt.ExchangeError('binance {"code":-1000,"msg":"busy"}')
+        return super().set_margin_mode(marginMode, symbol, params)
+
+
+def test_failed_margin_mode_blocks_orders():
+    cfg = type('TestCfg', (Cfg,), {'MARGIN_MODE': 'isolated'})
+    ex = BusyMarginExchange({SYMBOL: make_candles(500)})
+    driver = BinanceDriver(cfg, exchange=ex)
+    driver.update_price(ex.candles[SYMBOL]['5m'][-1, 4], SYMBOL)
+    assert driver.leverage[SYMBOL] == Cfg.LEVERAGE and SYMBOL not in driver.prepared
+
+    assert driver.execute_order('buy') is None
+    assert 'create_order' not in ex.calls
+    assert driver.execute_order('buy') is not None
+    assert ex.margin_modes[SYMBOL] == 'isolated'
+    assert ex.calls['set_leverage'] == 1            # 杠杆成功过就不再重复设置
+
+
+def test_margin_mode_already_set_counts_as_prepared():
+    driver, ex = make_driver(MARGIN_MODE='cross')   # 模拟交易所默认就是全仓，会报 No need to change
+    assert SYMBOL in driver.prepared
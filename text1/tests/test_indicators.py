@@ -0,0 +1,190 @@
+# 文件名: tests/test_indicators.py
+# 增量指标 (SMA / EMA / RSI / IndicatorFeed) 与 pandas rolling / ewm 的一致性
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import EMA, RSI, SMA, IndicatorFeed
+
+RTOL = 1e-9
+ATOL = 1e-9
+
+
+def random_walk(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 30000 + np.cumsum(rng.normal(0, 50, n))
+
+
+def pandas_rsi(values, period):
+    """直接用 pandas 写的 Wilder RSI (作为对照，不经过 indicators.rsi)"""
+    delta = pd.Series(values).diff()
+    gain = delta.where(delta > 0, 0).fillna(0)
+    loss = (-delta.where(delta < 0, 0)).fillna(0)
+    avg_gain = gain.ewm(com=period - 1, min_periods=period).mean()
+    avg_loss = loss.ewm(com=period - 1, min_periods=period).mean()
+    return (100 - 100 / (1 + avg_gain / avg_loss)).to_numpy()
+
+
+def reference_sma(values, period):
+    return pd.Series(values).rolling(period).mean().to_numpy()
+
+
+def reference(name, values):
+    s = pd.Series(values)
+    if name == 'sma':
+        return reference_sma(values, 31)
+    if name == 'ema':
+        return s.ewm(span=20).mean().to_numpy()
+    if name == 'ema_recursive':
+        return s.ewm(span=20, adjust=False, min_periods=5).mean().to_numpy()
+    return pandas_rsi(values, 14)
+
+
+def build(name):
+    return {
+        'sma': lambda: SMA(31),
+        'ema': lambda: EMA(span=20),
+        'ema_recursive': lambda: EMA(span=20, adjust=False, min_periods=5),
+        'rsi': lambda: RSI(14),
+    }[name]()
+
+
+NAMES = ['sma', 'ema', 'ema_recursive', 'rsi']
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_add_matches_pandas(name):
+    values = random_walk(3000)
+    ind = build(name)
+    out = np.array([ind.add(x) for x in values])
+    np.testing.assert_allclose(out, reference(name, values), rtol=RTOL, atol=ATOL, equal_nan=True)
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_prev_value_is_previous_bar(name):
+    values = random_walk(200, seed=1)
+    ind = build(name)
+    for x in values:
+        ind.add(x)
+    expected = reference(name, values)
+    assert ind.value == pytest.approx(expected[-1], rel=RTOL)
+    assert ind.prev_value == pytest.approx(expected[-2], rel=RTOL)
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_revise_forming_bar(name):
+    """未收盘K线的价格反复变化: 每次 revise 后都等于把最后一根换成新价格的 pandas 结果"""
+    values = random_walk(500, seed=2)
+    rng = np.random.default_rng(3)
+    ind = build(name)
+    for i, x in enumerate(values):
+        ind.add(x + rng.normal(0, 30))         # 开盘时的价格
+        for _ in range(3):
+            ind.revise(x + rng.normal(0, 30))  # 形成过程中的价格
+        got = ind.revise(x)                    # 最终收盘价
+        if i % 50 == 0 or i == len(values) - 1:
+            expected = reference(name, values[:i + 1])[-1]
+            np.testing.assert_allclose(got, expected, rtol=RTOL, atol=ATOL, equal_nan=True)
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_warmup_then_add(name):
+    values = random_walk(1000, seed=4)
+    ind = build(name)
+    ind.warmup(values[:600])
+    expected = reference(name, values)
+    np.testing.assert_allclose(ind.value, expected[599], rtol=RTOL, atol=ATOL, equal_nan=True)
+    out = np.array([ind.add(x) for x in values[600:]])
+    np.testing.assert_allclose(out, expected[600:], rtol=RTOL, atol=ATOL, equal_nan=True)
+
+
+def test_sma_warmup_short_history():
+    ind = SMA(31)
+    ind.warmup(random_walk(10))
+    assert np.isnan(ind.value) and not ind.ready
+    values = random_walk(40)
+    ind.warmup(values)
+    assert ind.value == pytest.approx(values[-31:].mean(), rel=RTOL)
+    assert ind.prev_value == pytest.approx(values[-32:-1].mean(), rel=RTOL)
+
+
+def test_sma_long_run_no_drift():
+    """超过 RESYNC_EVERY 根之后滚动求和仍然准确"""
+    values = random_walk(SMA.RESYNC_EVERY * 3 + 17, seed=5)
+    ind = SMA(128)
+    out = np.array([ind.add(x) for x in values])
+    np.testing.assert_allclose(out, reference_sma(values, 128), rtol=1e-10, equal_nan=True)
+
+
+# =================================================================
+# IndicatorFeed.sync: 实盘每轮拿到一段K线窗口
+# =================================================================
+def make_feed():
+    return IndicatorFeed(ma31=SMA(31), ma128=SMA(128), ema=EMA(span=20), rsi=RSI(14))
+
+
+def check_feed(feed, closes):
+    """feed 的值应该等于对 closes (喂进去的全部历史) 重新整段计算的结果"""
+    assert feed['ma31'].value == pytest.approx(reference_sma(closes, 31)[-1], rel=RTOL)
+    assert feed['ma128'].value == pytest.approx(reference_sma(closes, 128)[-1], rel=RTOL)
+    assert feed['ma31'].prev_value == pytest.approx(reference_sma(closes, 31)[-2], rel=RTOL)
+    assert feed['ema'].value == pytest.approx(pd.Series(closes).ewm(span=20).mean().iloc[-1], rel=RTOL)
+    assert feed['rsi'].value == pytest.approx(pandas_rsi(closes, 14)[-1], rel=RTOL)
+
+
+def test_feed_sliding_window_with_forming_bar():
+    """每轮 500 根窗口，最后一根未收盘价格在变，出现新K线时窗口往前滑"""
+    n = 1200
+    times = pd.date_range('2026-01-01', periods=n, freq='5min')
+    closes = random_walk(n, seed=6)
+    rng = np.random.default_rng(7)
+    feed = make_feed()
+
+    assert feed.sync(times[:500], closes[:500]) is True
+    check_feed(feed, closes[:500])
+    for end in range(501, n + 1):
+        window = closes[end - 500:end].copy()
+        window[-1] += rng.normal(0, 30)          # 正在形成的K线
+        assert feed.sync(times[end - 500:end], window) is True
+        assert feed.sync(times[end - 500:end], window + 1.0 * (end % 3)) is False  # 同一根K线价格又变了
+        window[-1] = closes[end - 1]
+        feed.sync(times[end - 500:end], window)
+        if end % 100 == 0:
+            # EMA / RSI 预热用的是第一个窗口，所以和 closes[:end] 整段计算一致
+            check_feed(feed, closes[:end])
+
+
+def test_feed_several_new_bars_at_once():
+    """断线一会儿，再同步时一次来了多根新K线 (窗口里仍然有上次最后那根)"""
+    times = pd.date_range('2026-01-01', periods=900, freq='5min')
+    closes = random_walk(900, seed=8)
+    feed = make_feed()
+    feed.sync(times[:500], closes[:500])
+    for end in (507, 520, 600, 899):
+        feed.sync(times[end - 500:end], closes[end - 500:end])
+        check_feed(feed, closes[:end])
+
+
+def test_feed_gap_too_long_rewarms():
+    """上次最后一根已经不在窗口里: 用整段窗口重新预热"""
+    times = pd.date_range('2026-01-01', periods=2000, freq='5min')
+    closes = random_walk(2000, seed=9)
+    feed = make_feed()
+    feed.sync(times[:500], closes[:500])
+    assert feed.sync(times[1200:1700], closes[1200:1700]) is True
+    check_feed(feed, closes[1200:1700])
+
+
+def test_feed_history_rewritten():
+    """时间倒退 (换了数据源 / 交易所回滚了K线): 重新预热，结果只和新数据有关"""
+    times = pd.date_range('2026-01-01', periods=1000, freq='5min')
+    closes = random_walk(1000, seed=10)
+    feed = make_feed()
+    feed.sync(times[400:900], closes[400:900])
+    rewritten = closes[:500] * 1.01
+    assert feed.sync(times[:500], rewritten) is True
+    check_feed(feed, rewritten)
+    # 窗口里还能找到上次最后一根，但它的收盘价被改写了: 修正后再往下加
+    rewritten2 = np.concatenate([rewritten[:499], [rewritten[499] + 80], closes[500:510]])
+    feed.sync(times[:510], rewritten2)
+    check_feed(feed, rewritten2)
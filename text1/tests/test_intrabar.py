@@ -0,0 +1,66 @@
+# 文件名: tests/test_intrabar.py
+# SubBars 读取各种 1m CSV 格式: 能建缓存的走缓存，缓存不认识的格式直接读进内存
+import numpy as np
+import pandas as pd
+import pytest
+
+from intrabar import SubBars
+
+MIN_MS = 60_000
+T0 = 1_700_000_000_000 - 1_700_000_000_000 % MIN_MS
+
+
+def _minutes(n=30):
+    rng = np.random.default_rng(3)
+    close = 100 + np.cumsum(rng.normal(0, 0.3, n))
+    open_ = np.r_[100.0, close[:-1]]
+    return pd.DataFrame({
+        'timestamp': T0 + np.arange(n, dtype=np.int64) * MIN_MS,
+        'open': open_,
+        'high': np.maximum(open_, close) + 0.2,
+        'low': np.minimum(open_, close) - 0.2,
+        'close': close,
+        'volume': 1.0,
+    })
+
+
+def _assert_same(a, b):
+    np.testing.assert_array_equal(np.asarray(a.time), np.asarray(b.time))
+    for col in ('open', 'high', 'low'):
+        np.testing.assert_allclose(np.asarray(getattr(a, col)), np.asarray(getattr(b, col)))
+    start, end = T0 + 5 * MIN_MS, T0 + 20 * MIN_MS
+    mid = float(a.open[5])
+    for otype, sl, tp in ((1, mid - 0.5, mid + 0.5), (-1, mid + 0.5, mid - 0.5)):
+        assert a.resolve_exit(otype, sl, tp, start, end) == b.resolve_exit(otype, sl, tp, start, end)
+
+
+def test_numeric_timestamp_csv_uses_cache(tmp_path):
+    df = _minutes()
+    path = tmp_path / 'numeric.csv'
+    df.to_csv(path, index=False)
+    sub = SubBars(str(path))
+    assert isinstance(sub.time, np.memmap)
+    assert sub.time[0] == T0 and len(sub.time) == len(df)
+
+
+def test_datetime_string_timestamp_falls_back_to_csv(tmp_path):
+    """timestamp 列是日期字符串时缓存建不起来，应直接读 CSV，结果和数字时间戳一致"""
+    df = _minutes()
+    numeric = tmp_path / 'numeric.csv'
+    df.to_csv(numeric, index=False)
+
+    text = df.copy()
+    text['timestamp'] = pd.to_datetime(text['timestamp'], unit='ms').dt.strftime('%Y-%m-%d %H:%M:%S')
+    text = text.iloc[::-1]                      # 倒序也要能正确排序
+    strings = tmp_path / 'strings.csv'
+    text.to_csv(strings, index=False)
+
+    _assert_same(SubBars(str(strings)), SubBars(str(numeric)))
+
+
+def test_unknown_csv_format_raises_clear_error(tmp_path):
+    df = _minutes().rename(columns={'timestamp': 'time'})
+    path = tmp_path / 'unknown.csv'
+    df.to_csv(path, index=False)
+    with pytest.raises(ValueError, match='格式不认识'):
+        SubBars(str(path))
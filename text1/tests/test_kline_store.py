@@ -0,0 +1,99 @@
+# 文件名: tests/test_kline_store.py
+# CSV 二进制缓存: 与直接 pd.read_csv 的结果一致、按时间范围读取、CSV 变化后重建、
+# 数字时间戳的单位识别、格式不认识时只解析一次
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+import kline_store
+from kline_store import KlineStore, cache_path_for, epoch_to_ms, load_csv_cached
+from sim_exchange import make_candles
+
+COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+def write_csv(path, n=3000, seed=0, shuffle=False):
+    """data_download.py 导出的 CSV 格式 (datetime, Timestamp, Open, High, Low, Close, Volume)"""
+    c = make_candles(n, start='2024-01-01 00:00:00', seed=seed)
+    df = pd.DataFrame(c, columns=['Timestamp', 'Open', 'High', 'Low', 'Close', 'Volume'])
+    df['Timestamp'] = df['Timestamp'].astype(np.int64)
+    df.insert(0, 'datetime', pd.to_datetime(df['Timestamp'], unit='ms').dt.strftime('%Y-%m-%d %H:%M:%S'))
+    if shuffle:
+        df = df.sample(frac=1, random_state=seed)
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+def load(path, start, end, use_cache, monkeypatch):
+    monkeypatch.setattr(backtest, 'USE_CACHE', use_cache)
+    return backtest.load_from_csv(path, start, end)[COLUMNS].reset_index(drop=True)
+
+
+@pytest.mark.parametrize('start, end', [
+    ('2024-01-01 00:00:00', '2024-02-01 00:00:00'),     # 全部
+    ('2024-01-03 10:05:00', '2024-01-05 17:35:00'),     # 中间一段 (两端正好落在K线上，都包含)
+    ('2024-01-03 10:07:00', '2024-01-05 17:33:00'),     # 两端落在K线之间
+    ('2023-01-01 00:00:00', '2024-01-01 00:00:00'),     # 只有第一根
+])
+def test_cache_matches_read_csv(tmp_path, monkeypatch, start, end):
+    path = write_csv(tmp_path / 'k.csv', shuffle=True)
+    cached = load(path, start, end, True, monkeypatch)
+    plain = load(path, start, end, False, monkeypatch)
+    assert len(cached) > 0
+    pd.testing.assert_frame_equal(cached, plain, check_dtype=False)
+
+
+def test_range_load_is_inclusive_slice(tmp_path):
+    path = write_csv(tmp_path / 'k.csv', n=500)
+    full = load_csv_cached(path)
+    part = load_csv_cached(path, full['timestamp'][100], full['timestamp'][199])
+    pd.testing.assert_frame_equal(part, full.iloc[100:200].reset_index(drop=True))
+    assert load_csv_cached(path, '2030-01-01', '2031-01-01').empty
+
+
+def test_cache_is_rebuilt_when_csv_changes(tmp_path):
+    path = write_csv(tmp_path / 'k.csv', n=500)
+    assert len(load_csv_cached(path)) == 500
+    assert KlineStore(cache_path_for(path)).is_fresh(path)
+
+    # 内容变了 (大小变化)
+    write_csv(path, n=600)
+    assert not KlineStore(cache_path_for(path)).is_fresh(path)
+    assert len(load_csv_cached(path)) == 600
+
+    # 大小不变、只有修改时间变了: 也要重建
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert not KlineStore(cache_path_for(path)).is_fresh(path)
+    load_csv_cached(path)
+    assert KlineStore(cache_path_for(path)).is_fresh(path)
+
+
+@pytest.mark.parametrize('scale', [1000, 1, 1 / 1000])    # 微秒 / 毫秒 / 秒
+def test_numeric_timestamp_units(tmp_path, scale):
+    c = make_candles(50, start='2024-01-01 00:00:00')
+    ms = c[:, 0].astype(np.int64)
+    df = pd.DataFrame({'timestamp': (ms * scale).astype(np.int64), 'open': c[:, 1], 'high': c[:, 2],
+                       'low': c[:, 3], 'close': c[:, 4]})
+    path = str(tmp_path / 'k.csv')
+    df.to_csv(path, index=False)
+    out = load_csv_cached(path)
+    np.testing.assert_array_equal(out['timestamp'].to_numpy(dtype='datetime64[ms]').astype(np.int64), ms)
+    np.testing.assert_array_equal(epoch_to_ms(ms * scale), ms)
+
+
+def test_unsupported_layout_is_parsed_once(tmp_path, monkeypatch):
+    path = str(tmp_path / 'k.csv')
+    pd.DataFrame({'time': ['2024-01-01 00:00'], 'open': [1.0], 'high': [1.0], 'low': [1.0],
+                  'close': [1.0]}).to_csv(path, index=False)
+    reads = []
+    real_read_csv = pd.read_csv
+    monkeypatch.setattr(kline_store.pd, 'read_csv', lambda *a, **k: reads.append(a) or real_read_csv(*a, **k))
+
+    assert load_csv_cached(path) is None
+    assert load_csv_cached(path) is None
+    assert len(reads) == 1
+    assert not KlineStore(cache_path_for(path)).cacheable
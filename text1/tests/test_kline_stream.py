@@ -0,0 +1,141 @@
+# 文件名: tests/test_kline_stream.py
+# WebSocket 推送数据源: 用 sim_exchange.SimKlineServer 在本地播放K线，KlineStream 订阅它
+import json
+
+import numpy as np
+import pytest
+
+from candle_buffer import COLUMNS
+from kline_stream import KlineStream
+from resampler import aggregate
+from sim_exchange import SimExchange, SimKlineServer, make_candles
+
+SYMBOL = 'BTC/USDT'
+TF_MS = {'5m': 5 * 60 * 1000, '15m': 15 * 60 * 1000}
+HISTORY = 300      # 预热时已经发生的 5m K线数量 (第 HISTORY 根正在形成)
+PLAYED = 30        # 推送服务器从第 HISTORY 根开始播放的根数
+
+
+@pytest.fixture(scope='module')
+def candles():
+    base = make_candles(HISTORY + PLAYED, seed=3)
+    t, o, h, l, c, v = aggregate(base[:, 0], *base[:, 1:].T, TF_MS['15m'])
+    return {'5m': base, '15m': np.column_stack([t, o, h, l, c, v])}
+
+
+def rows(frame):
+    """DataFrame -> [[ts, o, h, l, c, v], ...] 方便和K线数组比较"""
+    ts = frame['time'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    return np.column_stack([ts] + [frame[name].to_numpy() for name in COLUMNS[1:]])
+
+
+def played(arr, tf):
+    """推送服务器播放的K线: 从第 HISTORY 根 5m K线所在的那根开始 (两个周期的第一根开盘时间相同)"""
+    start = int(arr[0, 0]) + HISTORY * TF_MS['5m']
+    return arr[arr[:, 0] >= start - start % TF_MS[tf]]
+
+
+@pytest.fixture
+def stream_run(candles):
+    """预热 (REST) + 播放 (WebSocket)，等到所有收盘事件都收到"""
+    now = int(candles['5m'][HISTORY, 0]) + 1
+    exchange = SimExchange({SYMBOL: candles}, now_ms=now)
+    server = SimKlineServer({SYMBOL: {tf: played(arr, tf) for tf, arr in candles.items()}},
+                            interval=0.005, ticks=2).start()
+    stream = KlineStream(exchange, SYMBOL, ['5m', '15m'], url=server.url, capacity=100).start()
+    expected = sum(len(played(arr, tf)) for tf, arr in candles.items())
+    events = []
+    try:
+        while len(events) < expected:
+            event = stream.next_event(timeout=10)
+            assert event is not None, f"只收到 {len(events)} / {expected} 个收盘事件"
+            events.append(event)
+        frames = stream.get_all_timeframes()
+    finally:
+        stream.stop()
+        server.stop()
+    return candles, events, frames
+
+
+def test_close_events_in_order(stream_run):
+    candles, events, _ = stream_run
+    for tf, arr in candles.items():
+        got = [ts for symbol, t, ts in events if t == tf]
+        assert all(symbol == SYMBOL for symbol, _, _ in events)
+        assert got == [int(x) for x in played(arr, tf)[:, 0]]
+    # 按收盘时间交错: 每个事件的收盘时间不早于前一个
+    close_times = [ts + TF_MS[tf] for _, tf, ts in events]
+    assert close_times == sorted(close_times)
+
+
+def test_buffers_match_candles(stream_run):
+    """缓冲区 = 最近的已收盘K线 (与原始数据完全一致) + 一根以收盘价开盘的占位K线"""
+    candles, _, frames = stream_run
+    for tf, arr in candles.items():
+        got = rows(frames[tf])
+        closed = arr[-min(len(arr), 99):]
+        assert len(got) == len(closed) + 1
+        np.testing.assert_array_equal(got[:-1], closed)
+        last_close = arr[-1, 4]
+        np.testing.assert_array_equal(got[-1], [arr[-1, 0] + TF_MS[tf], last_close, last_close,
+                                                last_close, last_close, 0.0])
+
+
+def test_forming_bar_updates_without_event(candles):
+    """未收盘的推送只覆盖最后一根，不增加根数，也不发收盘事件；x=true 才发事件并补占位K线"""
+    arr = candles['5m']
+    exchange = SimExchange({SYMBOL: {'5m': arr}}, now_ms=int(arr[HISTORY, 0]) + 1)
+    stream = KlineStream(exchange, SYMBOL, ['5m'], capacity=50)
+    stream.warmup()
+    frame = stream.get_all_timeframes()['5m']
+    assert len(frame) == 50
+    assert rows(frame)[-1, 0] == arr[HISTORY, 0]   # 预热时最后一根是正在形成的K线
+
+    server = SimKlineServer({}, ticks=3)
+    messages = list(server._messages(SYMBOL, '5m', arr[HISTORY]))
+    for raw in messages[:-1]:
+        stream.handle_message(raw)
+        frame = stream.get_all_timeframes()['5m']
+        k = json.loads(raw)['data']['k']
+        assert len(frame) == 50
+        assert frame['close'].iloc[-1] == float(k['c'])
+        assert stream.next_event(timeout=0) is None
+
+    stream.handle_message(messages[-1])
+    assert stream.next_event(timeout=0) == (SYMBOL, '5m', int(arr[HISTORY, 0]))
+    got = rows(stream.get_all_timeframes()['5m'])
+    np.testing.assert_array_equal(got[-2], arr[HISTORY])
+    assert got[-1, 0] == arr[HISTORY, 0] + TF_MS['5m']
+    assert got[-1, 1] == arr[HISTORY, 4]
+    assert len(got) == 50    # 容量满了，最早的一根被挤出去
+
+
+def test_ignores_other_messages(candles):
+    stream = KlineStream(SimExchange({SYMBOL: candles}), SYMBOL, ['5m'], capacity=10)
+    stream.handle_message(json.dumps({'stream': 'btcusdt@aggTrade', 'data': {'e': 'aggTrade'}}))
+    stream.handle_message(json.dumps({'stream': 'btcusdt@kline_1h', 'data': {'e': 'kline', 'k': {
+        't': 0, 'T': 1, 'i': '1h', 'o': '1', 'h': '1', 'l': '1', 'c': '1', 'v': '1', 'x': True}}}))
+    assert stream.get_all_timeframes() == {}
+    assert stream.next_event(timeout=0) is None
+
+
+def test_close_event_drives_strategy(stream_run):
+    """main.process_cycle 直接吃推送缓冲区的数据 (没有 AlertSystem 时跳过报警)"""
+    import main
+    from Strategy import Strategy
+
+    class RecordingDriver:
+        def __init__(self):
+            self.prices, self.orders = [], []
+
+        def update_price(self, price, symbol=None):
+            self.prices.append(price)
+
+        def execute_order(self, side, signal_time=None):
+            self.orders.append(side)
+
+    candles, _, frames = stream_run
+    driver = RecordingDriver()
+    main.process_cycle(frames, driver, Strategy(main.Config), None)
+    assert main.Config.TRADE_TIMEFRAME == '5m'
+    assert driver.prices == [candles['5m'][-1, 4]]
@@ -0,0 +1,142 @@
+# 文件名: tests/test_notifier.py
+# Notifier 后台分发: 用假的 HTTP 会话代替 Bark 服务器，检查重试退避、发送顺序、统计、close() 等队列发完
+import sys
+import threading
+import time
+import types
+from urllib.parse import unquote
+
+import pytest
+
+from notifier import Notifier
+
+URLS = ['https://bark.test/alice', 'https://bark.test/bob']
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status = status
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise RuntimeError(f"HTTP {self.status}")
+
+
+class FakeSession:
+    """
+    记录每次请求 (时间, 接收人, 内容)
+    failures: {接收人: 前几次请求返回 500}，delay: 每个请求耗时 (秒)
+    """
+
+    def __init__(self, failures=None, delay=0.0):
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        time.sleep(self.delay)
+        base, user, title, content = url.rsplit('/', 3)
+        with self.lock:
+            self.requests.append((time.perf_counter(), user, unquote(content)))
+            if self.failures.get(user, 0) > 0:
+                self.failures[user] -= 1
+                return FakeResponse(500)
+        return FakeResponse(200)
+
+    def received(self, user):
+        with self.lock:
+            return [content for _, u, content in self.requests if u == user]
+
+
+def make_notifier(session, urls=URLS, **kwargs):
+    kwargs.setdefault('enable_tts', False)
+    n = Notifier(urls, **kwargs)
+    n.session = session
+    return n
+
+
+def test_failed_requests_are_retried_with_backoff():
+    session = FakeSession(failures={'alice': 2})
+    n = make_notifier(session, backoff=0.05, retries=3)
+    n.bark('标题', '金叉')
+    n.close()
+
+    times = [t for t, user, _ in session.requests if user == 'alice']
+    assert len(times) == 3
+    # 第 k 次重试前等待 backoff * 2^k
+    assert times[1] - times[0] >= 0.05 * 0.9
+    assert times[2] - times[1] >= 0.10 * 0.9
+    assert session.received('bob') == ['金叉']
+    stats = n.stats()
+    assert (stats['sent'], stats['failed'], stats['retried']) == (2, 0, 2)
+
+
+def test_gives_up_after_retries(capsys):
+    session = FakeSession(failures={'alice': 10})
+    n = make_notifier(session, backoff=0.01, retries=2)
+    n.bark('标题', '死叉')
+    n.close()
+
+    assert session.received('alice') == ['死叉'] * 3
+    stats = n.stats()
+    assert (stats['sent'], stats['failed'], stats['retried']) == (1, 1, 2)
+    assert 'Bark推送失败' in capsys.readouterr().out
+
+
+def test_messages_keep_their_order_per_receiver():
+    """单个发送线程时，每个接收人按 notify 的顺序收到"""
+    session = FakeSession(delay=0.002)
+    n = make_notifier(session, workers=1)
+    messages = [f'第{k}条' for k in range(30)]
+    for m in messages:
+        n.bark('标题', m)
+    n.close()
+    assert session.received('alice') == messages
+    assert session.received('bob') == messages
+
+
+def test_bark_returns_immediately_and_close_drains_the_queue():
+    session = FakeSession(delay=0.02)
+    n = make_notifier(session, workers=2)
+    start = time.perf_counter()
+    for k in range(20):
+        n.bark('标题', f'第{k}条')
+    # 检测循环不等网络请求
+    assert time.perf_counter() - start < 0.05
+    assert n.stats()['sent'] < 40
+
+    n.close()
+    stats = n.stats()
+    assert (stats['sent'], stats['failed']) == (40, 0)
+    assert (stats['bark_queue'], stats['in_flight']) == (0, 0)
+    assert sorted(session.received('alice')) == sorted(f'第{k}条' for k in range(20))
+    assert 0 < stats['avg_latency'] <= stats['max_latency']
+
+
+def test_disabled_bark_sends_nothing():
+    session = FakeSession()
+    for n in (make_notifier(session, enable_bark=False), make_notifier(session, urls=[])):
+        n.bark('标题', '内容')
+        n.close()
+        assert n.stats()['sent'] == 0
+    assert session.requests == []
+
+
+@pytest.fixture
+def fake_tts(monkeypatch):
+    """假的 pyttsx3: 每句话 20ms"""
+    said = []
+    engine = types.SimpleNamespace(setProperty=lambda *a: None, say=said.append,
+                                   runAndWait=lambda: time.sleep(0.02))
+    monkeypatch.setitem(sys.modules, 'pyttsx3', types.SimpleNamespace(init=lambda: engine))
+    return said
+
+
+def test_close_waits_for_speech(fake_tts):
+    n = make_notifier(FakeSession(), enable_tts=True, enable_bark=False)
+    for k in range(5):
+        n.speak(f'第{k}句')
+    n.close()
+    assert fake_tts == [f'第{k}句' for k in range(5)]
+    assert n.stats()['spoken'] == 5 and n.stats()['tts_queue'] == 0
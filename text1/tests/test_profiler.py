@@ -0,0 +1,51 @@
+# 文件名: tests/test_profiler.py
+# PhaseProfiler: 阶段内分配后又释放的临时内存也要记上；挂单撮合阶段记录扫描的挂单数
+import numpy as np
+import pandas as pd
+
+import backtest
+from profiler import PhaseProfiler
+
+
+def test_transient_allocations_are_counted():
+    prof = PhaseProfiler(allocations=True)
+    prof.begin('test')
+    for _ in range(20):
+        prof.mark()
+        tmp = bytearray(64 * 1024)      # 阶段内分配，阶段结束前释放
+        del tmp
+        prof.lap('alloc')
+        prof.lap('idle')
+    prof.end()
+    assert prof.alloc['alloc'] >= 20 * 60 * 1024
+    # 什么都不做的阶段不应该被计时本身的分配污染
+    assert prof.alloc.get('idle', 0) < 1024
+    assert prof.bars == 20
+
+
+def _frame(n=1500, seed=5):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.003, n)) * close
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2026-01-01', periods=n, freq='5min'),
+        'open': open_,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'close': close,
+        'volume': 1.0,
+    })
+
+
+def test_entry_phase_counts_pending_orders():
+    df = _frame()
+    pending = {}
+    for engine in ('loop', 'array'):
+        prof = PhaseProfiler()
+        trades, _, _ = backtest.run_backtest(df, engine=engine, verbose=False, profiler=prof)
+        pending[engine] = prof.scanned.get('entry', 0)
+        # 每笔成交都来自一张被撮合过的挂单
+        assert pending[engine] >= len(trades) > 0
+        assert prof.calls['entry'] == prof.bars
+    assert pending['loop'] == pending['array']
@@ -0,0 +1,47 @@
+# 文件名: tests/test_replay.py
+# run_replay: 回放信号要和“用实盘同样的策略/多空开关”的回测开单条件逐根一致
+import numpy as np
+import pandas as pd
+
+import replay
+from config import Config
+from sim_exchange import make_candles
+
+
+def write_csv(path, n=2000, seed=0):
+    """data_download.py 导出的 CSV 格式"""
+    c = make_candles(n, start='2026-01-01 00:00:00', price=90000.0, seed=seed)
+    df = pd.DataFrame(c, columns=['Timestamp', 'Open', 'High', 'Low', 'Close', 'Volume'])
+    df['Timestamp'] = df['Timestamp'].astype(np.int64)
+    df.insert(0, 'datetime', pd.to_datetime(df['Timestamp'], unit='ms').dt.strftime('%Y-%m-%d %H:%M:%S'))
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+def test_replay_matches_backtest_with_live_direction_flags(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'ENABLE_LONG', True)
+    monkeypatch.setattr(Config, 'ENABLE_SHORT', False)
+    csv_path = write_csv(tmp_path / 'btc_5m.csv')
+
+    stats, log, table = replay.run_replay(csv_path, '2026-01-03 00:00:00', '2026-01-04 00:00:00', trade=False)
+
+    assert stats['signals'] > 0
+    # 实盘只做多: 回测一侧也不能出现空单信号 (否则全部算成“只有回测”)
+    assert set(table['backtest'].dropna()) == {'long'}
+    assert (table['replay'] == table['backtest']).all()
+
+
+def test_replay_places_orders(tmp_path, monkeypatch):
+    """trade=True: 信号经 main.process_cycle -> BinanceDriver 下单，在模拟交易所成交，余额扣掉手续费"""
+    monkeypatch.setattr(Config, 'ENABLE_LONG', True)
+    monkeypatch.setattr(Config, 'ENABLE_SHORT', False)
+    csv_path = write_csv(tmp_path / 'btc_5m.csv')
+
+    stats, log, table = replay.run_replay(csv_path, '2026-01-03 00:00:00', '2026-01-04 00:00:00', trade=True)
+
+    assert stats['signals'] > 0
+    assert stats['orders'] == stats['signals']
+    assert log['filled'].all()
+    assert stats['balance'] < 10000.0
+    assert stats['errors'] == 0
+    assert stats['latency']['orders'] == stats['orders']
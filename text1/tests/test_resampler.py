@@ -0,0 +1,121 @@
+# 文件名: tests/test_resampler.py
+# 本地合成大周期: 分桶边界和交易所一致、缺K线时跳过、正在形成的K线随基础K线更新、
+# 增量 resample_into 与整段 resample_frame 结果一致
+import numpy as np
+import pandas as pd
+import pytest
+
+from candle_buffer import CandleBuffer
+from resampler import aggregate, can_derive, resample_frame, resample_into, timeframe_ms
+from sim_exchange import make_candles
+
+AGG = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+
+
+def frame(candles):
+    df = pd.DataFrame(candles, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'].astype(np.int64), unit='ms')
+    return df
+
+
+def pandas_resample(df, rule, **kwargs):
+    """pandas 的参照结果 (没有基础K线的空桶去掉)"""
+    out = df.set_index('timestamp').resample(rule, **kwargs).agg(AGG)
+    return out.dropna(subset=['open']).reset_index()
+
+
+@pytest.mark.parametrize('base, timeframe, rule, kwargs', [
+    ('5m', '15m', '15min', {'origin': 'epoch'}),
+    ('5m', '1h', '1h', {'origin': 'epoch'}),
+    ('1h', '4h', '4h', {'origin': 'epoch'}),       # 00/04/08... UTC
+    ('1h', '1d', '1D', {}),                        # UTC 00:00
+    ('1h', '1w', 'W-MON', {'closed': 'left', 'label': 'left'}),   # 周一 00:00
+])
+def test_buckets_align_to_exchange_boundaries(base, timeframe, rule, kwargs):
+    # 起点故意不在桶边界上 (周三 05:35)，中间再挖掉一段模拟缺失的K线
+    candles = make_candles(3000, start='2024-01-03 05:35:00' if base == '5m' else '2024-01-03 05:00:00',
+                           timeframe=base, seed=4)
+    candles = np.delete(candles, np.s_[1000:1037], axis=0)
+    df = frame(candles)
+    ours = resample_frame(df, timeframe)
+    expected = pandas_resample(df, rule, **kwargs)
+    pd.testing.assert_frame_equal(ours, expected, check_dtype=False, check_freq=False)
+
+    starts = ours['timestamp'].astype('datetime64[ms]').astype(np.int64).to_numpy()
+    if timeframe == '1w':
+        assert (ours['timestamp'].dt.dayofweek == 0).all()
+    else:
+        assert (starts % timeframe_ms(timeframe) == 0).all()
+    # 第一个桶不完整，起点仍在边界上 (早于第一根基础K线)
+    assert ours['timestamp'].iloc[0] <= df['timestamp'].iloc[0]
+
+
+def test_can_derive():
+    assert can_derive('5m', '15m') and can_derive('5m', '4h')
+    assert not can_derive('5m', '5m')
+    assert not can_derive('15m', '5m')
+    assert not can_derive('5m', '7m')              # 不是整数倍
+    assert not can_derive('1h', '1M')              # 月线长度不固定
+    assert not can_derive('5m', '1d')              # 288 根 > 缓冲区的一半
+    assert can_derive('5m', '1d', capacity=1000)
+
+
+def revisions(candle, steps=3):
+    """一根基础K线从开盘到收盘的几次推送 (最后一次就是收盘后的值)"""
+    ts, o, h, l, c, v = candle
+    for r in range(1, steps + 1):
+        f = r / steps
+        yield np.array([ts, o, o + (h - o) * f, o - (o - l) * f, o + (c - o) * f, v * f])
+
+
+@pytest.mark.parametrize('timeframe', ['15m', '1h'])
+def test_incremental_matches_full_resample_with_forming_bar(timeframe):
+    """
+    模拟实盘: 基础缓冲区 (滚动，早的K线会被挤出去) 每轮收到正在形成那根的新值或者新的一根，
+    按 data_manager 的方式从上一轮最后一根所在的桶开始增量合成。
+    每一步的目标缓冲区都要等于“到目前为止所有基础K线”整段合成的最后几根，包括正在形成的那根
+    """
+    candles = make_candles(700, start='2024-01-01 00:20:00', seed=9)
+    history = candles.copy()
+    base, target = CandleBuffer(100), CandleBuffer(40)
+    tf_ms = timeframe_ms(timeframe)
+
+    def expected(upto):
+        t, *cols = aggregate(history[:upto, 0], *history[:upto, 1:].T, tf_ms)
+        return np.asarray(t), np.vstack(cols)
+
+    # 启动: 基础周期拉 100 根，目标周期向交易所完整拉一次历史
+    base.extend(candles[:100])
+    t, cols = expected(100)
+    target.extend(np.column_stack([t, cols.T]))
+
+    for j in range(100, len(candles)):
+        for bar in revisions(candles[j]):
+            since = base.last_time
+            history[j] = bar
+            base.update(*bar)
+            resample_into(base, target, timeframe, since)
+
+            t, cols = expected(j + 1)
+            times, ohlcv = target.view()
+            n = len(times)
+            np.testing.assert_array_equal(times, t[-n:])
+            np.testing.assert_allclose(ohlcv, cols[:, -n:], rtol=1e-12)
+
+    # 最后一个桶是正在形成的: 收盘价就是最后一根基础K线的收盘价
+    assert target.view()[1][3, -1] == candles[-1, 4]
+    assert len(target) == target.capacity
+
+
+def test_since_none_keeps_buckets_older_than_the_base_buffer():
+    """基础缓冲区开头那个桶不完整时，保留目标缓冲区里原来的值"""
+    candles = make_candles(50, start='2024-01-01 00:05:00')
+    base = CandleBuffer(100)
+    base.extend(candles[1:])                       # 第一个 15m 桶缺了 00:05 这根
+    target = CandleBuffer(100)
+    target.update(candles[0, 0] - 5 * 60_000, -1, -1, -1, -1, -1)
+    resample_into(base, target, '15m')
+    times, ohlcv = target.view()
+    assert ohlcv[0, 0] == -1
+    np.testing.assert_array_equal(times, resample_frame(frame(candles), '15m')['timestamp']
+                                  .astype('datetime64[ms]').astype(np.int64))
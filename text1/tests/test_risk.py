@@ -0,0 +1,107 @@
+# 文件名: tests/test_risk.py
+# 蒙特卡洛风险分析: 向量化的资金复利与 run_backtest 开仓金额规则的逐笔标量版本一致
+import numpy as np
+import pytest
+
+import backtest
+import metrics
+import risk
+
+PARAM_SETS = [
+    {},                                                   # 默认: 按比例复利 + 封顶
+    {'MAX_OPEN_LIMIT': 3000},                             # 封顶很快生效
+    {'MAX_OPEN': False},                                  # 按比例复利，不封顶
+    {'MIX_UP': False},                                    # 固定金额
+    {'MIX_UP': False, 'MAX_OPEN_LIMIT': 300},             # 固定金额 + 封顶
+    {'MIX_UP': False, 'MAX_OPEN_LIMIT': 4},               # 封顶低于 5U: 一单都开不了
+    {'FIXED_MARGIN_RATE': 1.0},                           # 资金必须大于开仓金额: 一单都开不了
+    {'FIXED_MARGIN_RATE': 0.3, 'INITIAL_BALANCE': 50},    # 本金小，很快开不了单
+]
+
+
+def scalar_replay(returns, params):
+    """逐笔照搬 run_backtest 的开仓金额规则 (margin_to_use)，作为对照"""
+    p = backtest.get_params(**params)
+    balance = float(p['INITIAL_BALANCE'])
+    out = [balance]
+    for r in returns:
+        margin = balance * p['FIXED_MARGIN_RATE'] if p['MIX_UP'] else p['INITIAL_BALANCE']
+        if p['MAX_OPEN'] and p['MAX_OPEN_LIMIT'] > 0:
+            margin = min(margin, p['MAX_OPEN_LIMIT'])
+        if margin > 5 and balance > margin:
+            balance = max(balance + margin * r, 0.0)
+        out.append(balance)
+    return np.array(out)
+
+
+def sample_returns(paths, n, seed=0, scale=0.4):
+    rng = np.random.default_rng(seed)
+    r = rng.normal(0.02, scale, (paths, n))
+    r[rng.random((paths, n)) < 0.01] = -1.6     # 偶尔亏光保证金还多 (穿仓)
+    return r
+
+
+def as_trades(r):
+    trades = np.zeros(len(r), dtype=metrics.TRADE_DTYPE)
+    trades['margin'] = 100.0
+    trades['entry_fee'] = 0.5
+    trades['profit'] = r * 100.0 + 0.5
+    return trades
+
+
+@pytest.mark.parametrize('params', PARAM_SETS)
+def test_replay_equity_matches_scalar(params):
+    returns = sample_returns(40, 600)
+    p = backtest.get_params(**params)
+    equity = risk.replay_equity(returns, p)
+    assert equity.shape == (40, 601)
+    for path in range(len(returns)):
+        np.testing.assert_allclose(equity[path], scalar_replay(returns[path], params), rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize('params', PARAM_SETS)
+@pytest.mark.parametrize('method', ['shuffle', 'bootstrap', 'block'])
+def test_monte_carlo_matches_full_curves(params, method):
+    """monte_carlo 边走边记的统计 == 用同样的抽样生成整条资金曲线再计算"""
+    r = sample_returns(1, 300, seed=1, scale=0.3)[0]
+    res = risk.monte_carlo(as_trades(r), params, paths=500, method=method, block=7,
+                           ruin_level=0.5, batch=120, seed=3)
+    np.testing.assert_allclose(risk.trade_returns(as_trades(r)), r, rtol=1e-12)
+
+    p = backtest.get_params(**params)
+    rng = np.random.default_rng(3)
+    curves = np.vstack([risk.replay_equity(r[risk.resample_index(rng, 300, min(120, 500 - lo), method, 7)], p)
+                        for lo in range(0, 500, 120)])
+    dead_level = risk._margin_rule(p)[3]
+    np.testing.assert_allclose(res['final'], curves[:, -1], rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(res['max_drawdown'], risk.max_drawdown(curves), rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(res['ruined'], curves[:, 1:].min(axis=1) <= max(p['INITIAL_BALANCE'] * 0.5, dead_level))
+    np.testing.assert_allclose(res['actual'], scalar_replay(r, params), rtol=1e-9, atol=1e-9)
+
+
+def test_resample_index():
+    rng = np.random.default_rng(0)
+    n = 50
+    shuffle = risk.resample_index(rng, n, 200, 'shuffle')
+    assert shuffle.shape == (200, n)
+    assert (np.sort(shuffle, axis=1) == np.arange(n)).all()
+    assert len({tuple(row) for row in shuffle}) == 200
+
+    boot = risk.resample_index(rng, n, 200, 'bootstrap')
+    assert boot.shape == (200, n) and boot.min() >= 0 and boot.max() < n
+
+    blocks = risk.resample_index(rng, n, 200, 'block', block=8)
+    assert blocks.shape == (200, n) and blocks.max() < n
+    steps = np.diff(blocks, axis=1)
+    inside = np.arange(1, n) % 8 != 0          # 同一段内部序号连续
+    assert (steps[:, inside] == 1).all()
+
+    with pytest.raises(ValueError):
+        risk.resample_index(rng, n, 10, 'jackknife')
+
+
+def test_no_trades():
+    res = risk.monte_carlo([], paths=10)
+    assert res['trades'] == 0
+    assert (res['final'] == backtest.INITIAL_BALANCE).all()
+    assert not res['ruined'].any()
@@ -0,0 +1,150 @@
+# 文件名: tests/test_sim_exchange.py
+# 模拟交易所本身的规则: 限价单撮合 (与 run_backtest 一致)、限频、带种子的随机错误、now_ms 之后的数据不可见
+import ccxt
+import numpy as np
+import pandas as pd
+import pytest
+
+import sim_exchange
+from sim_exchange import SimExchange, make_candles, make_open_interest
+
+SYMBOL = 'BTC/USDT'
+TF_MS = 5 * 60 * 1000
+T0 = ccxt.Exchange.parse8601('2024-01-01 00:00:00')
+
+# 手工构造的 5m K线: [开, 高, 低, 收]
+BARS = [
+    (100.0, 101.0, 99.0, 100.0),
+    (100.0, 101.0, 99.0, 100.0),
+    (100.0, 100.5, 95.0, 100.0),    # 2: 挂单在这根中途下 -> 虽然最低价碰到 97 也不能成交
+    (99.0, 99.5, 96.5, 98.0),       # 3: 最低价碰到 97 -> 买单按挂单价 97 成交
+    (92.0, 93.0, 91.0, 92.0),       # 4: 跳空低开 92 <= 95 -> 买单按开盘价 92 成交
+    (100.0, 103.5, 99.0, 101.0),    # 5: 最高价碰到 103 -> 卖单按挂单价 103 成交
+    (106.0, 107.0, 105.0, 106.0),   # 6: 跳空高开 106 >= 104 -> 卖单按开盘价 106 成交
+    (106.0, 106.5, 105.5, 106.0),
+]
+
+
+def manual_candles():
+    ts = T0 + np.arange(len(BARS), dtype=np.int64) * TF_MS
+    return np.column_stack([ts, np.array(BARS), np.ones(len(BARS))])
+
+
+def bar_open(k):
+    return T0 + k * TF_MS
+
+
+def test_limit_fill_rule_touch_gap_and_next_bar():
+    ex = SimExchange({SYMBOL: manual_candles()}, now_ms=bar_open(2) + TF_MS // 2,
+                     fee_rate=0.0, leverage=10)
+    touch_buy = ex.create_order(SYMBOL, 'limit', 'buy', 2, 97.0)
+    gap_buy = ex.create_order(SYMBOL, 'limit', 'buy', 2, 95.0)
+    touch_sell = ex.create_order(SYMBOL, 'limit', 'sell', 2, 103.0)
+    gap_sell = ex.create_order(SYMBOL, 'limit', 'sell', 2, 104.0)
+
+    def status(order):
+        o = ex.fetch_order(order['id'])
+        return o['status'], o['average']
+
+    # 下单所在的K线 (2) 收盘: 它的最低价 95 已经低于两个买单价，但撮合从下一根才开始
+    ex.now_ms = bar_open(3)
+    assert status(touch_buy) == ('open', None)
+    assert status(gap_buy) == ('open', None)
+
+    ex.now_ms = bar_open(4)
+    assert status(touch_buy) == ('closed', 97.0)        # 碰到 -> 挂单价
+    assert status(gap_buy) == ('open', None)
+
+    ex.now_ms = bar_open(5)
+    assert status(gap_buy) == ('closed', 92.0)          # 跳空 -> 开盘价
+
+    ex.now_ms = bar_open(6)
+    assert status(touch_sell) == ('closed', 103.0)
+    assert status(gap_sell) == ('open', None)
+
+    ex.now_ms = bar_open(7)
+    assert status(gap_sell) == ('closed', 106.0)
+    assert ex.fetch_open_orders(SYMBOL) == []
+
+
+def test_limit_order_at_bar_boundary_matches_that_bar():
+    """正好在K线开盘时下单: 这根K线还没发生，就是“下一根”"""
+    ex = SimExchange({SYMBOL: manual_candles()}, now_ms=bar_open(3), fee_rate=0.0, leverage=10)
+    order = ex.create_order(SYMBOL, 'limit', 'buy', 2, 97.0)
+    ex.now_ms = bar_open(4)
+    assert ex.fetch_order(order['id'])['average'] == 97.0
+
+
+def test_rate_limit_without_throttle_returns_429():
+    ex = SimExchange({SYMBOL: make_candles(100)}, rate_limit=3, enableRateLimit=False)
+    for _ in range(3):
+        ex.fetch_ohlcv(SYMBOL, '5m', limit=5)
+    with pytest.raises(ccxt.RateLimitExceeded, match='429'):
+        ex.fetch_ohlcv(SYMBOL, '5m', limit=5)
+    assert ex.request_count == 4
+
+
+def test_rate_limit_with_throttle_waits(monkeypatch):
+    waits = []
+    monkeypatch.setattr(sim_exchange.time, 'sleep', waits.append)
+    ex = SimExchange({SYMBOL: make_candles(100)}, rate_limit=3, enableRateLimit=True)
+    for _ in range(4):
+        ex.fetch_ohlcv(SYMBOL, '5m', limit=5)
+    # 前 3 次不等待，第 4 次要等到第 1 次请求满 1 秒
+    assert len(waits) == 1
+    assert waits[0] == pytest.approx(1.0, abs=0.05)
+
+
+def _failures(seed, calls=60):
+    ex = SimExchange({SYMBOL: make_candles(100)}, error_rate=0.3, seed=seed)
+    out = []
+    for _ in range(calls):
+        try:
+            ex.fetch_ohlcv(SYMBOL, '5m', limit=5)
+            out.append(False)
+        except ccxt.NetworkError:
+            out.append(True)
+    return out
+
+
+def test_seeded_error_rate_is_reproducible():
+    first = _failures(seed=7)
+    assert first == _failures(seed=7)
+    assert 0 < sum(first) < len(first)
+    assert first != _failures(seed=8)
+
+
+def test_now_ms_hides_future_bars():
+    candles = make_candles(50)
+    oi = make_open_interest(candles)
+    now = int(candles[20, 0]) + TF_MS // 2            # 第 20 根K线的中途
+    ex = SimExchange({SYMBOL: candles}, now_ms=now, open_interest={SYMBOL: oi})
+
+    bars = ex.fetch_ohlcv(SYMBOL, '5m', since=int(candles[0, 0]), limit=500)
+    assert len(bars) == 21
+    assert bars[-1][0] == int(candles[20, 0])
+    # 没有更小周期的数据时，正在形成的K线只知道开盘价
+    o = candles[20, 1]
+    assert bars[-1][1:] == [o, o, o, o, 0.0]
+    np.testing.assert_allclose(np.array(bars[:-1]), candles[:20])
+
+    assert ex.fetch_ohlcv(SYMBOL, '5m', since=int(candles[21, 0])) == []
+    assert ex.fetch_ticker(SYMBOL)['last'] == o
+    history = ex.fetch_open_interest_history(SYMBOL, '5m', since=int(candles[0, 0]), limit=500)
+    assert history[-1]['timestamp'] == int(candles[20, 0])
+
+
+def test_forming_bar_uses_only_closed_finer_bars():
+    one_min = make_candles(60, timeframe='1m', seed=3)
+    df = pd.DataFrame(one_min, columns=['ts', 'open', 'high', 'low', 'close', 'volume'])
+    group = df['ts'] // TF_MS
+    five_min = df.groupby(group).agg({'ts': 'first', 'open': 'first', 'high': 'max', 'low': 'min',
+                                      'close': 'last', 'volume': 'sum'}).to_numpy()
+    now = int(one_min[12, 0]) + 30_000                # 第 3 根 5m 开盘后 2.5 分钟: 收盘的 1m 只有 10、11
+    ex = SimExchange({SYMBOL: {'1m': one_min, '5m': five_min}}, now_ms=now)
+
+    forming = ex.fetch_ohlcv(SYMBOL, '5m', limit=1)[-1]
+    part = one_min[10:12]
+    assert forming == [int(five_min[2, 0]), part[0, 1], part[:, 2].max(), part[:, 3].min(),
+                       part[-1, 4], pytest.approx(part[:, 5].sum())]
+    assert ex.fetch_ohlcv(SYMBOL, '1m', limit=500)[-1][0] == int(one_min[12, 0])
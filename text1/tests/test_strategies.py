@@ -0,0 +1,54 @@
+# 文件名: tests/test_strategies.py
+# 同一个策略的两种用法要给出同样的信号: 回测的 signals() (整段向量化) 和实盘的 latest() (逐根增量)
+import numpy as np
+import pandas as pd
+import pytest
+
+import strategies
+from sim_exchange import make_candles
+
+
+def candles_frame(n, seed):
+    c = make_candles(n, seed=seed)
+    return pd.DataFrame({'timestamp': pd.to_datetime(c[:, 0].astype(np.int64), unit='ms'), 'close': c[:, 4]})
+
+
+def incremental(strategy, df, enable_long, enable_short):
+    """按实盘的方式逐根喂已收盘K线: 第 i 根的信号只看前 i 根"""
+    feed = strategy.new_feed()
+    times, closes = df['timestamp'].to_numpy(), df['close'].to_numpy()
+    out = np.zeros(len(df), dtype=np.int8)
+    for i in range(1, len(df)):
+        out[i] = strategy.latest(feed, times[:i], closes[:i], enable_long, enable_short)
+    return out
+
+
+@pytest.mark.parametrize('name, kwargs', [
+    ('ma_stack', {}),
+    ('ma_cross', {}),
+    ('ma_cross', {'fast': 5, 'slow': 20}),     # 周期短，交叉多
+])
+@pytest.mark.parametrize('enable_long, enable_short', [(True, True), (True, False), (False, True)])
+def test_vectorised_signals_match_incremental(name, kwargs, enable_long, enable_short):
+    strategy = strategies.create(name, **kwargs)
+    df = candles_frame(1200, seed=3)
+    vectorised = strategy.signals(df, enable_long, enable_short)
+    live = incremental(strategy, df, enable_long, enable_short)
+
+    np.testing.assert_array_equal(vectorised, live)
+    # 确认比较的不是一串 0
+    if enable_long:
+        assert (vectorised == strategies.LONG).any()
+    if enable_short:
+        assert (vectorised == strategies.SHORT).any()
+    assert not vectorised[:strategy.warmup].any()
+
+
+def test_precomputed_columns_are_used():
+    """DataFrame 里已有同名均线列 (add_ma_columns 算好的) 时结果不变"""
+    strategy = strategies.create('ma_stack')
+    df = candles_frame(600, seed=5)
+    plain = strategy.signals(df)
+    for name, line in strategy.lines(df).items():
+        df[name] = line
+    np.testing.assert_array_equal(strategy.signals(df), plain)
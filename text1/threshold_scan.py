@@ -0,0 +1,168 @@
+# 文件名: threshold_scan.py
+# 均线偏离阈值敏感度测试 (2025/threshold_stats.txt、2020-2026/threshold_stats.txt 的生成脚本)
+#
+# 统计: 阳线 (收盘 > 开盘) 中 价格 > MA × 阈值 的比例，阴线 (收盘 < 开盘) 中 价格 < MA × 阈值 的比例。
+# 每根K线的 价格 / MA 比值只算一次并排序，之后任意多个阈值的触发次数都用一次
+# np.searchsorted 得到，不需要每个阈值重新扫一遍数据。
+# 支持任意 MA 周期，也可以把 5m 数据合成为更大的周期 (15m / 1h / 4h ...) 再统计。
+import os
+
+import numpy as np
+import pandas as pd
+
+import backtest
+from resampler import resample_frame, timeframe_ms
+
+# 默认阈值: 阳线 1.030 ~ 1.050，阴线 0.970 ~ 0.950，步长 0.001
+BULL_THRESHOLDS = np.round(np.arange(1.030, 1.0505, 0.001), 3)
+BEAR_THRESHOLDS = np.round(2 - BULL_THRESHOLDS, 3)
+
+
+def deviation_samples(df, period=373, price='close', start_time=None, end_time=None):
+    """
+    计算每根K线的 价格 / MA 比值，按阳线/阴线分开排序
+    df 需要包含统计区间之前至少 period 根K线 (均线预热)，统计只算 [start_time, end_time] 内的K线
+    price: 和均线比较的价格 'close' (默认) / 'high' / 'low'；
+           也可以传 'extreme' = 阳线用最高价、阴线用最低价
+    返回 {'bull': 升序比值, 'bear': 升序比值, 'bull_total': 阳线总数, 'bear_total': 阴线总数}
+    """
+    close = df['close'].to_numpy(dtype=np.float64)
+    open_ = df['open'].to_numpy(dtype=np.float64)
+    ma = pd.Series(close).rolling(period).mean().to_numpy()
+
+    in_range = np.ones(len(df), dtype=bool)
+    times = df['timestamp']
+    if start_time is not None:
+        in_range &= (times >= pd.to_datetime(start_time)).to_numpy()
+    if end_time is not None:
+        in_range &= (times <= pd.to_datetime(end_time)).to_numpy()
+
+    bull = in_range & (close > open_)
+    bear = in_range & (close < open_)
+    if price == 'extreme':
+        bull_price, bear_price = df['high'].to_numpy(dtype=np.float64), df['low'].to_numpy(dtype=np.float64)
+    else:
+        bull_price = bear_price = df[price].to_numpy(dtype=np.float64)
+
+    with np.errstate(invalid='ignore'):
+        bull_ratio = bull_price[bull] / ma[bull]
+        bear_ratio = bear_price[bear] / ma[bear]
+    # 均线还没算出来的K线 (NaN) 计入总样本，但不会触发任何阈值
+    return {
+        'bull': np.sort(bull_ratio[~np.isnan(bull_ratio)]),
+        'bear': np.sort(bear_ratio[~np.isnan(bear_ratio)]),
+        'bull_total': int(bull.sum()),
+        'bear_total': int(bear.sum()),
+    }
+
+
+def trigger_counts(sorted_ratios, thresholds, above=True):
+    """
+    一次 searchsorted 得到所有阈值的触发次数
+    above=True:  比值 > 阈值 的个数 (阳线)
+    above=False: 比值 < 阈值 的个数 (阴线)
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    if above:
+        return len(sorted_ratios) - np.searchsorted(sorted_ratios, thresholds, side='right')
+    return np.searchsorted(sorted_ratios, thresholds, side='left')
+
+
+def scan(samples, bull_thresholds=BULL_THRESHOLDS, bear_thresholds=BEAR_THRESHOLDS):
+    """返回统计表 DataFrame: type ('阳线'/'阴线') / threshold / count / pct"""
+    rows = []
+    for label, key, thresholds, above in (('阳线', 'bull', bull_thresholds, True),
+                                          ('阴线', 'bear', bear_thresholds, False)):
+        counts = trigger_counts(samples[key], thresholds, above)
+        total = samples[f'{key}_total']
+        pct = counts / total * 100 if total else np.zeros(len(counts))
+        rows.append(pd.DataFrame({'type': label, 'threshold': thresholds, 'count': counts, 'pct': pct}))
+    return pd.concat(rows, ignore_index=True)
+
+
+def format_report(table, samples, period, start_time, end_time, timeframe='5m'):
+    """生成与 threshold_stats.txt 相同格式的文本"""
+    lines = [
+        "=== 阈值敏感度测试报告 ===",
+        f"时间范围: {start_time} ~ {end_time}",
+    ]
+    if timeframe != '5m':
+        lines.append(f"K线周期: {timeframe}")
+    lines += [
+        f"MA周期: {period}",
+        f"阳线总样本: {samples['bull_total']} | 阴线总样本: {samples['bear_total']}",
+        "",
+        "-" * 50,
+        f"{'类型':<6} | {'阈值(倍数)':<10} | {'触发次数':<8} | {'触发概率(%)':<10}",
+        "-" * 50,
+    ]
+    for i, label in enumerate(('阳线', '阴线')):
+        if i > 0:
+            lines.append("-" * 50)
+        for _, r in table[table['type'] == label].iterrows():
+            lines.append(f"{label:<6} | {r['threshold']:<10.3f} | {int(r['count']):<8} | {r['pct']:<10.2f}%")
+    return "\n".join(lines) + "\n"
+
+
+def plot_chart(table, period, path):
+    """上下两张柱状图 (阳线绿 / 阴线红)，与 threshold_chart.png 相同"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(2, 1, figsize=(14, 8))
+    for ax, label, color, title in (
+            (axes[0], '阳线', 'green', f"Bullish Candles > MA{period} * Threshold (Probability)"),
+            (axes[1], '阴线', 'red', f"Bearish Candles < MA{period} * Threshold (Probability)")):
+        part = table[table['type'] == label]
+        names = [f"{t:g}" for t in part['threshold']]
+        bars = ax.bar(names, part['pct'], color=color, alpha=0.7)
+        for bar, pct in zip(bars, part['pct']):
+            ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), f"{pct:.2f}%",
+                    ha='center', va='bottom', fontsize=9)
+        ax.set_title(title)
+        ax.set_ylabel('Probability (%)')
+        ax.grid(axis='y', linestyle='--', alpha=0.5)
+    axes[1].set_xlabel('Threshold Multiplier')
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def run_threshold_scan(csv_path, start_time, end_time, period=373, timeframe='5m', price='close',
+                       bull_thresholds=BULL_THRESHOLDS, bear_thresholds=BEAR_THRESHOLDS, out_dir=None):
+    """
+    读取本地K线 (CSV 或 .store)，输出 threshold_stats.txt 和 threshold_chart.png
+    timeframe: 统计用的K线周期；数据是 5m 时会先合成为这个周期
+    out_dir:   输出目录，不传则只返回结果不写文件
+    返回 (统计表, 报告文本)
+    """
+    # 往前多读 period 根K线给均线预热
+    bar = pd.Timedelta(milliseconds=timeframe_ms(timeframe))
+    warmup_start = pd.to_datetime(start_time) - bar * period
+    df = backtest.load_from_csv(csv_path, str(warmup_start), end_time)
+    if df.empty:
+        return pd.DataFrame(), ''
+    if timeframe != '5m':
+        df = resample_frame(df, timeframe)
+
+    samples = deviation_samples(df, period, price, start_time, end_time)
+    table = scan(samples, bull_thresholds, bear_thresholds)
+    report = format_report(table, samples, period, start_time, end_time, timeframe)
+
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, 'threshold_stats.txt'), 'w', encoding='utf-8') as f:
+            f.write(report)
+        plot_chart(table, period, os.path.join(out_dir, 'threshold_chart.png'))
+        print(f"✅ 已保存: {out_dir}")
+    return table, report
+
+
+if __name__ == "__main__":
+    CSV_PATH = r"F:\BIANRobot\text1\FUTURES_BTCUSDT_5m_2020.csv"
+
+    table, report = run_threshold_scan(CSV_PATH, '2025-01-01 00:00:00', '2026-01-01 00:00:00',
+                                       period=373, out_dir=r"F:\BIANRobot\text1\2025")
+    print(report)
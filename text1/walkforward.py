@@ -0,0 +1,210 @@
+# 文件名: walkforward.py
+# 滚动窗口 (Walk-Forward) 参数优化
+#
+# 参数设置.txt 里的数字都是在同一段时间上挑出来的最优值，看不出参数换一段行情还灵不灵。
+# 这里把数据切成一段段「训练窗口 + 紧跟着的测试窗口」，向前滚动:
+#   1. 每个训练窗口上跑完整个参数网格，挑出最好的一组
+#   2. 用这组参数去跑它后面的测试窗口 (样本外，挑参数时没见过这段数据)
+#   3. 把所有测试窗口的资金曲线按比例接起来，就是“一直用这种方法选参数”的真实表现
+#
+# 数据只读取一次、均线只算一次；所有 (窗口, 参数) 组合一起丢进进程池并行跑。
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import indicators
+from sweep import expand_grid
+
+# 回测引擎前面要留出的预热K线数 (与 run_backtest 的 start_index 一致)
+WARMUP = 375
+
+# 每个工作进程各持有一份数据 (进程启动时传入一次，之后每个窗口都只是切片)
+_WORKER_DF = None
+
+
+def _init_worker(df):
+    global _WORKER_DF
+    _WORKER_DF = df
+
+
+def _run_slice(task):
+    """
+    在工作进程里跑一段数据
+    task: (窗口编号, 起始行, 结束行, 参数字典, 是否回传资金曲线)
+    起始行是要统计的第一根K线，前面 WARMUP 根只用来让引擎的起点对齐
+    """
+    window, lo, hi, params, keep_equity = task
+    df = _WORKER_DF.iloc[max(lo - WARMUP, 0):hi]
+    trades, equity, final_reserve = backtest.run_backtest(df, params=params, verbose=False)
+    stats = backtest.summarize(trades, equity, final_reserve, params)
+    row = {
+        'window': window,
+        'total_return': stats['profit_rate'],
+        'peak_return': stats['peak_profit_rate'],
+        'win_rate': stats['win_rate'],
+        'trades': stats['total_trades'],
+    }
+    if keep_equity:
+        row['equity'] = np.asarray(equity, dtype=np.float64)
+    return row
+
+
+def make_windows(times, train_days, test_days, step_days=None):
+    """
+    按天数切出滚动窗口 (训练段和测试段紧挨着，不重叠)
+    times: 每根K线的时间 (升序)
+    step_days: 每次向前滚动的天数，默认等于 test_days (测试段首尾相接)
+    返回列表，每项是 {'train': (起始行, 结束行), 'test': (起始行, 结束行)}，结束行不包含
+    """
+    times = pd.DatetimeIndex(times)
+    step = pd.Timedelta(days=step_days or test_days)
+    train_len = pd.Timedelta(days=train_days)
+    test_len = pd.Timedelta(days=test_days)
+
+    # 第一段训练从预热结束后开始，保证每个窗口的均线都是完整的
+    if len(times) <= WARMUP + 1:
+        return []
+    bar = times[1] - times[0]
+    t = times[WARMUP]
+    windows = []
+    while t + train_len + test_len <= times[-1] + bar:
+        a, b, c = np.searchsorted(times, [t, t + train_len, t + train_len + test_len])
+        if b > a and c > b:
+            windows.append({'train': (int(a), int(b)), 'test': (int(b), int(c))})
+        t += step
+    return windows
+
+
+def stitch_equity(segments, start_value):
+    """
+    把各测试窗口的资金曲线首尾相接 (每段都从 INITIAL_BALANCE 起步)
+    后一段按前一段的期末资金等比例放大，相当于一直复利滚下去
+    """
+    out = []
+    value = start_value
+    for curve in segments:
+        if len(curve) == 0:
+            continue
+        scaled = curve * (value / start_value)
+        out.append(scaled)
+        value = scaled[-1]
+    return np.concatenate(out) if out else np.empty(0)
+
+
+def run_walk_forward(csv_path, grid, base=None, train_days=90, test_days=30, step_days=None,
+                     start_time=None, end_time=None, processes=None, sort_by='total_return'):
+    """
+    滚动优化 + 样本外检验
+    返回 (每个窗口的结果 DataFrame, 拼接后的样本外资金曲线 Series)
+    """
+    df = backtest.load_from_csv(csv_path, start_time, end_time)
+    if df.empty:
+        return pd.DataFrame(), pd.Series(dtype=float)
+
+    # 均线在整段数据上算一次，各窗口切片直接复用
+    indicators.add_ma_columns(df, (31, 128, 373))
+
+    times = pd.DatetimeIndex(df['timestamp'])
+    windows = make_windows(times, train_days, test_days, step_days)
+    if not windows:
+        print(f"❌ 数据太短，切不出 {train_days} 天训练 + {test_days} 天测试的窗口")
+        return pd.DataFrame(), pd.Series(dtype=float)
+
+    combos = expand_grid(grid, base)
+    processes = processes or os.cpu_count() or 1
+    print(f"🚶 滚动优化: {len(windows)} 个窗口 × {len(combos)} 组参数 | "
+          f"训练 {train_days} 天 / 测试 {test_days} 天 | {processes} 个进程")
+
+    t0 = time.time()
+    with Pool(processes=processes, initializer=_init_worker, initargs=(df,)) as pool:
+        # 1. 所有窗口的训练段 × 参数网格一起并行
+        train_tasks = [(w, *win['train'], params, False) for w, win in enumerate(windows) for params in combos]
+        train_rows = pool.map(_run_slice, train_tasks, chunksize=max(1, len(train_tasks) // (processes * 4)))
+
+        # 2. 每个窗口挑出训练段最好的参数
+        best = {}
+        for (w, _, _, params, _), row in zip(train_tasks, train_rows):
+            if w not in best or row[sort_by] > best[w][1][sort_by]:
+                best[w] = (params, row)
+
+        # 3. 用挑出来的参数并行跑各自的测试段 (样本外)
+        test_tasks = [(w, *windows[w]['test'], best[w][0], True) for w in range(len(windows))]
+        test_rows = pool.map(_run_slice, test_tasks)
+    print(f"✅ 滚动优化完成，用时 {time.time() - t0:.1f} 秒")
+
+    rows = []
+    for w, win in enumerate(windows):
+        params, train = best[w]
+        test = test_rows[w]
+        row = {
+            'train_start': times[win['train'][0]], 'test_start': times[win['test'][0]],
+            'test_end': times[win['test'][1] - 1],
+        }
+        row.update({name: params[name] for name in grid})
+        row.update({
+            'train_return': train['total_return'], 'train_win_rate': train['win_rate'],
+            'test_return': test['total_return'], 'test_win_rate': test['win_rate'],
+            'test_trades': test['trades'],
+        })
+        rows.append(row)
+    result = pd.DataFrame(rows)
+
+    # 样本外资金曲线: 每个测试段的权益从该段第一根K线开始
+    start_value = backtest.get_params(**(base or {}))['INITIAL_BALANCE']
+    segments, index = [], []
+    for w, win in enumerate(windows):
+        curve = test_rows[w]['equity']
+        hi = win['test'][1]
+        segments.append(curve)
+        index.append(times[hi - len(curve):hi])
+    stitched = pd.Series(stitch_equity(segments, start_value),
+                         index=index[0].append(index[1:]) if index else None)
+    return result, stitched
+
+
+def print_walk_forward(result, stitched, grid, base=None):
+    """打印每个窗口选出的参数、训练/测试收益，以及拼接后的样本外总收益"""
+    cols = ['test_start', 'test_end'] + list(grid.keys()) + \
+           ['train_return', 'test_return', 'test_win_rate', 'test_trades']
+    print("\n" + "=" * 80)
+    print("🚶 滚动优化结果 (收益单位 %，测试段为样本外)")
+    print("=" * 80)
+    print(result[cols].to_string(float_format=lambda v: f"{v:.4f}"))
+
+    if len(stitched) > 0:
+        start_value = backtest.get_params(**(base or {}))['INITIAL_BALANCE']
+        oos_return = (stitched.iloc[-1] / start_value - 1) * 100
+        peak = stitched.cummax()
+        max_dd = ((stitched - peak) / peak).min() * 100
+        positive = (result['test_return'] > 0).mean() * 100
+        print("-" * 80)
+        print(f"📈 样本外拼接收益: {oos_return:.2f}% | 最大回撤: {max_dd:.2f}% | "
+              f"盈利窗口占比: {positive:.0f}%")
+        print(f"📊 训练段平均收益 {result['train_return'].mean():.2f}% vs 测试段平均收益 {result['test_return'].mean():.2f}%")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    CSV_PATH = r"F:\BIANRobot\text1\FUTURES_BTCUSDT_5m_2020.csv"
+
+    GRID = {
+        'TP_PERCENT_LONG':   [0.007, 0.0072, 0.0075],
+        'SL_PERCENT_LONG':   [0.009, 0.0093],
+        'TP_PERCENT_SHORT':  [0.007, 0.0075],
+        'SL_PERCENT_SHORT':  [0.009, 0.0093],
+        'FIXED_MARGIN_RATE': [0.5, 0.7],
+    }
+    BASE = {'LEVERAGE': 10}
+
+    result, stitched = run_walk_forward(CSV_PATH, GRID, BASE, train_days=90, test_days=30,
+                                        start_time='2023-01-01 00:00:00', end_time='2026-01-01 00:00:00')
+    if not result.empty:
+        print_walk_forward(result, stitched, GRID, BASE)
+        save_path = f"walkforward_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        result.to_csv(save_path, index=False)
+        stitched.to_csv(save_path.replace('.csv', '_equity.csv'), header=['equity'])
+        print(f"💾 窗口结果已保存: {save_path}")